@@ -1,10 +1,16 @@
 # accounts/views.py
+from django.http import Http404
 from django.shortcuts import render, redirect
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
+from django.conf import settings
+from books import analytics # Seller sales rollups
+from books import reading # Cached reading progress for "continue reading"
 from books.models import Book, Order # Import Book and Order models
+from books.pagination import InvalidCursor, order_page # Cursor pagination for the sales list
+from bookstore.db_routers import replica_reads
+from bookstore.instrumentation import query_budget
 from django.contrib import messages
 from django.utils import timezone
 # Removed timedelta as it's no longer needed for borrow expiry calculation
@@ -22,6 +28,7 @@ def signup_view(request):
     return render(request, 'accounts/signup.html', {'form': form})
 
 
+@query_budget(8)
 @login_required
 def user_dashboard(request):
     user = request.user
@@ -29,41 +36,60 @@ def user_dashboard(request):
     # 1. Get books uploaded by the user
     uploaded_books = Book.objects.filter(owner=user).order_by('-uploaded_at')
 
-    # 2. Get relevant orders for the user's uploaded books (purchases by others)
+    # 2. Get one page of the orders for the user's uploaded books (purchases by others)
     # We want orders where the book's owner is the current user AND the order is a paid purchase.
-    relevant_orders = Order.objects.filter(
+    page_size = getattr(settings, 'DASHBOARD_ORDERS_PAGE_SIZE', 25)
+    cursor = request.GET.get('cursor')
+    orders = Order.objects.filter(
         book__owner=user,             # Filter for books owned by the current user
         order_type='purchase',        # Only include purchase orders
         status='paid'                 # Only include paid orders
     ).exclude(
         user=user                     # Exclude orders where the owner bought their own book
-    ).select_related('user', 'book').order_by('-created_at') # Optimize queries and order
-
-    # 3. Calculate total earnings from successful purchases of the user's books
-    # Earnings now only come from PURCHASE orders ('paid') on THEIR books.
-
-    total_earnings = Order.objects.filter(
-        book__owner=user,
-        order_type='purchase',
-        status='paid'
-    ).aggregate(sum_amount=Sum('amount'))['sum_amount'] or 0
-
-    # Removed calculation and passing of total_borrow_earnings
+    ).select_related('user', 'book')
+    try:
+        # Keyset pagination on (created_at, id): older pages cost the same as the first
+        relevant_orders, next_cursor = order_page(orders, cursor=cursor, page_size=page_size)
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+
+    # 3. Total earnings, the earnings chart and top books come from the daily
+    # sales rollups (books/analytics.py), not from aggregating every order
+    total_earnings, total_sales = analytics.totals(user)
+    chart_days = getattr(settings, 'DASHBOARD_CHART_DAYS', 30)
+    earnings_series = analytics.earnings_by_day(user, chart_days)
+    top_books = analytics.top_books(user, limit=5)
+
+    # Bar heights as a percentage of the largest value, for the CSS charts
+    peak = max((revenue for _, revenue, _ in earnings_series), default=0) or 1
+    earnings_chart = [
+        {'day': day, 'revenue': revenue, 'units': units, 'height': round(revenue * 100 / peak)}
+        for day, revenue, units in earnings_series
+    ]
+    top_peak = top_books[0]['revenue'] if top_books else 1
+    for book in top_books:
+        book['width'] = round(book['revenue'] * 100 / top_peak)
 
     context = {
         'uploaded_books': uploaded_books,
         'relevant_orders': relevant_orders,
+        'next_cursor': next_cursor, # Cursor for the "Older" link, None on the last page
+        'is_first_page': not cursor,
         'total_earnings': total_earnings,
+        'total_sales': total_sales,
+        'chart_days': chart_days,
+        'chart_earnings': sum(revenue for _, revenue, _ in earnings_series),
+        'earnings_chart': earnings_chart,
+        'top_books': top_books,
         'user': user,
-        # Removed 'total_purchase_earnings' and 'total_borrow_earnings' if you only need the total
-        # If you need to display purchase earnings separately on the dashboard, you can keep total_earnings
-        # and rename it to total_purchase_earnings, as they are now the same.
     }
 
     # Assuming you have a template for the user dashboard, e.g., 'accounts/dashboard.html'
     return render(request, 'accounts/dashboard.html', context)
 
 
+@query_budget(4)
+@replica_reads
 @login_required
 def user_profile_view(request):
     """
@@ -73,11 +99,16 @@ def user_profile_view(request):
     user = request.user
 
     # Get all purchased orders for the user
-    purchased_orders = Order.objects.filter(
+    purchased_orders = list(Order.objects.filter(
         user=user,
         order_type='purchase',
         status='paid'
-    ).select_related('book').order_by('-paid_at') # Order by purchase date
+    ).select_related('book').order_by('-paid_at')) # Order by purchase date
+
+    # "Continue reading": saved pages for all the books at once (cache, then at most one query)
+    progress = reading.get_progress(user.id, [order.book_id for order in purchased_orders])
+    for order in purchased_orders:
+        order.reading_page = progress.get(order.book_id)
 
     # Removed fetching of borrowed orders
 
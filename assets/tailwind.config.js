@@ -0,0 +1,21 @@
+// assets/tailwind.config.js
+// Theme for `manage.py build_assets`. The content globs come from the command
+// (our templates and scripts). Keep the theme in sync with the CDN fallback in
+// books/templates/books/asset_head.html.
+module.exports = {
+    theme: {
+        extend: {
+            fontFamily: {
+                'serif': ['"Playfair Display"', 'serif'],
+                'sans': ['Lato', 'sans-serif'],
+            },
+            colors: {
+                'gold': '#D4AF37',
+                'gold-light': '#F5EBC9',
+                'navy': '#0A1128',
+                'slate': '#1E293B',
+                'cream': '#FEF8EC',
+            },
+        },
+    },
+};
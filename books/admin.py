@@ -1,7 +1,14 @@
 # books/admin.py
 from django.contrib import admin
-from .models import Book, Order, Review # Import Review
+from .models import Book, BookDailySales, Bookmark, BookProcessingJob, Category, Order, PaymentEvent, ReadingProgress, Review, SellerDailySales # Import Review
 
 admin.site.register(Book)
 admin.site.register(Order)
-admin.site.register(Review) # Register the Review model
\ No newline at end of file
+admin.site.register(Review) # Register the Review model
+admin.site.register(BookProcessingJob)
+admin.site.register(PaymentEvent)
+admin.site.register(Category)
+admin.site.register(SellerDailySales)
+admin.site.register(BookDailySales)
+admin.site.register(ReadingProgress)
+admin.site.register(Bookmark)
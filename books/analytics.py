@@ -0,0 +1,136 @@
+# books/analytics.py
+"""
+Seller sales analytics read from daily rollups instead of the orders table.
+
+SellerDailySales and BookDailySales hold revenue and units per seller/book
+and day. record_sale() adds one paid purchase to both, in the transaction
+that marks the order paid (see books/payments.py), so the dashboard's
+totals, charts and top books cost a handful of small indexed reads however
+many orders a seller has. rebuild() recomputes the rollups from the orders
+(the backfill_sales_rollups command), e.g. for historical orders or after
+orders were edited by hand in the admin.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import BookDailySales, Order, SellerDailySales
+
+# Rows written per INSERT by rebuild()
+BATCH_SIZE = 1000
+
+
+def sale_day(order):
+    # Orders paid before paid_at existed fall back to their creation time
+    return timezone.localdate(order.paid_at or order.created_at)
+
+
+def _add(model, lookup, revenue, units):
+    # UPDATE first: after a bucket's first sale this is the only statement
+    if model.objects.filter(**lookup).update(revenue=F('revenue') + revenue, units=F('units') + units):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, revenue=revenue, units=units)
+    except IntegrityError:
+        # A concurrent sale created the bucket first
+        model.objects.filter(**lookup).update(revenue=F('revenue') + revenue, units=F('units') + units)
+
+
+def record_sale(order):
+    """
+    Adds a paid purchase to its seller's and book's rollups for the day it was paid.
+    Call it once per order, when the order turns paid.
+    """
+    day = sale_day(order)
+    seller_id = order.book.owner_id
+    _add(SellerDailySales, {'seller_id': seller_id, 'day': day}, order.amount, 1)
+    _add(BookDailySales, {'book_id': order.book_id, 'seller_id': seller_id, 'day': day}, order.amount, 1)
+
+
+def rebuild(seller_ids=None):
+    """
+    Recomputes the rollups from paid purchases, for all sellers or only
+    `seller_ids`. Returns the numbers of seller and book rollup rows written.
+    """
+    orders = Order.objects.filter(status='paid', order_type='purchase')
+    sellers = SellerDailySales.objects.all()
+    books = BookDailySales.objects.all()
+    if seller_ids is not None:
+        orders = orders.filter(book__owner__in=seller_ids)
+        sellers = sellers.filter(seller__in=seller_ids)
+        books = books.filter(seller__in=seller_ids)
+
+    buckets = (
+        orders.annotate(day=TruncDate(Coalesce('paid_at', 'created_at')))
+        .values('book_id', 'book__owner_id', 'day')
+        .annotate(revenue=Sum('amount'), units=Count('id'))
+        .order_by()
+    )
+    book_rows = []
+    seller_totals = {}
+    for bucket in buckets.iterator():
+        key = (bucket['book__owner_id'], bucket['day'])
+        book_rows.append(BookDailySales(
+            book_id=bucket['book_id'], seller_id=key[0], day=key[1],
+            revenue=bucket['revenue'], units=bucket['units'],
+        ))
+        revenue, units = seller_totals.get(key, (Decimal(0), 0))
+        seller_totals[key] = (revenue + bucket['revenue'], units + bucket['units'])
+
+    with transaction.atomic():
+        sellers.delete()
+        books.delete()
+        BookDailySales.objects.bulk_create(book_rows, batch_size=BATCH_SIZE)
+        SellerDailySales.objects.bulk_create(
+            [
+                SellerDailySales(seller_id=seller_id, day=day, revenue=revenue, units=units)
+                for (seller_id, day), (revenue, units) in seller_totals.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return len(seller_totals), len(book_rows)
+
+
+def totals(seller):
+    """
+    Returns (revenue, units) over all of a seller's sales.
+    """
+    result = SellerDailySales.objects.filter(seller=seller).aggregate(revenue=Sum('revenue'), units=Sum('units'))
+    return result['revenue'] or Decimal(0), result['units'] or 0
+
+
+def earnings_by_day(seller, days):
+    """
+    Returns [(day, revenue, units), ...] for the last `days` days, oldest
+    first, with zeros for days without sales.
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    rows = dict(
+        (row['day'], (row['revenue'], row['units']))
+        for row in SellerDailySales.objects.filter(seller=seller, day__gte=start).values('day', 'revenue', 'units')
+    )
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        revenue, units = rows.get(day, (Decimal(0), 0))
+        series.append((day, revenue, units))
+    return series
+
+
+def top_books(seller, limit=5):
+    """
+    Returns a seller's best-selling books by revenue as dicts with
+    book_id, title, revenue and units.
+    """
+    return list(
+        BookDailySales.objects.filter(seller=seller)
+        .values('book_id', title=F('book__title'))
+        .annotate(revenue=Sum('revenue'), units=Sum('units'))
+        .order_by('-revenue', 'book_id')[:limit]
+    )
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def _ensure_search_index(sender, using, **kwargs):
+    from .search import ensure_index
+    ensure_index(connections[using])
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        # Register signal handlers (rating aggregates, etc.)
+        from . import signals  # noqa: F401
+        # System check for the reading progress buffer's cache backend
+        from . import reading  # noqa: F401
+        # Table rebuilds during migrate drop the FTS5 triggers; put them back
+        post_migrate.connect(_ensure_search_index, sender=self)
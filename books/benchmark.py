@@ -0,0 +1,415 @@
+# books/benchmark.py
+"""
+Request benchmarks for the pages that carry the store's traffic.
+
+seed() writes a synthetic dataset (users, books sharing one small real PDF,
+reviews, paid orders and a pool of pending orders for the payment callback)
+whose rows are all prefixed with "bench_", so clean() can remove them again.
+load_dataset() finds that data in the current database.
+
+Each scenario is one request path (catalog, book detail, reader, seller
+dashboard, profile, payment callback). run_client() replays the scenarios
+in-process with the Django test client and also counts SQL queries;
+run_http() sends them to a running server with a pool of threads. Both
+return a JSON-serializable result dict (see summarize()); compare() prints
+the change between two saved runs. The benchmark_requests command drives
+all of this.
+"""
+import hashlib
+import hmac
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, catalog_cache
+from .models import Book, Category, Order, Review
+from .storage import book_storage
+
+PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+CATEGORIES = ['BCA', 'BCOM', 'BBA', 'BSC', 'Fine Arts', 'Engineering']
+
+SCENARIOS = ['book_list', 'book_detail', 'read_book', 'user_dashboard', 'user_profile', 'payment_callback']
+# Status each scenario answers with when it works
+EXPECTED_STATUS = {
+    'book_list': 200,
+    'book_detail': 200,
+    'read_book': 200,
+    'user_dashboard': 200,
+    'user_profile': 200,
+    'payment_callback': 302,
+}
+
+
+@dataclass
+class Dataset:
+    sellers: list
+    buyers: list
+    books: list
+    # (buyer username, book id) of paid purchases
+    purchases: list
+    # Razorpay order IDs still pending, consumed by the payment callback scenario
+    pending_orders: list = field(default_factory=list)
+
+
+def make_pdf(pages=4):
+    """
+    Returns the bytes of a small valid PDF with `pages` blank A4 pages.
+    """
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(pages):
+        pdf.new_page(595, 842)
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    pdf.close()
+    return buffer.getvalue()
+
+
+def seed(sellers=20, buyers=200, books=2000, reviews=5000, orders=5000, pending=500, seed=0, stdout=None):
+    """
+    Writes the synthetic dataset with bulk inserts, then rebuilds everything
+    that Book.save()/Review.save()/mark_order_paid() would have maintained
+    (rating aggregates, category counts, sales rollups, cached pages).
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    # One hash for every user: hashing thousands of passwords would dominate seeding
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(username=f"{PREFIX}seller_{i}", email=f"{PREFIX}seller_{i}@example.com", password=password) for i in range(sellers)]
+            + [User(username=f"{PREFIX}buyer_{i}", email=f"{PREFIX}buyer_{i}@example.com", password=password) for i in range(buyers)],
+            batch_size=1000,
+        )
+        users = dict(User.objects.filter(username__startswith=PREFIX).values_list('username', 'id'))
+        seller_ids = [users[f"{PREFIX}seller_{i}"] for i in range(sellers)]
+        buyer_ids = [users[f"{PREFIX}buyer_{i}"] for i in range(buyers)]
+
+        # Every book points at the same small PDF
+        pdf_name = book_storage().save("book_pdfs/sample.pdf", ContentFile(make_pdf()))
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title=f"{PREFIX}Book {i}", author=f"Author {i % 97}",
+                    description=f"Synthetic benchmark book number {i}.",
+                    category=CATEGORIES[i % len(CATEGORIES)], file=pdf_name,
+                    owner_id=seller_ids[i % sellers], purchase_price=Decimal(rng.randint(49, 499)),
+                    page_count=4,
+                )
+                for i in range(books)
+            ],
+            batch_size=1000,
+        )
+        book_rows = list(Book.objects.filter(title__startswith=PREFIX).values_list('id', 'owner_id', 'purchase_price'))
+        book_ids = [row[0] for row in book_rows]
+
+        # Distinct (buyer, book) pairs: paid orders, then pending ones, then reviews of paid books
+        pairs = set()
+        while len(pairs) < min(orders + pending, buyers * books):
+            pairs.add((rng.choice(buyer_ids), rng.randrange(len(book_rows))))
+        pairs = list(pairs)
+        rng.shuffle(pairs)
+        paid_pairs, pending_pairs = pairs[:orders], pairs[orders:orders + pending]
+
+        order_rows = []
+        for n, (buyer_id, index) in enumerate(paid_pairs):
+            book_id, _, price = book_rows[index]
+            created = now - timedelta(minutes=rng.randint(1, 90 * 24 * 60))
+            order_rows.append(Order(
+                user_id=buyer_id, book_id=book_id, order_type='purchase', amount=price,
+                razorpay_order_id=f"{PREFIX}paid_{n}", razorpay_payment_id=f"{PREFIX}pay_{n}",
+                status='paid', paid_at=created + timedelta(minutes=1),
+            ))
+        for n, (buyer_id, index) in enumerate(pending_pairs):
+            book_id, _, price = book_rows[index]
+            order_rows.append(Order(
+                user_id=buyer_id, book_id=book_id, order_type='purchase', amount=price,
+                razorpay_order_id=f"{PREFIX}order_{n}", status='pending',
+            ))
+        Order.objects.bulk_create(order_rows, batch_size=1000)
+
+        Review.objects.bulk_create(
+            [
+                Review(book_id=book_rows[index][0], user_id=buyer_id, rating=rng.randint(1, 5), comment=f"{PREFIX}review")
+                for buyer_id, index in paid_pairs[:reviews]
+            ],
+            batch_size=1000,
+        )
+
+        # What the save() paths maintain, rebuilt once for the bulk inserts
+        for name in CATEGORIES:
+            Category.canonical_name(name)
+        Book.rebuild_rating_aggregates(Book.objects.filter(pk__in=book_ids))
+        Category.rebuild_counts()
+        analytics.rebuild(seller_ids)
+        catalog_cache.bump_all()
+
+    if stdout:
+        stdout.write(
+            f"Seeded {sellers} sellers, {buyers} buyers, {books} books, {min(reviews, len(paid_pairs))} reviews, "
+            f"{len(paid_pairs)} paid and {len(pending_pairs)} pending orders."
+        )
+    return load_dataset()
+
+
+def clean():
+    """
+    Deletes the benchmark users (and through them their books, orders and
+    reviews). Returns the number of users removed.
+    """
+    delete_files()
+    with transaction.atomic():
+        deleted = User.objects.filter(username__startswith=PREFIX).count()
+        User.objects.filter(username__startswith=PREFIX).delete()
+        Category.rebuild_counts()
+        catalog_cache.bump_all()
+    return deleted
+
+
+def delete_files():
+    # The shared PDF lives in the real storage even when the rows are in a scratch database
+    for name in set(Book.objects.filter(title__startswith=PREFIX).values_list('file', flat=True)):
+        book_storage().delete(name)
+
+
+def load_dataset():
+    users = User.objects.filter(username__startswith=PREFIX)
+    purchases = list(
+        Order.objects.filter(razorpay_order_id__startswith=f"{PREFIX}paid_", status='paid')
+        .values_list('user__username', 'book_id')
+    )
+    return Dataset(
+        sellers=list(users.filter(username__startswith=f"{PREFIX}seller_").values_list('username', flat=True)),
+        buyers=list(users.filter(username__startswith=f"{PREFIX}buyer_").values_list('username', flat=True)),
+        books=list(Book.objects.filter(title__startswith=PREFIX, processing_status='ready').values_list('id', flat=True)),
+        purchases=purchases,
+        pending_orders=list(
+            Order.objects.filter(razorpay_order_id__startswith=f"{PREFIX}order_", status='pending')
+            .order_by('pk').values_list('razorpay_order_id', flat=True)
+        ),
+    )
+
+
+def callback_payload(razorpay_order_id):
+    """
+    The POST body Razorpay's checkout sends to payment_callback_view, signed
+    with settings.RAZORPAY_KEY_SECRET like a real payment.
+    """
+    payment_id = f"pay_{razorpay_order_id}"
+    signature = hmac.new(
+        settings.RAZORPAY_KEY_SECRET.encode(), f"{razorpay_order_id}|{payment_id}".encode(), hashlib.sha256,
+    ).hexdigest()
+    return {
+        'razorpay_order_id': razorpay_order_id,
+        'razorpay_payment_id': payment_id,
+        'razorpay_signature': signature,
+    }
+
+
+def requests_for(scenario, dataset, rng, count):
+    """
+    Returns `count` requests for a scenario as (username or None, method, path, data).
+    """
+    result = []
+    pending = iter(dataset.pending_orders)
+    for _ in range(count):
+        if scenario == 'book_list':
+            category = rng.choice([None] + CATEGORIES)
+            path = reverse('books:book_list') + (f"?category={category}" if category else '')
+            result.append((None, 'GET', path, None))
+        elif scenario == 'book_detail':
+            result.append((rng.choice(dataset.buyers), 'GET', reverse('books:book_detail', args=[rng.choice(dataset.books)]), None))
+        elif scenario == 'read_book':
+            username, book_id = rng.choice(dataset.purchases)
+            result.append((username, 'GET', reverse('books:read_book', args=[book_id]), None))
+        elif scenario == 'user_dashboard':
+            result.append((rng.choice(dataset.sellers), 'GET', reverse('accounts:user_dashboard'), None))
+        elif scenario == 'user_profile':
+            result.append((rng.choice(dataset.buyers), 'GET', reverse('accounts:user_profile'), None))
+        elif scenario == 'payment_callback':
+            # Once the pool is used up, callbacks replay an already paid order (the idempotent path)
+            order_id = next(pending, None) or rng.choice(dataset.pending_orders or [f"{PREFIX}paid_0"])
+            result.append((None, 'POST', reverse('books:payment_callback'), callback_payload(order_id)))
+    return result
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(scenario, samples, elapsed):
+    """
+    samples: [(status, seconds, queries or None), ...]
+    """
+    latencies = sorted(sample[1] for sample in samples)
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample[0])] = statuses.get(str(sample[0]), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample[0] != EXPECTED_STATUS[scenario]),
+        'statuses': statuses,
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_mean': round(sum(queries) / len(queries), 1) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def run_client(dataset, scenarios, iterations, warmup=5, seed=0):
+    """
+    Runs each scenario sequentially in-process with the Django test client.
+    Query counts cover every configured database alias.
+    """
+    from django.test import Client
+
+    rng = random.Random(seed)
+    clients = {}
+
+    def client_for(username):
+        if username not in clients:
+            client = Client()
+            if username:
+                client.force_login(User.objects.get(username=username))
+            clients[username] = client
+        return clients[username]
+
+    results = {}
+    for scenario in scenarios:
+        planned = requests_for(scenario, dataset, rng, warmup + iterations)
+        samples = []
+        started = None
+        for n, (username, method, path, data) in enumerate(planned):
+            client = client_for(username)
+            if n == warmup:
+                started = time.perf_counter()
+            contexts = [CaptureQueriesContext(connections[alias]) for alias in settings.DATABASES]
+            for context in contexts:
+                context.__enter__()
+            began = time.perf_counter()
+            try:
+                response = client.get(path) if method == 'GET' else client.post(path, data)
+            finally:
+                took = time.perf_counter() - began
+                for context in contexts:
+                    context.__exit__(None, None, None)
+            if n >= warmup:
+                samples.append((response.status_code, took, sum(len(context) for context in contexts)))
+        results[scenario] = summarize(scenario, samples, time.perf_counter() - started if started else 0)
+    return results
+
+
+def login_http(base_url, username):
+    """
+    Logs in through the login form and returns the session cookies.
+    """
+    import requests
+
+    session = requests.Session()
+    login_url = base_url + reverse('accounts:login')
+    session.get(login_url, timeout=10)
+    response = session.post(
+        login_url,
+        data={'username': username, 'password': PASSWORD, 'csrfmiddlewaretoken': session.cookies.get('csrftoken', '')},
+        headers={'Referer': login_url}, allow_redirects=False, timeout=10,
+    )
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username} (HTTP {response.status_code}).")
+    return session.cookies.get_dict()
+
+
+def run_http(base_url, dataset, scenarios, iterations, concurrency=8, warmup=5, sessions=10, seed=0):
+    """
+    Sends each scenario's requests to a running server from `concurrency`
+    threads. Logs in a sample of `sessions` users per role up front and
+    reuses their cookies. Query counts are not available in this mode.
+    """
+    import requests
+
+    rng = random.Random(seed)
+    base_url = base_url.rstrip('/')
+    # Buyers with purchases, so the reader scenario has books to open
+    purchasers = sorted({username for username, _ in dataset.purchases})
+    sample = rng.sample(purchasers, min(sessions, len(purchasers))) + rng.sample(dataset.sellers, min(sessions, len(dataset.sellers)))
+    cookies = {username: login_http(base_url, username) for username in sample}
+    sampled = Dataset(
+        sellers=[name for name in dataset.sellers if name in cookies],
+        buyers=[name for name in purchasers if name in cookies],
+        books=dataset.books,
+        purchases=[purchase for purchase in dataset.purchases if purchase[0] in cookies],
+        pending_orders=dataset.pending_orders,
+    )
+    local = threading.local()
+
+    def send(planned):
+        username, method, path, data = planned
+        if not hasattr(local, 'session'):
+            # One keep-alive connection pool per thread
+            local.session = requests.Session()
+        for name in list(local.session.cookies.keys()):
+            del local.session.cookies[name]
+        if username:
+            local.session.cookies.update(cookies[username])
+        began = time.perf_counter()
+        try:
+            response = local.session.request(method, base_url + path, data=data, allow_redirects=False, timeout=30)
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        return status, time.perf_counter() - began, None
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for scenario in scenarios:
+            planned = requests_for(scenario, sampled, rng, warmup + iterations)
+            list(pool.map(send, planned[:warmup]))
+            started = time.perf_counter()
+            samples = list(pool.map(send, planned[warmup:]))
+            results[scenario] = summarize(scenario, samples, time.perf_counter() - started)
+    return results
+
+
+def compare(baseline, current, stdout):
+    """
+    Writes the change in p95 latency, throughput and queries per scenario
+    between two result documents.
+    """
+    stdout.write(f"{'scenario':<18}{'p95 ms':>22}{'req/s':>22}{'queries':>18}")
+    for scenario, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(scenario)
+        if not before:
+            continue
+
+        def change(key):
+            old, new = before.get(key), now.get(key)
+            if old is None or new is None:
+                return '-'
+            delta = f" ({(new - old) / old * 100:+.0f}%)" if old else ''
+            return f"{old}->{new}{delta}"
+
+        stdout.write(f"{scenario:<18}{change('p95_ms'):>22}{change('throughput_rps'):>22}{change('queries_mean'):>18}")
@@ -0,0 +1,344 @@
+# books/bulk_import.py
+"""
+Bulk import of PDF catalogs (`manage.py import_books`).
+
+A publisher's delivery is a directory of PDFs plus a manifest, either a CSV
+file with a header row or a JSON list of objects, with one entry per book:
+
+    file,title,author,purchase_price,category,description
+    algebra/intro.pdf,Introduction to Algebra,A. Author,249,BSC,A first course.
+
+`file` is relative to the directory; category defaults to 'Others' and
+purchase_price to the command's --price. The import runs in phases:
+
+1. every entry is checked against the Book fields (Model.clean_fields);
+2. the files are validated, SHA-256 hashed and their pages counted in a
+   process pool, since hashing is CPU-bound;
+3. duplicates are dropped: repeats within the manifest, and files whose hash
+   is already a Book.file_hash (one query for the whole manifest);
+4. batch by batch, a thread pool copies the files into the book storage
+   (I/O-bound) while the process pool renders covers from page 1, then the
+   batch's Book rows are inserted with one bulk_create.
+
+Progress is checkpointed to a JSON file after hashing and after each batch,
+so an interrupted import resumes where it stopped: imported entries are
+skipped and unchanged files are not hashed again.
+
+Imported books are ready at once; they skip the upload pipeline in
+books/processing.py. bulk_create sends no signals, so finish() refreshes the
+category counts, the owner's entitlements and the catalog cache itself.
+"""
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from . import catalog_cache
+from .covers import cover_from_first_page
+from .entitlements import invalidate_entitlements
+from .models import Book, Category
+from .pdf_render import RenderError
+from .processing import ProcessingError, count_pages, render_title_card, validate_pdf
+
+CHUNK_SIZE = 1024 * 1024
+CHECKPOINT_VERSION = 1
+
+
+class ManifestError(Exception):
+    """The manifest cannot be read at all (as opposed to a bad entry)."""
+
+
+@dataclass
+class ImportEntry:
+    number: int  # 1-based position in the manifest
+    file: str  # relative to the import directory
+    path: str
+    fields: dict
+    status: str = 'pending'  # then 'new', 'duplicate', 'invalid', 'imported' or 'skipped' (imported before)
+    message: str = ''
+    sha256: str = ''
+    size: int = 0
+    pages: int = None
+
+
+@dataclass
+class ImportReport:
+    entries: list = field(default_factory=list)
+
+    def with_status(self, status):
+        return [entry for entry in self.entries if entry.status == status]
+
+    def counts(self):
+        counts = {}
+        for entry in self.entries:
+            counts[entry.status] = counts.get(entry.status, 0) + 1
+        return counts
+
+
+def read_manifest(path):
+    """
+    Returns the manifest entries as a list of dicts.
+    """
+    try:
+        if path.lower().endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+            if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+                raise ManifestError("A JSON manifest must be a list of objects.")
+            return entries
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return list(csv.DictReader(f))
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Could not read {path}: {e}")
+
+
+def _init_worker():
+    # Workers started with 'spawn' (macOS, Windows) begin without Django set up
+    django.setup()
+
+
+def inspect_file(path):
+    """
+    Runs in the process pool: validates a PDF, hashes it and counts its pages.
+    Returns (sha256, size, pages, error).
+    """
+    try:
+        validate_pdf(None, None, path)
+        hasher = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                size += len(chunk)
+        return hasher.hexdigest(), size, count_pages(path), ''
+    except (ProcessingError, OSError) as e:
+        return '', 0, None, str(e)
+
+
+def render_cover(file_hash, path, title, author):
+    """
+    Runs in the process pool: stores a cover rendered from page 1 (or a title
+    card when the page cannot be rendered). Returns (cover name, cover hash).
+    """
+    try:
+        name = cover_from_first_page(file_hash, path)
+    except (RenderError, OSError):
+        name = default_storage.save(f"book_covers/cover_{file_hash[:16]}.png", ContentFile(render_title_card(title, author)))
+    hasher = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for chunk in f.chunks():
+            hasher.update(chunk)
+    return name, hasher.hexdigest()
+
+
+class CatalogImport:
+    """
+    Imports the books listed in a manifest for one owner. run() returns an
+    ImportReport; with dry_run=True nothing is stored or written, including
+    the checkpoint.
+    """
+
+    def __init__(self, directory, manifest, owner, checkpoint=None, price=None, hash_workers=None,
+                 copy_workers=8, batch_size=500, covers=True, log=None):
+        self.directory = os.path.realpath(directory)
+        self.manifest = manifest
+        self.owner = owner
+        self.checkpoint_path = checkpoint
+        self.price = price
+        self.hash_workers = hash_workers or os.cpu_count() or 1
+        self.copy_workers = copy_workers
+        self.batch_size = batch_size
+        self.covers = covers
+        self.log = log or (lambda message: None)
+        self.file_field = Book._meta.get_field('file')
+        self.categories = {}
+
+    # --- Checkpoint ---
+
+    def load_checkpoint(self):
+        state = {'version': CHECKPOINT_VERSION, 'files': {}, 'imported': {}}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('version') == CHECKPOINT_VERSION:
+                state = stored
+        return state
+
+    def save_checkpoint(self, state):
+        if not self.checkpoint_path:
+            return
+        # Written next to the old one and renamed over it, so a crash never leaves half a checkpoint
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # --- Phases ---
+
+    def run(self, dry_run=False):
+        state = self.load_checkpoint()
+        report = ImportReport(self.read_entries(state))
+        with ProcessPoolExecutor(max_workers=self.hash_workers, initializer=_init_worker) as processes:
+            self.hash_files(report, state, processes)
+            if not dry_run:
+                self.save_checkpoint(state)
+            self.mark_duplicates(report.with_status('new'))
+            if dry_run:
+                return report
+            self.import_entries(report.with_status('new'), state, processes)
+        self.finish(report)
+        return report
+
+    def read_entries(self, state):
+        entries = []
+        for number, values in enumerate(read_manifest(self.manifest), start=1):
+            values = {key.strip(): (value or '').strip() if isinstance(value, str) else value
+                      for key, value in values.items() if key}
+            relative = str(values.get('file') or '')
+            entry = ImportEntry(number, relative, os.path.realpath(os.path.join(self.directory, relative)), {
+                'title': values.get('title') or '',
+                'author': values.get('author') or '',
+                'description': values.get('description') or '',
+                'category': values.get('category') or 'Others',
+                'purchase_price': values.get('purchase_price') or self.price,
+            })
+            entries.append(entry)
+            if relative in state['imported']:
+                entry.status, entry.message = 'skipped', "imported by an earlier run"
+            elif not relative or not entry.path.startswith(self.directory + os.sep):
+                entry.status, entry.message = 'invalid', "file must be a path inside the import directory"
+            elif not os.path.isfile(entry.path):
+                entry.status, entry.message = 'invalid', "file not found"
+            else:
+                entry.status, entry.message = self.check_fields(entry)
+        return entries
+
+    def check_fields(self, entry):
+        book = Book(owner=self.owner, file=os.path.basename(entry.file), **entry.fields)
+        try:
+            # The owner is checked once by the caller, not with a query per entry
+            book.clean_fields(exclude=['owner', 'file_hash', 'cover_image'])
+        except ValidationError as e:
+            return 'invalid', '; '.join(f"{name}: {' '.join(messages)}" for name, messages in e.message_dict.items())
+        entry.fields['purchase_price'] = book.purchase_price
+        return 'new', ''
+
+    def hash_files(self, report, state, processes):
+        """
+        Hashes the new entries' files in the process pool, reusing the
+        checkpointed hash of any file whose size and mtime have not changed.
+        """
+        todo = []
+        for entry in report.with_status('new'):
+            stat = os.stat(entry.path)
+            known = state['files'].get(entry.file)
+            if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                entry.sha256, entry.size, entry.pages = known['sha256'], known['size'], known['pages']
+            else:
+                todo.append((entry, stat.st_mtime_ns))
+        self.log(f"Hashing {len(todo)} file(s) with {self.hash_workers} process(es)...")
+
+        results = processes.map(inspect_file, [entry.path for entry, _ in todo], chunksize=8)
+        for (entry, mtime_ns), (sha256, size, pages, error) in zip(todo, results):
+            if error:
+                entry.status, entry.message = 'invalid', error
+                continue
+            entry.sha256, entry.size, entry.pages = sha256, size, pages
+            state['files'][entry.file] = {'size': size, 'mtime_ns': mtime_ns, 'sha256': sha256, 'pages': pages}
+
+    def mark_duplicates(self, entries):
+        # One query for every hash in the manifest
+        existing = set(
+            Book.objects.filter(file_hash__in={entry.sha256 for entry in entries}).values_list('file_hash', flat=True)
+        )
+        first_entry = {}
+        for entry in entries:
+            if entry.sha256 in existing:
+                entry.status, entry.message = 'duplicate', "already in the catalog"
+            elif entry.sha256 in first_entry:
+                entry.status, entry.message = 'duplicate', f"same file as entry {first_entry[entry.sha256].number}"
+            else:
+                first_entry[entry.sha256] = entry
+
+    def import_entries(self, entries, state, processes):
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as threads:
+            for start in range(0, len(entries), self.batch_size):
+                batch = entries[start:start + self.batch_size]
+                # Covers render in the process pool while the threads copy files
+                covers = [
+                    processes.submit(render_cover, entry.sha256, entry.path, entry.fields['title'], entry.fields['author'])
+                    for entry in batch
+                ] if self.covers else [None] * len(batch)
+                names = list(threads.map(self.store_file, batch))
+                books = [
+                    self.build_book(entry, name, cover.result() if cover else ('', ''))
+                    for entry, name, cover in zip(batch, names, covers)
+                ]
+                created = self.insert(batch, books)
+                for entry, book in created:
+                    entry.status = 'imported'
+                    state['imported'][entry.file] = book.pk
+                self.save_checkpoint(state)
+                self.log(f"{start + len(batch)}/{len(entries)} book(s) processed.")
+
+    def store_file(self, entry):
+        """
+        Runs in the thread pool: copies the PDF into the book storage (the
+        source is left in place). Content-addressed, so a retry is a no-op.
+        """
+        with open(entry.path, 'rb') as f:
+            content = File(f, name=os.path.basename(entry.file))
+            content.sha256 = entry.sha256
+            name = self.file_field.generate_filename(None, content.name)
+            return self.file_field.storage.save(name, content, max_length=self.file_field.max_length)
+
+    def build_book(self, entry, file_name, cover):
+        category = entry.fields['category']
+        if category not in self.categories:
+            self.categories[category] = Category.canonical_name(category)
+        cover_name, cover_hash = cover
+        return Book(
+            owner=self.owner,
+            file=file_name,
+            file_hash=entry.sha256,
+            page_count=entry.pages,
+            processing_status='ready',
+            cover_image=cover_name or None,
+            cover_hash=cover_hash,
+            **{**entry.fields, 'category': self.categories[category]},
+        )
+
+    def insert(self, batch, books):
+        """
+        Inserts a batch with one bulk_create. Returns (entry, book) pairs.
+        """
+        try:
+            with transaction.atomic():
+                Book.objects.bulk_create(books)
+        except IntegrityError:
+            # A file uploaded meanwhile took one of the hashes: drop those and retry once
+            self.mark_duplicates(batch)
+            pairs = [(entry, book) for entry, book in zip(batch, books) if entry.status == 'new']
+            with transaction.atomic():
+                Book.objects.bulk_create([book for _, book in pairs])
+            return pairs
+        return list(zip(batch, books))
+
+    def finish(self, report):
+        if not report.with_status('imported'):
+            return
+        # bulk_create sent no signals: do what Book.save() and books/signals.py would have
+        Category.rebuild_counts()
+        invalidate_entitlements(self.owner.pk)
+        catalog_cache.bump_all()
@@ -0,0 +1,123 @@
+# books/catalog_cache.py
+"""
+Versioned caching for the public catalog and book detail pages.
+
+Cached data (catalog pages, the category list, a book with its owner, pages
+of its reviews) and template fragments (book cards, the public part of the
+detail page) are keyed by version counters:
+
+- the catalog version, bumped whenever any Book or Review is saved or
+  deleted (cards show ratings, so reviews count too);
+- a per-book version, bumped when that book or one of its reviews changes.
+
+Bumping a counter makes every key built from the old value unreachable, so
+nothing is ever deleted; stale entries just expire. Only get/set/add are
+used, which every backend supports (local memory, file, Redis, Memcached).
+Per-user parts of the pages (can_read, has_reviewed, ...) are never cached.
+The signal handlers in books/signals.py do the bumping. Lookups are counted
+in bookstore_cache_requests_total (bookstore/metrics.py).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from bookstore import metrics
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# Part of every per-book version; bumped by bump_all() after bulk updates that send no signals
+GENERATION_KEY = 'catalog:generation'
+
+
+def _book_version_key(book_id):
+    return f"catalog:book:{book_id}:version"
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # A timestamp, so an evicted counter never lines up with old entries again
+        version = time.time_ns()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+def catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def book_version(book_id):
+    return f"{_get_version(GENERATION_KEY)}.{_get_version(_book_version_key(book_id))}"
+
+
+def bump_catalog():
+    # After commit, so a concurrent request cannot re-cache the old rows under the new version
+    transaction.on_commit(lambda: cache.set(CATALOG_VERSION_KEY, time.time_ns(), None))
+
+
+def bump_book(book_id):
+    transaction.on_commit(lambda: cache.set(_book_version_key(book_id), time.time_ns(), None))
+
+
+def bump_all():
+    """
+    Invalidates every cached catalog page and book, e.g. after a queryset
+    update() such as Book.rebuild_rating_aggregates().
+    """
+    bump_catalog()
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, time.time_ns(), None))
+
+
+def _digest(*parts):
+    # Categories and cursors are user input: hash them into a backend-safe key
+    return hashlib.md5('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def get_or_set(key, build, name='catalog'):
+    value = cache.get(key)
+    metrics.record_cache(name, value is not None)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout())
+    return value
+
+
+def catalog_page(category, cursor, page_size, build):
+    """
+    Returns build()'s (books, next_cursor) for one catalog page, from the cache when possible.
+    """
+    key = f"catalog:page:{catalog_version()}:{_digest(category or '', cursor or '', page_size)}"
+    return get_or_set(key, build)
+
+
+def categories(build):
+    return get_or_set(f"catalog:categories:{catalog_version()}", build, name='categories')
+
+
+def book(book_id, build):
+    """
+    Returns build()'s book for the detail page. Misses (None) are not cached.
+    """
+    key = f"catalog:book:{book_id}:{book_version(book_id)}"
+    value = cache.get(key)
+    metrics.record_cache('book', value is not None)
+    if value is None:
+        value = build()
+        if value is not None:
+            cache.set(key, value, timeout())
+    return value
+
+
+def reviews_page(book_id, sort, cursor, page_size, build):
+    """
+    Returns build()'s (reviews, next_cursor) for one page of a book's reviews, from the cache when possible.
+    """
+    key = f"catalog:reviews:{book_id}:{book_version(book_id)}:{_digest(sort, cursor or '', page_size)}"
+    return get_or_set(key, build, name='reviews')
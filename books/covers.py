@@ -0,0 +1,191 @@
+# books/covers.py
+"""
+Resized cover images ("derivatives") for the catalog.
+
+Each cover is rendered at COVER_WIDTHS in WebP and JPEG and stored under a
+name derived from the SHA-256 of the original cover (Book.cover_hash), e.g.
+cover_derivatives/ab/<hash>_320.webp. Content-derived names never change for
+the same image, so they are served with immutable cache headers. Derivatives
+are built by the upload pipeline, by `manage.py build_cover_derivatives`, or
+lazily by cover_variant_view the first time one is requested.
+"""
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+COVER_WIDTHS = (160, 320, 640)
+
+# URL extension -> (Pillow format, save options)
+COVER_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DERIVATIVE_DIR = 'cover_derivatives'
+
+# Covers rendered from page 1 of a PDF, keyed by Book.file_hash
+GENERATED_COVER_DIR = 'generated_covers'
+GENERATED_COVER_WIDTH = 900
+
+
+def hash_cover(book):
+    """
+    Returns the SHA-256 hex digest of the book's original cover image.
+    """
+    hasher = hashlib.sha256()
+    with book.cover_image.open('rb') as f:
+        for chunk in f.chunks():
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def derivative_name(cover_hash, width, ext):
+    return f"{DERIVATIVE_DIR}/{cover_hash[:2]}/{cover_hash}_{width}.{ext}"
+
+
+def render_derivative(image, width, ext):
+    """
+    Returns encoded bytes of a Pillow image scaled down to `width` pixels wide.
+    Images narrower than `width` are re-encoded at their own size.
+    """
+    from PIL import Image
+
+    pil_format, options = COVER_FORMATS[ext]
+    resized = image.copy()
+    if resized.width > width:
+        height = round(resized.height * width / resized.width)
+        resized = resized.resize((width, height), Image.LANCZOS)
+    if pil_format == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    buffer = BytesIO()
+    resized.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def _open_cover(book):
+    from PIL import Image, ImageOps
+
+    with book.cover_image.open('rb') as f:
+        image = Image.open(f)
+        # Apply camera EXIF rotation so thumbnails face the right way
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    return image
+
+
+def _save_once(name, data):
+    """
+    Stores data under exactly `name`. Names here are content-derived, so two
+    requests building the same file at once write the same bytes: locally the
+    file is written under a temporary name and renamed into place (the last
+    rename wins, nothing is left behind); default_storage.save() would give
+    the loser a suffixed name that is never served.
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        # Remote storage: object stores replace the key in one PUT
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        return default_storage.save(name, ContentFile(data))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates the file 0600; give it the mode a normal save would
+        os.chmod(tmp_path, default_storage.file_permissions_mode or 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return name
+
+
+def build_derivatives(book, widths=COVER_WIDTHS, formats=tuple(COVER_FORMATS), force=False):
+    """
+    Creates any missing derivatives for a book's cover, setting
+    book.cover_hash if needed (the caller saves the book).
+    Returns the number of files written.
+    """
+    if not book.cover_image:
+        return 0
+    if not book.cover_hash:
+        book.cover_hash = hash_cover(book)
+
+    image = None
+    written = 0
+    for width in widths:
+        for ext in formats:
+            name = derivative_name(book.cover_hash, width, ext)
+            if not force and default_storage.exists(name):
+                continue
+            if image is None:
+                image = _open_cover(book)
+            _save_once(name, render_derivative(image, width, ext))
+            written += 1
+    return written
+
+
+def ensure_derivative(book, width, ext):
+    """
+    Returns the storage name of one derivative, building it first if missing.
+    """
+    name = derivative_name(book.cover_hash, width, ext)
+    if not default_storage.exists(name):
+        build_derivatives(book, widths=(width,), formats=(ext,))
+    return name
+
+
+def cover_variant_url(book, width, ext):
+    """
+    URL of a resized cover variant, or of the original cover when the book
+    has no cover hash yet (None when there is no cover at all).
+    """
+    if not book.cover_image:
+        return None
+    if not book.cover_hash:
+        return book.cover_image.url
+    return reverse('books:cover_variant', args=[book.cover_hash, width, ext])
+
+
+def cover_srcset(book, ext):
+    """
+    srcset attribute value listing every width of one format.
+    """
+    if not book.cover_image or not book.cover_hash:
+        return ''
+    return ', '.join(f"{cover_variant_url(book, width, ext)} {width}w" for width in COVER_WIDTHS)
+
+
+def generated_cover_name(file_hash):
+    return f"{GENERATED_COVER_DIR}/{file_hash[:2]}/{file_hash}.jpg"
+
+
+def cover_from_first_page(file_hash, pdf_path):
+    """
+    Returns the storage name of a cover rendered from page 1 of the PDF.
+    The render is cached by file hash, so an identical file uploaded again
+    reuses it. Raises pdf_render.RenderError if no renderer can handle the file.
+    """
+    from .pdf_render import render_page
+
+    name = generated_cover_name(file_hash)
+    if default_storage.exists(name):
+        return name
+
+    image = render_page(pdf_path, 1, width=GENERATED_COVER_WIDTH)
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True, progressive=True)
+    return _save_once(name, buffer.getvalue())
@@ -0,0 +1,89 @@
+# books/entitlements.py
+"""
+Per-user entitlements: which books a user owns (uploaded) or has purchased.
+
+The two ID sets are loaded with one query each and kept in the cache under a
+per-user version number. Any change that can grant or revoke access (a Book
+uploaded or deleted, an Order saved or deleted) bumps the version through the
+signal handlers in books/signals.py, so stale sets are never read again and
+simply expire.
+"""
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from bookstore import metrics
+from .models import Book, Order
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    owned: frozenset
+    purchased: frozenset
+
+    def owns(self, book_id):
+        return book_id in self.owned
+
+    def has_purchased(self, book_id):
+        return book_id in self.purchased
+
+    def can_read(self, book_id):
+        # Owners and purchasers can read in-app
+        return book_id in self.owned or book_id in self.purchased
+
+
+EMPTY = Entitlements(owned=frozenset(), purchased=frozenset())
+
+
+def _version_key(user_id):
+    return f"entitlements:version:{user_id}"
+
+
+def _get_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from a timestamp rather than 1 so an evicted version key can
+        # never line up with an old cached entry again
+        version = time.time_ns()
+        cache.add(_version_key(user_id), version, None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def invalidate_entitlements(user_id):
+    """
+    Makes the next get_entitlements() call for this user reload from the database.
+    """
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def get_entitlements(user):
+    """
+    Returns the Entitlements for a user, from the cache when possible.
+    Anonymous users have no entitlements.
+    """
+    if not user.is_authenticated:
+        return EMPTY
+
+    key = f"entitlements:{user.pk}:{_get_version(user.pk)}"
+    entitlements = cache.get(key)
+    metrics.record_cache('entitlements', entitlements is not None)
+    if entitlements is None:
+        entitlements = _load_entitlements(user)
+        cache.set(key, entitlements, getattr(settings, 'ENTITLEMENTS_CACHE_TIMEOUT', 900))
+    return entitlements
+
+
+def _load_entitlements(user):
+    # Always from the primary: the result is cached, and a lagging replica
+    # would keep a just-paid purchase hidden until the entry expires
+    owned = Book.objects.using(DEFAULT_DB_ALIAS).filter(owner=user).values_list('pk', flat=True)
+    purchased = Order.objects.using(DEFAULT_DB_ALIAS).filter(
+        user=user,
+        order_type='purchase',
+        status='paid'
+    ).values_list('book_id', flat=True)
+    return Entitlements(owned=frozenset(owned), purchased=frozenset(purchased))
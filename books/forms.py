@@ -1,8 +1,10 @@
 # books/forms.py
 import hashlib
+import time
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import Book, Review
+from bookstore import metrics # Upload bytes and hashing time
 import sys
 
 # Define the category choices
@@ -68,29 +70,39 @@ class BookUploadForm(forms.ModelForm):
         category = cleaned_data.get('category')
         other_category = cleaned_data.get('other_category')
 
-        # --- File Hash Calculation (Existing Logic) ---
+        # --- File Hash Calculation ---
+        # Uploads staged by StagingHashUploadHandler were hashed while streaming in;
+        # only files from other upload handlers need a second pass here.
         file_hash = None
         if uploaded_file:
-            hasher = hashlib.sha256()
-            uploaded_file.seek(0)
-            try:
-                for chunk in uploaded_file.chunks():
-                    hasher.update(chunk)
-                file_hash = hasher.hexdigest()
+            file_hash = getattr(uploaded_file, 'sha256', None)
+            hash_seconds = getattr(uploaded_file, 'hash_seconds', None)
+            if file_hash:
                 cleaned_data['file_hash'] = file_hash
-            except Exception as e:
-                # Log the error for debugging
-                print(f"Error hashing file: {e}", file=sys.stderr)
-                raise ValidationError("Error processing file.")
-            finally:
-                 uploaded_file.seek(0) # Reset file pointer after reading
+            else:
+                hasher = hashlib.sha256()
+                uploaded_file.seek(0)
+                try:
+                    started = time.perf_counter()
+                    for chunk in uploaded_file.chunks():
+                        hasher.update(chunk)
+                    file_hash = hasher.hexdigest()
+                    hash_seconds = time.perf_counter() - started
+                    cleaned_data['file_hash'] = file_hash
+                except Exception as e:
+                    # Log the error for debugging
+                    print(f"Error hashing file: {e}", file=sys.stderr)
+                    raise ValidationError("Error processing file.")
+                finally:
+                     uploaded_file.seek(0) # Reset file pointer after reading
+            metrics.UPLOAD_BYTES.inc(uploaded_file.size)
+            if hash_seconds is not None:
+                metrics.UPLOAD_HASH_SECONDS.observe(hash_seconds)
 
 
         # --- Duplicate Check Logic (Existing Logic) ---
         if file_hash: # Only perform check if a file was uploaded and hashed
-             existing_books_by_hash = Book.objects.filter(file_hash=file_hash)
-
-             existing_book_by_hash = existing_books_by_hash.first()
+             existing_book_by_hash = Book.objects.filter(file_hash=file_hash).only('pk').first()
 
              if existing_book_by_hash:
                  if self.instance and self.instance.pk and existing_book_by_hash.pk == self.instance.pk:
@@ -0,0 +1,20 @@
+# books/management/commands/backfill_sales_rollups.py
+from django.core.management.base import BaseCommand
+
+from books import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily seller and book sales rollups behind the seller dashboard from the "
+        "paid purchase orders, e.g. for historical orders or orders edited in the admin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller_ids', nargs='*', type=int, help="Only rebuild these sellers' rollups (default: all sellers).")
+
+    def handle(self, *args, **options):
+        seller_rows, book_rows = analytics.rebuild(options['seller_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {seller_rows} seller and {book_rows} book daily sales rollup(s)."
+        ))
@@ -0,0 +1,137 @@
+# books/management/commands/benchmark_requests.py
+import json
+import platform
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from books import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the main request paths (catalog, detail, reader, dashboard, profile, payment callback): "
+        "query counts, p50/p95/p99 latency and throughput, written as JSON so runs can be compared. "
+        "By default seeds a scratch test database and uses the in-process test client; --mode http "
+        "targets a running server whose database was prepared with --seed-only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['client', 'http'], default='client', help="In-process test client or HTTP against --url (default: client).")
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Server for --mode http.")
+        parser.add_argument('--scenarios', default=','.join(benchmark.SCENARIOS), help="Comma-separated scenarios to run (default: all).")
+        parser.add_argument('--iterations', type=int, default=200, help="Measured requests per scenario (default: 200).")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per scenario first (default: 10).")
+        parser.add_argument('--concurrency', type=int, default=8, help="Threads for --mode http (default: 8).")
+        parser.add_argument('--sessions', type=int, default=10, help="Buyers and sellers logged in for --mode http (default: 10 each).")
+        parser.add_argument('--sellers', type=int, default=20)
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=5000, help="Paid orders (default: 5000).")
+        parser.add_argument('--pending', type=int, default=500, help="Pending orders for the payment callback scenario (default: 500).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the dataset and request mix.")
+        parser.add_argument('--existing', action='store_true', help="Client mode on the configured database's existing bench_ data instead of a scratch database.")
+        parser.add_argument('--seed-only', action='store_true', help="Seed the configured database for --mode http or --existing, then exit.")
+        parser.add_argument('--clean', action='store_true', help="Delete the bench_ data from the configured database, then exit.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="A previous --output file to compare against.")
+
+    def handle(self, *args, **options):
+        if options['clean']:
+            self.stdout.write(self.style.SUCCESS(f"Removed {benchmark.clean()} benchmark user(s) and their data."))
+            return
+        if options['seed_only']:
+            self._seed(options)
+            return
+
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(benchmark.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        if options['mode'] == 'http':
+            dataset = self._existing_dataset()
+            results = benchmark.run_http(
+                options['url'], dataset, scenarios, options['iterations'],
+                concurrency=options['concurrency'], warmup=options['warmup'],
+                sessions=options['sessions'], seed=options['seed'],
+            )
+        elif options['existing']:
+            setup_test_environment(debug=False)
+            try:
+                results = benchmark.run_client(self._existing_dataset(), scenarios, options['iterations'], options['warmup'], options['seed'])
+            finally:
+                teardown_test_environment()
+        else:
+            # Scratch database, so the benchmark never writes to real data
+            setup_test_environment(debug=False)
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+            try:
+                dataset = self._seed(options)
+                results = benchmark.run_client(dataset, scenarios, options['iterations'], options['warmup'], options['seed'])
+            finally:
+                benchmark.delete_files()
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+        document = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': self._git_commit(),
+            'mode': options['mode'] if options['mode'] == 'http' else ('client-existing' if options['existing'] else 'client'),
+            'url': options['url'] if options['mode'] == 'http' else None,
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'concurrency': options['concurrency'] if options['mode'] == 'http' else 1,
+            'dataset': {key: options[key] for key in ('sellers', 'buyers', 'books', 'reviews', 'orders', 'pending', 'seed')},
+            'scenarios': results,
+        }
+        self._report(document)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            with open(options['compare']) as f:
+                benchmark.compare(json.load(f), document, self.stdout)
+
+    def _seed(self, options):
+        if benchmark.load_dataset().books:
+            raise CommandError("bench_ data already exists in this database; run with --clean first.")
+        return benchmark.seed(
+            sellers=options['sellers'], buyers=options['buyers'], books=options['books'],
+            reviews=options['reviews'], orders=options['orders'], pending=options['pending'],
+            seed=options['seed'], stdout=self.stdout,
+        )
+
+    def _existing_dataset(self):
+        dataset = benchmark.load_dataset()
+        if not (dataset.books and dataset.sellers and dataset.purchases):
+            raise CommandError("No bench_ data in the configured database; run with --seed-only first.")
+        return dataset
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _report(self, document):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Benchmark ({document['mode']}, {document['database']})"))
+        self.stdout.write(f"  {'scenario':<18}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+        for scenario, result in document['scenarios'].items():
+            line = (
+                f"  {scenario:<18}{result['throughput_rps']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                f"{result['p99_ms']:>9}{result['queries_mean'] if result['queries_mean'] is not None else '-':>9}{result['errors']:>8}"
+            )
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
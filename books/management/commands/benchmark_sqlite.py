@@ -0,0 +1,145 @@
+# books/management/commands/benchmark_sqlite.py
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# A cut-down catalog: the list query and the review write path
+SCHEMA = """
+CREATE TABLE book (
+    id INTEGER PRIMARY KEY, title TEXT, category TEXT, uploaded_at REAL,
+    rating_sum INTEGER NOT NULL DEFAULT 0, rating_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX book_uploaded_id_idx ON book (uploaded_at DESC, id DESC);
+CREATE INDEX book_cat_uploaded_id_idx ON book (category, uploaded_at DESC, id DESC);
+CREATE TABLE review (
+    id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL REFERENCES book (id),
+    rating INTEGER NOT NULL, comment TEXT, created_at REAL
+);
+CREATE INDEX review_book_created_idx ON review (book_id, created_at DESC);
+"""
+CATEGORIES = ['Fiction', 'Science', 'History', 'Poetry', 'Others']
+
+
+def _connect(path, tuned):
+    # Django's defaults: 5 s timeout, deferred transactions
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    if tuned:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            connection.execute(f"PRAGMA {name}={value}")
+    return connection
+
+
+def _worker(args):
+    path, tuned, seconds, write_ratio, books, seed = args
+    rng = random.Random(seed)
+    connection = _connect(path, tuned)
+    begin = "BEGIN IMMEDIATE" if tuned else "BEGIN"
+    reads = writes = errors = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                # Same shape as Review.save(): insert plus aggregate update in one transaction
+                book_id = rng.randint(1, books)
+                connection.execute(begin)
+                try:
+                    connection.execute("SELECT rating_count FROM book WHERE id = ?", (book_id,)).fetchone()
+                    rating = rng.randint(1, 5)
+                    connection.execute(
+                        "INSERT INTO review (book_id, rating, comment, created_at) VALUES (?, ?, ?, ?)",
+                        (book_id, rating, "benchmark", time.time()),
+                    )
+                    connection.execute(
+                        "UPDATE book SET rating_sum = rating_sum + ?, rating_count = rating_count + 1 WHERE id = ?",
+                        (rating, book_id),
+                    )
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+                writes += 1
+            else:
+                category = rng.choice(CATEGORIES)
+                connection.execute(
+                    "SELECT id, title, rating_sum, rating_count FROM book WHERE category = ? "
+                    "ORDER BY uploaded_at DESC, id DESC LIMIT 24", (category,),
+                ).fetchall()
+                connection.execute(
+                    "SELECT rating, comment FROM review WHERE book_id = ? ORDER BY created_at DESC LIMIT 10",
+                    (rng.randint(1, books),),
+                ).fetchall()
+                reads += 1
+        except sqlite3.OperationalError:
+            # "database is locked"
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    return reads, writes, errors, latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks a mixed read/write catalog workload on a scratch SQLite file with the "
+        "SQLITE_PRAGMAS tuning off and on, using several processes like a multi-worker deployment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent worker processes (default: 8).")
+        parser.add_argument('--seconds', type=float, default=10, help="Duration of each run (default: 10).")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Fraction of operations that write (default: 0.2).")
+        parser.add_argument('--books', type=int, default=5000, help="Rows in the scratch book table (default: 5000).")
+        parser.add_argument('--mode', choices=['both', 'off', 'on'], default='both', help="Which configuration(s) to run.")
+
+    def handle(self, *args, **options):
+        modes = {'both': [False, True], 'off': [False], 'on': [True]}[options['mode']]
+        for tuned in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self._populate(path, tuned, options['books'])
+                self._run(path, tuned, options)
+
+    def _populate(self, path, tuned, books):
+        connection = _connect(path, tuned)
+        connection.executescript(SCHEMA)
+        now = time.time()
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO book (id, title, category, uploaded_at) VALUES (?, ?, ?, ?)",
+            ((i, f"Book {i}", CATEGORIES[i % len(CATEGORIES)], now - i) for i in range(1, books + 1)),
+        )
+        connection.execute("COMMIT")
+        connection.close()
+
+    def _run(self, path, tuned, options):
+        jobs = [
+            (path, tuned, options['seconds'], options['write_ratio'], options['books'], seed)
+            for seed in range(options['workers'])
+        ]
+        started = time.perf_counter()
+        with multiprocessing.get_context('spawn').Pool(options['workers']) as pool:
+            results = pool.map(_worker, jobs)
+        elapsed = time.perf_counter() - started
+
+        reads = sum(r[0] for r in results)
+        writes = sum(r[1] for r in results)
+        errors = sum(r[2] for r in results)
+        latencies = sorted(latency for r in results for latency in r[3])
+        p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+
+        label = "tuned (SQLITE_PRAGMAS, BEGIN IMMEDIATE)" if tuned else "defaults"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"SQLite {label}"))
+        self.stdout.write(
+            f"  {(reads + writes) / elapsed:.0f} ops/s ({reads} reads, {writes} writes) "
+            f"in {elapsed:.1f}s with {options['workers']} workers"
+        )
+        self.stdout.write(f"  p95 latency {p95 * 1000:.1f} ms")
+        style = self.style.ERROR if errors else self.style.SUCCESS
+        self.stdout.write(style(f"  {errors} 'database is locked' error(s)"))
@@ -0,0 +1,115 @@
+# books/management/commands/build_assets.py
+import os
+import platform
+import shutil
+import stat
+import subprocess
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore import assets
+
+
+def _tailwind_platform():
+    system = {'Linux': 'linux', 'Darwin': 'macos', 'Windows': 'windows'}.get(platform.system())
+    machine = {'x86_64': 'x64', 'amd64': 'x64', 'arm64': 'arm64', 'aarch64': 'arm64'}.get(platform.machine().lower())
+    if system is None or machine is None:
+        raise CommandError(
+            f"No standalone Tailwind CLI for {platform.system()} {platform.machine()}; set TAILWIND_CLI."
+        )
+    return f"{system}-{machine}" + ('.exe' if system == 'windows' else '')
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the static assets into settings.ASSETS_BUILD_DIR: the purged and minified Tailwind "
+        "stylesheet, the vendored pdf.js, Alpine and fonts, and the Font Awesome icon subset. "
+        "Run it before collectstatic (see bookstore/assets.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-vendor', action='store_true', help="Do not fetch the vendored packages, fonts and icons.")
+        parser.add_argument('--skip-css', action='store_true', help="Do not rebuild the Tailwind stylesheet.")
+        parser.add_argument('--refresh', action='store_true', help="Fetch vendored packages again even if they are present.")
+        parser.add_argument('--tailwind', help="Path to the Tailwind CLI (default: settings.TAILWIND_CLI, then a downloaded standalone binary).")
+
+    def handle(self, *args, **options):
+        build_dir = assets.build_dir()
+        build_dir.mkdir(parents=True, exist_ok=True)
+
+        if not options['skip_vendor']:
+            for name, package in assets.VENDOR_PACKAGES.items():
+                try:
+                    fetched = assets.fetch_package(name, package, refresh=options['refresh'])
+                except OSError as e:
+                    raise CommandError(f"Could not fetch {package.npm_name}@{package.version}: {e}")
+                status = f"fetched {package.version}" if fetched else "already present"
+                self.stdout.write(f"vendor/{name}: {status}")
+            self.build_fonts()
+            self.build_icons()
+
+        if not options['skip_css']:
+            self.build_css(options['tailwind'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Assets built in {build_dir}. Run collectstatic to hash and compress them."
+        ))
+
+    def build_fonts(self):
+        target = assets.build_dir() / assets.FONTS_CSS
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(assets.fonts_css())
+        self.stdout.write(f"{assets.FONTS_CSS}: {len(assets.FONT_FACES)} font faces")
+
+    def build_icons(self):
+        directory = assets.build_dir() / 'vendor' / 'fontawesome'
+        icons = assets.used_icons()
+        # The full package stays in .source/, which collectstatic ignores
+        css, codepoints = assets.subset_icon_css((directory / '.source' / 'all.css').read_text(), icons)
+        (directory / 'icons.css').write_text(css)
+        for source in sorted((directory / '.source' / 'webfonts').glob('*.ttf')):
+            assets.subset_font(source, directory / f"{source.stem}.woff2", codepoints)
+        self.stdout.write(f"{assets.ICONS_CSS}: {len(icons)} classes, {len(codepoints)} glyphs")
+
+    def tailwind_cli(self, path=None):
+        path = path or getattr(settings, 'TAILWIND_CLI', None)
+        if path:
+            return path
+        # Cached next to the build output (collectstatic ignores dot-directories), so it is downloaded once per checkout
+        binary = assets.build_dir() / '.bin' / f"tailwindcss-{assets.TAILWIND_VERSION}-{_tailwind_platform()}"
+        if not binary.exists():
+            url = (
+                f"https://github.com/tailwindlabs/tailwindcss/releases/download/"
+                f"v{assets.TAILWIND_VERSION}/tailwindcss-{_tailwind_platform()}"
+            )
+            self.stdout.write(f"Downloading {url}")
+            binary.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with urllib.request.urlopen(url, timeout=120) as response, open(binary, 'wb') as out:
+                    shutil.copyfileobj(response, out)
+            except OSError as e:
+                binary.unlink(missing_ok=True)
+                raise CommandError(f"Could not download the Tailwind CLI: {e}")
+            binary.chmod(binary.stat().st_mode | stat.S_IXUSR)
+        return str(binary)
+
+    def build_css(self, tailwind=None):
+        source = assets.source_dir()
+        output = assets.build_dir() / assets.APP_CSS
+        # Tailwind keeps only the classes found in these files (purge)
+        content = [os.path.join(directory, '**', '*.{html,js}') for directory in assets.content_dirs()]
+        command = [
+            self.tailwind_cli(tailwind),
+            '--config', str(source / 'tailwind.config.js'),
+            '--input', str(source / 'app.css'),
+            '--output', str(output),
+            '--content', ','.join(content),
+            '--minify',
+        ]
+        try:
+            subprocess.run(command, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CommandError(f"Tailwind build failed: {e}")
+        self.stdout.write(f"{assets.APP_CSS}: {output.stat().st_size} bytes")
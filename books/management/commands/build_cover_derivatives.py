@@ -0,0 +1,26 @@
+# books/management/commands/build_cover_derivatives.py
+from django.core.management.base import BaseCommand
+
+from books.covers import build_derivatives
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = "Builds the resized WebP/JPEG cover variants (and cover hashes) for books that have a cover image."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-render variants that already exist.")
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover_image='').exclude(cover_image__isnull=True).only('pk', 'title', 'cover_image', 'cover_hash')
+        written = 0
+        for book in books.iterator():
+            try:
+                had_hash = bool(book.cover_hash)
+                written += build_derivatives(book, force=options['force'])
+                if not had_hash:
+                    Book.objects.filter(pk=book.pk).update(cover_hash=book.cover_hash)
+            except (OSError, ValueError) as e:
+                self.stdout.write(self.style.WARNING(f"Skipping '{book.title}' (id {book.pk}): {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} cover variant(s)."))
@@ -0,0 +1,32 @@
+# books/management/commands/flush_reading_progress.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books import reading
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the reading progress buffered in the cache to the database (see books/reading.py). "
+        "Polls every READING_PROGRESS_FLUSH_INTERVAL seconds; with --once, drains the buffer and exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Flush everything buffered now and exit (e.g. before a cache restart).")
+        parser.add_argument('--interval', type=float, help="Seconds between flushes (default: settings.READING_PROGRESS_FLUSH_INTERVAL).")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            written = reading.flush()
+            self.stdout.write(self.style.SUCCESS(f"{written} reading progress row(s) written."))
+            return
+
+        interval = options['interval'] or getattr(settings, 'READING_PROGRESS_FLUSH_INTERVAL', 10)
+        while True:
+            # Skipped when a request flushed within the interval
+            written = reading.flush_if_due()
+            if written:
+                self.stdout.write(f"{written} reading progress row(s) written.")
+            time.sleep(interval)
@@ -0,0 +1,54 @@
+# books/management/commands/generate_pdf_covers.py
+import hashlib
+
+from django.core.management.base import BaseCommand
+
+from books.covers import build_derivatives, cover_from_first_page
+from books.models import Book
+from books.pdf_render import RenderError, available, local_pdf_path
+
+
+def _sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class Command(BaseCommand):
+    help = "Backfills covers for books without a cover_image by rendering page 1 of their PDF."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=0, help="Process at most this many books (default: all).")
+
+    def handle(self, *args, **options):
+        if not available():
+            self.stderr.write(self.style.ERROR("No PDF renderer available: install pypdfium2 or poppler-utils."))
+            return
+
+        books = (
+            Book.objects.filter(processing_status='ready', cover_image__in=['', None])
+            .exclude(file='')
+            .order_by('pk')
+        )
+        if options['limit']:
+            books = books[:options['limit']]
+
+        done = 0
+        for book in books.iterator():
+            try:
+                file_hash = book.file_hash
+                with local_pdf_path(book.file) as path:
+                    if not file_hash:
+                        # Older rows may predate hashing; the render cache is keyed by content
+                        file_hash = _sha256(path)
+                    book.cover_image.name = cover_from_first_page(file_hash, path)
+                # Book.save() hashes the new cover; then pre-build its variants
+                book.save(update_fields=['cover_image'])
+                build_derivatives(book)
+                done += 1
+            except (RenderError, OSError, ValueError) as e:
+                self.stdout.write(self.style.WARNING(f"Skipping '{book.title}' (id {book.pk}): {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Generated covers for {done} book(s)."))
@@ -0,0 +1,91 @@
+# books/management/commands/import_books.py
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from books.bulk_import import CatalogImport, ManifestError
+
+CHECKPOINT_NAME = '.import_books.checkpoint.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a directory of PDFs described by a CSV or JSON manifest (file, title, author, "
+        "purchase_price, category, description) as ready books of one owner. Files are hashed in a "
+        "process pool, deduplicated against the catalog, copied into storage in parallel and inserted "
+        "in batches; an interrupted import resumes from its checkpoint (see books/bulk_import.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Directory holding the PDFs.")
+        parser.add_argument('--manifest', help="CSV or JSON manifest (default: manifest.csv or manifest.json in the directory).")
+        parser.add_argument('--owner', required=True, help="Username of the seller the books are listed under.")
+        parser.add_argument('--price', help="Purchase price for entries without one.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processes hashing files and rendering covers (default: CPU count).")
+        parser.add_argument('--copy-workers', type=int, default=8, help="Threads copying files into storage (default: 8).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Books inserted per bulk INSERT (default: 500).")
+        parser.add_argument('--checkpoint', help=f"Checkpoint file (default: {CHECKPOINT_NAME} in the directory).")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and start over.")
+        parser.add_argument('--no-covers', action='store_true', help="Do not render covers from page 1.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate, hash and deduplicate, then report without importing.")
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f"{directory} is not a directory.")
+        manifest = options['manifest'] or next(
+            (path for path in (os.path.join(directory, name) for name in ('manifest.csv', 'manifest.json')) if os.path.exists(path)),
+            None,
+        )
+        if manifest is None:
+            raise CommandError("No manifest.csv or manifest.json in the directory; pass --manifest.")
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}.")
+        if min(options['workers'], options['copy_workers'], options['batch_size']) < 1:
+            raise CommandError("--workers, --copy-workers and --batch-size must be at least 1.")
+
+        checkpoint = options['checkpoint'] or os.path.join(directory, CHECKPOINT_NAME)
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        catalog_import = CatalogImport(
+            directory, manifest, owner,
+            checkpoint=checkpoint,
+            price=options['price'],
+            hash_workers=options['workers'],
+            copy_workers=options['copy_workers'],
+            batch_size=options['batch_size'],
+            covers=not options['no_covers'],
+            log=self.stdout.write,
+        )
+        started = time.perf_counter()
+        try:
+            report = catalog_import.run(dry_run=options['dry_run'])
+        except ManifestError as e:
+            raise CommandError(str(e))
+        self.write_report(report, options['dry_run'], time.perf_counter() - started)
+
+    def write_report(self, report, dry_run, elapsed):
+        for entry in report.entries:
+            if entry.status in ('invalid', 'duplicate'):
+                style = self.style.ERROR if entry.status == 'invalid' else self.style.WARNING
+                self.stdout.write(style(f"Entry {entry.number} ({entry.file or '-'}): {entry.status}, {entry.message}"))
+
+        counts = report.counts()
+        if dry_run:
+            new = report.with_status('new')
+            size = sum(entry.size for entry in new)
+            self.stdout.write(self.style.SUCCESS(
+                f"Dry run: {len(new)} book(s) would be imported ({size / 1024 / 1024:.1f} MB), "
+                f"{counts.get('duplicate', 0)} duplicate(s), {counts.get('invalid', 0)} invalid, "
+                f"{counts.get('skipped', 0)} already imported."
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts.get('imported', 0)} book(s) imported in {elapsed:.1f}s; {counts.get('duplicate', 0)} duplicate(s), "
+            f"{counts.get('invalid', 0)} invalid, {counts.get('skipped', 0)} already imported."
+        ))
@@ -0,0 +1,30 @@
+# books/management/commands/prerender_reader_pages.py
+from django.core.management.base import BaseCommand
+
+from books import page_cache
+from books.models import Book
+from books.pdf_render import RenderError, local_pdf_path
+
+
+class Command(BaseCommand):
+    help = "Pre-renders the first reader pages of existing books into the page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=None, help="Pages per book (default: settings.READER_PRERENDER_PAGES).")
+        parser.add_argument('--dpi', type=int, default=None, help="Resolution to render (default: the middle DPI level).")
+
+    def handle(self, *args, **options):
+        if page_cache.pdf_render.pdfium is None:
+            self.stderr.write(self.style.ERROR("Server-rendered pages need pypdfium2."))
+            return
+
+        done = 0
+        for book in Book.objects.filter(processing_status='ready').exclude(file='').order_by('pk').iterator():
+            try:
+                with local_pdf_path(book.file) as path:
+                    page_cache.prerender(book, pdf_path=path, pages=options['pages'], dpi=options['dpi'])
+                done += 1
+            except (RenderError, OSError, ValueError) as e:
+                self.stdout.write(self.style.WARNING(f"Skipping '{book.title}' (id {book.pk}): {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Pre-rendered pages for {done} book(s)."))
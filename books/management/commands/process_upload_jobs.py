@@ -0,0 +1,39 @@
+# books/management/commands/process_upload_jobs.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from books.processing import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Runs the background processing queue for uploaded books (validation, page count, cover, final move)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling forever.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty (default: 2).")
+        parser.add_argument('--max-jobs', type=int, default=0, help="Exit after processing this many jobs (default: no limit).")
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            job_id = claim_next_job()
+            if job_id is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            job = run_job(job_id)
+            processed += 1
+            if job.status == 'done':
+                self.stdout.write(self.style.SUCCESS(f"Processed book {job.book_id}."))
+            elif job.status == 'failed':
+                self.stdout.write(self.style.ERROR(f"Book {job.book_id} failed: {job.error}"))
+            else:
+                self.stdout.write(self.style.WARNING(f"Book {job.book_id} requeued after attempt {job.attempts}: {job.error}"))
+
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(f"{processed} job(s) processed.")
@@ -0,0 +1,22 @@
+# books/management/commands/rebuild_ratings.py
+from django.core.management.base import BaseCommand
+
+from books import catalog_cache
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized rating_sum, rating_count and avg_rating columns on Book from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help="Only rebuild these books (default: all books).")
+
+    def handle(self, *args, **options):
+        queryset = Book.objects.all()
+        if options['book_ids']:
+            queryset = queryset.filter(pk__in=options['book_ids'])
+
+        updated = Book.rebuild_rating_aggregates(queryset)
+        # The bulk UPDATE sends no signals, so drop the cached pages showing ratings
+        catalog_cache.bump_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} book(s)."))
@@ -0,0 +1,14 @@
+# books/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from books.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Reinstalls the catalog search triggers and rebuilds the SQLite FTS5 index from the books table."
+
+    def handle(self, *args, **options):
+        if rebuild_index():
+            self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
+        else:
+            self.stdout.write(self.style.WARNING("FTS5 is not available on this database; search uses the icontains fallback."))
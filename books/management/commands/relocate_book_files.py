@@ -0,0 +1,118 @@
+# books/management/commands/relocate_book_files.py
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from books import catalog_cache
+from books.models import Book
+from books.storage import book_storage, content_name, file_digest, is_content_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves book PDFs stored under their upload names (book_pdfs/<name>.pdf) to content-addressed "
+        "names in the book storage (book_pdfs/ab/cd/<sha256>.pdf, see books/storage.py). Files are "
+        "hashed and copied by parallel workers; each book row is updated only if it still points at "
+        "the old name, and the old file is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Files hashed and copied at once (default: 8).")
+        parser.add_argument(
+            '--from-storage', default='default',
+            help="STORAGES alias the files are stored in now (default: 'default', i.e. MEDIA_ROOT).",
+        )
+        parser.add_argument('--keep-old', action='store_true', help="Leave the old files in place.")
+        parser.add_argument('--dry-run', action='store_true', help="Hash the files and report the new names without moving anything.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        try:
+            self.source = storages[options['from_storage']]
+        except Exception as e:
+            raise CommandError(f"Unknown storage {options['from_storage']!r}: {e}")
+        self.target = book_storage()
+        self.dry_run = options['dry_run']
+
+        rows = (
+            (pk, name, file_hash)
+            for pk, name, file_hash in Book.objects.exclude(file='').order_by('pk')
+            .values_list('pk', 'file', 'file_hash').iterator(chunk_size=2000)
+            if not is_content_name(name)
+        )
+        counts = {'moved': 0, 'failed': 0, 'skipped': 0}
+        # Bounded so millions of rows never become millions of pending futures
+        max_pending = options['workers'] * 4
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            pending = set()
+            for row in rows:
+                pending.add(executor.submit(self.copy_file, *row))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.finish(done, counts, options['keep_old'])
+            self.finish(pending, counts, options['keep_old'])
+
+        if counts['moved'] and not self.dry_run:
+            # Cached book pages hold the old file names
+            catalog_cache.bump_all()
+        verb = "would be moved" if self.dry_run else "moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['moved']} file(s) {verb}, {counts['skipped']} skipped, {counts['failed']} failed."
+        ))
+        if counts['failed']:
+            raise CommandError(f"{counts['failed']} file(s) could not be relocated; see the errors above.")
+
+    def copy_file(self, pk, old_name, file_hash):
+        """
+        Runs in a worker: hashes the old file and stores it under its content
+        name. Returns (pk, old_name, new_name, digest, error).
+        """
+        try:
+            with self.source.open(old_name, 'rb') as content:
+                digest = file_digest(content)
+                if file_hash and file_hash != digest:
+                    return pk, old_name, None, digest, f"content hash {digest} does not match file_hash {file_hash}"
+                new_name = content_name(old_name, digest)
+                if not self.dry_run:
+                    content.sha256 = digest
+                    new_name = self.target.save(old_name, content)
+        except Exception as e:
+            return pk, old_name, None, None, str(e) or type(e).__name__
+        return pk, old_name, new_name, digest, None
+
+    def finish(self, futures, counts, keep_old):
+        # Database writes stay on the main thread (one connection, no SQLite lock contention)
+        for future in futures:
+            pk, old_name, new_name, digest, error = future.result()
+            if error:
+                counts['failed'] += 1
+                self.stderr.write(f"Book {pk} ({old_name}): {error}")
+                continue
+            if self.dry_run:
+                counts['moved'] += 1
+                self.stdout.write(f"Book {pk}: {old_name} -> {new_name}")
+                continue
+
+            # Only if the row still points at the file we copied
+            books = Book.objects.filter(pk=pk, file=old_name)
+            try:
+                with transaction.atomic():
+                    updated = books.filter(file_hash__isnull=True).update(file=new_name, file_hash=digest)
+            except IntegrityError:
+                # Another book already claims this hash: share the stored file, leave the hash empty
+                updated = 0
+            if not updated:
+                updated = books.update(file=new_name)
+            if not updated:
+                counts['skipped'] += 1
+                self.stdout.write(self.style.WARNING(f"Book {pk} changed during the move; left as it is."))
+                continue
+
+            counts['moved'] += 1
+            if not keep_old and old_name != new_name:
+                self.source.delete(old_name)
+            if counts['moved'] % 1000 == 0:
+                self.stdout.write(f"{counts['moved']} file(s) moved...")
@@ -0,0 +1,140 @@
+# books/management/commands/replay_payment_events.py
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from requests.adapters import HTTPAdapter
+
+from books.models import PaymentEvent
+from books.payments import sign_webhook_body
+
+
+def _load_file(path):
+    """
+    Reads a JSONL batch: each line is {"event_id": ..., "body": <event>} or a bare event.
+    """
+    events = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise CommandError(f"{path}:{line_number}: {e}")
+            if 'body' in record:
+                body = record['body']
+                event_id = record.get('event_id')
+            else:
+                body, event_id = record, None
+            if not isinstance(body, str):
+                body = json.dumps(body, separators=(',', ':'))
+            events.append((event_id, body.encode()))
+    return events
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a batch of Razorpay webhook events against the webhook endpoint at a target rate, "
+        "signing each body with RAZORPAY_WEBHOOK_SECRET. Use it to load-test payment confirmation."
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--file', help="JSONL file of events to replay.")
+        source.add_argument('--from-db', action='store_true', help="Replay the events stored in PaymentEvent.")
+        source.add_argument('--export', metavar='FILE', help="Write the stored events to a JSONL file and exit.")
+        parser.add_argument('--url', default='http://127.0.0.1:8000/books/payment/webhook/', help="Webhook URL.")
+        parser.add_argument('--concurrency', type=int, default=32, help="Parallel requests (default: 32).")
+        parser.add_argument('--rate', type=float, default=0, help="Requests per second (default: as fast as possible).")
+        parser.add_argument('--repeat', type=int, default=1, help="Send every event this many times, to exercise deduplication.")
+        parser.add_argument('--limit', type=int, default=0, help="Replay at most this many events.")
+
+    def handle(self, *args, **options):
+        if options['export']:
+            return self._export(options['export'])
+
+        if options['file']:
+            events = _load_file(options['file'])
+        else:
+            events = [
+                (event_id, payload.encode())
+                for event_id, payload in PaymentEvent.objects.order_by('pk').values_list('event_id', 'payload')
+            ]
+        if options['limit']:
+            events = events[:options['limit']]
+        if not events:
+            raise CommandError("No events to replay.")
+
+        # Interleave repeats so duplicates of one event are in flight together
+        batch = [event for _ in range(options['repeat']) for event in events]
+        signed = [(event_id, body, sign_webhook_body(body)) for event_id, body in batch]
+
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_maxsize=options['concurrency']))
+        session.mount('https://', HTTPAdapter(pool_maxsize=options['concurrency']))
+
+        statuses = Counter()
+        outcomes = Counter()
+        latencies = []
+        lock = threading.Lock()
+        rate = options['rate']
+        start = time.perf_counter()
+
+        def send(index):
+            event_id, body, signature = signed[index]
+            if rate:
+                # Open-loop schedule: request i is due at start + i / rate
+                delay = start + index / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            headers = {'Content-Type': 'application/json', 'X-Razorpay-Signature': signature}
+            if event_id:
+                headers['X-Razorpay-Event-Id'] = event_id
+            sent = time.perf_counter()
+            try:
+                response = session.post(options['url'], data=body, headers=headers, timeout=30)
+                status = response.status_code
+                try:
+                    outcome = response.json().get('outcome', '-')
+                except ValueError:
+                    outcome = '-'
+            except requests.RequestException as e:
+                status, outcome = type(e).__name__, '-'
+            with lock:
+                latencies.append(time.perf_counter() - sent)
+                statuses[status] += 1
+                outcomes[outcome] += 1
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(send, range(len(signed))))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        self.stdout.write(f"Sent {len(signed)} request(s) in {elapsed:.2f}s ({len(signed) / elapsed:.1f} req/s)")
+        self.stdout.write(f"Status codes: {dict(statuses)}")
+        self.stdout.write(f"Outcomes: {dict(outcomes)}")
+        self.stdout.write(
+            "Latency p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms".format(
+                *(1000 * _percentile(latencies, p) for p in (0.5, 0.95, 0.99))
+            )
+        )
+
+    def _export(self, path):
+        count = 0
+        with open(path, 'w') as f:
+            for event_id, payload in PaymentEvent.objects.order_by('pk').values_list('event_id', 'payload').iterator():
+                f.write(json.dumps({'event_id': event_id, 'body': payload}) + '\n')
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} event(s) to {path}."))
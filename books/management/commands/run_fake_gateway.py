@@ -0,0 +1,83 @@
+# books/management/commands/run_fake_gateway.py
+import json
+import random
+import secrets
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+def make_handler(latency, jitter, failure_rate, stdout):
+    class FakeGatewayHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real gateway
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                payload = None
+
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            if self.path.rstrip('/') != '/v1/orders':
+                return self._send_json(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Unknown endpoint'}})
+            if not isinstance(payload, dict) or not payload.get('amount'):
+                return self._send_json(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'amount is required'}})
+            if random.random() < failure_rate:
+                return self._send_json(503, {'error': {'code': 'SERVER_ERROR', 'description': 'Simulated outage'}})
+
+            self._send_json(200, {
+                'id': f"order_fake{secrets.token_hex(7)}",
+                'entity': 'order',
+                'amount': payload['amount'],
+                'amount_paid': 0,
+                'amount_due': payload['amount'],
+                'currency': payload.get('currency', 'INR'),
+                'receipt': payload.get('receipt'),
+                'status': 'created',
+                'attempts': 0,
+                'created_at': int(time.time()),
+            })
+
+        def log_message(self, format, *args):
+            stdout.write(format % args)
+
+    return FakeGatewayHandler
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the Razorpay orders API, for offline checkout load tests. "
+        "Set RAZORPAY_API_BASE=http://127.0.0.1:<port>/v1 to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765, help="Port to listen on (default: 8765).")
+        parser.add_argument('--latency', type=float, default=0.2, help="Mean response delay in seconds (default: 0.2).")
+        parser.add_argument('--jitter', type=float, default=0.05, help="Random +/- delay in seconds (default: 0.05).")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of requests answered with 503 (default: 0).")
+
+    def handle(self, *args, **options):
+        handler = make_handler(options['latency'], options['jitter'], options['failure_rate'], self.stdout)
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), handler)
+        server.daemon_threads = True
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake gateway listening on http://127.0.0.1:{options['port']}/v1 "
+            f"(latency {options['latency']}s, failure rate {options['failure_rate']:.0%})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:39
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    for book in Book.objects.annotate(
+        computed_sum=Sum('reviews__rating'),
+        computed_count=Count('reviews'),
+        computed_avg=Avg('reviews__rating'),
+    ).iterator():
+        Book.objects.filter(pk=book.pk).update(
+            rating_sum=book.computed_sum or 0,
+            rating_count=book.computed_count or 0,
+            avg_rating=book.computed_avg or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_book_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
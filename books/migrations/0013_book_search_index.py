@@ -0,0 +1,27 @@
+# Creates the SQLite FTS5 index used by books/search.py
+
+from django.db import migrations
+
+from books.search import install_index, uninstall_index
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends use the icontains fallback in books/search.py
+    if install_index(schema_editor.connection):
+        # Index the books that already exist
+        schema_editor.execute("INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_book_list_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
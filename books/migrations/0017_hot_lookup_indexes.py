@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_paid_purchases(apps, schema_editor):
+    # Refuse to guess which of two captured payments to keep; those need a refund first
+    Order = apps.get_model('books', 'Order')
+    duplicates = list(
+        Order.objects.filter(status='paid', order_type='purchase')
+        .values('user_id', 'book_id').annotate(n=Count('id')).filter(n__gt=1)[:20]
+    )
+    if duplicates:
+        pairs = ', '.join(f"user {d['user_id']}/book {d['book_id']}" for d in duplicates)
+        raise RuntimeError(
+            f"Cannot add order_one_paid_purchase: several paid purchases exist for {pairs}. "
+            "Refund the extra payments and mark those orders 'failed', then migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_payment_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['owner', '-uploaded_at'], name='book_owner_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_type', 'purchase'), ('status', 'paid')), fields=['user', '-paid_at'], name='order_paid_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_type', 'purchase'), ('status', 'paid')), fields=['book', '-created_at'], name='order_paid_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-created_at'], name='review_book_created_idx'),
+        ),
+        migrations.RunPython(check_duplicate_paid_purchases, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('order_type', 'purchase'), ('status', 'paid')), fields=('user', 'book'), name='order_one_paid_purchase'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_categories(apps, schema_editor):
+    """
+    Creates a Category for every distinct Book.category, merging spellings
+    that differ only in case or spacing into the most used one, and fills in
+    the counts of ready books.
+    """
+    Book = apps.get_model('books', 'Book')
+    Category = apps.get_model('books', 'Category')
+    spellings = Book.objects.values('category').annotate(n=Count('id')).order_by('-n', 'category')
+    canonical = {}
+    for row in spellings:
+        name = ' '.join(row['category'].split())
+        if not name:
+            continue
+        key = name.casefold()
+        if key not in canonical:
+            canonical[key] = Category.objects.create(name=name, key=key)
+        if row['category'] != canonical[key].name:
+            Book.objects.filter(category=row['category']).update(category=canonical[key].name)
+    for category in canonical.values():
+        category.book_count = Book.objects.filter(category=category.name, processing_status='ready').count()
+        category.save(update_fields=['book_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('book_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+                'indexes': [models.Index(condition=models.Q(('book_count__gt', 0)), fields=['name'], name='category_name_idx')],
+            },
+        ),
+        migrations.RunPython(populate_categories, migrations.RunPython.noop),
+    ]
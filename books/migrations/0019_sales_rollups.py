@@ -0,0 +1,81 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    # Same buckets as books.analytics.rebuild() (the backfill_sales_rollups command)
+    Order = apps.get_model('books', 'Order')
+    BookDailySales = apps.get_model('books', 'BookDailySales')
+    SellerDailySales = apps.get_model('books', 'SellerDailySales')
+    buckets = (
+        Order.objects.filter(status='paid', order_type='purchase')
+        .annotate(day=TruncDate(Coalesce('paid_at', 'created_at')))
+        .values('book_id', 'book__owner_id', 'day')
+        .annotate(revenue=Sum('amount'), units=Count('id'))
+        .order_by()
+    )
+    book_rows = []
+    seller_totals = {}
+    for bucket in buckets:
+        key = (bucket['book__owner_id'], bucket['day'])
+        book_rows.append(BookDailySales(
+            book_id=bucket['book_id'], seller_id=key[0], day=key[1],
+            revenue=bucket['revenue'], units=bucket['units'],
+        ))
+        revenue, units = seller_totals.get(key, (0, 0))
+        seller_totals[key] = (revenue + bucket['revenue'], units + bucket['units'])
+    BookDailySales.objects.bulk_create(book_rows, batch_size=1000)
+    SellerDailySales.objects.bulk_create(
+        [
+            SellerDailySales(seller_id=seller_id, day=day, revenue=revenue, units=units)
+            for (seller_id, day), (revenue, units) in seller_totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_categories'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='books.book')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='book_daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'book daily sales',
+                'indexes': [models.Index(fields=['seller', 'book'], name='book_sales_seller_book_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'day'), name='book_sales_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SellerDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'seller daily sales',
+                'constraints': [models.UniqueConstraint(fields=('seller', 'day'), name='seller_sales_day_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
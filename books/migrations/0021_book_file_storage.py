@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:30
+
+import books.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0020_review_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='file',
+            field=models.FileField(storage=books.storage.book_storage, upload_to='book_pdfs/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf'])]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0022_reading_progress_bookmarks'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookprocessingjob',
+            name='job_status_created_idx',
+        ),
+        migrations.AddField(
+            model_name='bookprocessingjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='bookprocessingjob',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='job_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookprocessingjob',
+            index=models.Index(fields=['status', 'started_at'], name='job_status_started_idx'),
+        ),
+    ]
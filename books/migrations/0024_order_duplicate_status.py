@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0023_processing_job_retries'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('failed', 'Failed'), ('duplicate', 'Duplicate payment')], default='pending', max_length=10),
+        ),
+    ]
@@ -4,31 +4,211 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 from django.utils import timezone
-from django.db.models import Avg
+from django.db import transaction
+from django.db.models import Avg, Count, Sum, Case, When, F, Value, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from .covers import hash_cover
+from .storage import book_storage
+
+# Marker for a field that was deferred when the instance was loaded
+_DEFERRED = object()
+
+
+# Catalog category, with a count of its ready books for the catalog filter.
+# Book.category stores the category's name, so the search index and the
+# (category, uploaded_at, id) index keep working on the book row itself.
+class Category(models.Model):
+    name = models.CharField(max_length=100)
+    # Case-folded, whitespace-collapsed name: "Fine Arts" and "fine  arts" are one category
+    key = models.CharField(max_length=100, unique=True)
+    # Maintained by Book.save() and the post_delete handler in books/signals.py
+    book_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'categories'
+        indexes = [
+            # Catalog filter dropdown: non-empty categories by name
+            models.Index(fields=['name'], name='category_name_idx', condition=models.Q(book_count__gt=0)),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def make_key(name):
+        return ' '.join(name.split()).casefold()
+
+    @classmethod
+    def canonical_name(cls, name):
+        """
+        Returns the stored spelling of name's category, creating the category
+        the first time a spelling with that key is seen.
+        """
+        name = ' '.join(name.split())
+        if not name:
+            return name
+        category, _ = cls.objects.get_or_create(key=cls.make_key(name), defaults={'name': name})
+        return category.name
+
+    @classmethod
+    def adjust_count(cls, name, delta):
+        if name:
+            cls.objects.filter(key=cls.make_key(name)).update(book_count=Greatest(F('book_count') + delta, 0))
+
+    @classmethod
+    def rebuild_counts(cls):
+        """
+        Recomputes book_count from the books table, e.g. after a queryset
+        update() of Book.category. Returns the number of categories updated.
+        """
+        books = Book.objects.filter(category=OuterRef('name'), processing_status='ready').order_by().values('category')
+        return cls.objects.update(
+            book_count=Coalesce(Subquery(books.annotate(total=Count('pk')).values('total')), 0),
+        )
 
 
 class Book(models.Model):
+    PROCESSING_STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200)
     description = models.TextField(help_text="A brief description of the book.", default='')
-    category = models.CharField(max_length=100, default='Others')
-    file = models.FileField(upload_to='book_pdfs/', validators=[FileExtensionValidator(allowed_extensions=['pdf'])])
+    category = models.CharField(max_length=100, default='Others') # A Category's name, normalized by save()
+    # Stored as book_pdfs/ab/cd/<file_hash>.pdf (books/storage.py)
+    file = models.FileField(upload_to='book_pdfs/', storage=book_storage, validators=[FileExtensionValidator(allowed_extensions=['pdf'])])
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_books')
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
+    # SHA-256 of cover_image; names the resized variants in books/covers.py
+    cover_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
 
     file_hash = models.CharField(max_length=64, unique=True, blank=True, null=True) # Using SHA-256, length 64
 
+    # Set by the background upload pipeline (books/processing.py)
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUS_CHOICES, default='ready')
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+
+    # Denormalized rating aggregates, maintained by Review.save() and the
+    # post_delete handler in books/signals.py so pages never aggregate reviews
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # Back the keyset pagination of the catalog (see books/pagination.py)
+            models.Index(fields=['-uploaded_at', '-id'], name='book_uploaded_id_idx'),
+            models.Index(fields=['category', '-uploaded_at', '-id'], name='book_cat_uploaded_id_idx'),
+            # Seller dashboard: a user's uploads, newest first
+            models.Index(fields=['owner', '-uploaded_at'], name='book_owner_uploaded_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored cover so save() can tell when it changes
+        instance._stored_cover_name = instance.__dict__.get('cover_image', _DEFERRED)
+        # ...and which category count it is part of
+        instance._stored_category = instance.__dict__.get('category', _DEFERRED)
+        instance._stored_processing_status = instance.__dict__.get('processing_status', _DEFERRED)
+        return instance
+
+    def _stored_counted_category(self):
+        # The category whose book_count includes this book as stored, or None
+        if self._state.adding:
+            return None
+        category = getattr(self, '_stored_category', _DEFERRED)
+        status = getattr(self, '_stored_processing_status', _DEFERRED)
+        if category is _DEFERRED or status is _DEFERRED:
+            # Loaded with the fields deferred: read them from the row
+            row = Book.objects.filter(pk=self.pk).values_list('category', 'processing_status').first()
+            if row is None:
+                return None
+            category, status = row
+        return category if status == 'ready' else None
+
+    def save(self, *args, **kwargs):
+        stored_cover_name = getattr(self, '_stored_cover_name', None)
+        update_fields = kwargs.get('update_fields')
+        # Category.book_count counts ready books; skip saves that cannot change it
+        counts_category = update_fields is None or not {'category', 'processing_status'}.isdisjoint(update_fields)
+        # One transaction, so on_commit cache invalidation (books/signals.py) sees the new cover_hash too
+        with transaction.atomic():
+            if counts_category:
+                counted_before = self._stored_counted_category()
+                self.category = Category.canonical_name(self.category)
+            super().save(*args, **kwargs)
+            if counts_category:
+                counted_after = self.category if self.processing_status == 'ready' else None
+                if counted_after != counted_before:
+                    Category.adjust_count(counted_before, -1)
+                    Category.adjust_count(counted_after, 1)
+                self._stored_category = self.category
+                self._stored_processing_status = self.processing_status
+            if stored_cover_name is _DEFERRED or 'cover_image' not in self.__dict__:
+                return
+            if self.cover_image.name != stored_cover_name:
+                # New or replaced cover: rehash so its derivatives get fresh names
+                new_hash = hash_cover(self) if self.cover_image else ''
+                if new_hash != self.cover_hash:
+                    self.cover_hash = new_hash
+                    Book.objects.filter(pk=self.pk).update(cover_hash=new_hash)
+        self._stored_cover_name = self.cover_image.name
+
+    @property
+    def is_ready(self):
+        # False while the uploaded PDF is still being processed (or if processing failed)
+        return self.processing_status == 'ready'
+
     # Property to get the average rating
     @property
     def average_rating(self):
-        # Calculate the average of ratings for this book's reviews
-        # Use aggregate and Avg, default to 0 if no reviews
-        return self.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+        # Read the maintained column instead of aggregating reviews per call
+        return self.avg_rating
+
+    @staticmethod
+    def adjust_rating(book_id, sum_delta, count_delta):
+        """
+        Applies a change to a book's rating aggregates in a single UPDATE.
+        The new average is derived from the same row values, so concurrent
+        reviews cannot leave the three columns out of step.
+        """
+        new_sum = F('rating_sum') + sum_delta
+        new_count = F('rating_count') + count_delta
+        Book.objects.filter(pk=book_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            avg_rating=Case(
+                When(rating_count__lte=-count_delta, then=Value(0.0)),
+                default=Cast(new_sum, FloatField()) / Cast(new_count, FloatField()),
+                output_field=FloatField(),
+            ),
+        )
+
+    @staticmethod
+    def rebuild_rating_aggregates(queryset=None):
+        """
+        Recomputes rating_sum/rating_count/avg_rating from the reviews table.
+        Returns the number of books updated.
+        """
+        queryset = Book.objects.all() if queryset is None else queryset
+        reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        return queryset.update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+            avg_rating=Coalesce(
+                Subquery(reviews.annotate(total=Avg(Cast('rating', FloatField()))).values('total')),
+                Value(0.0),
+            ),
+        )
 
 
 class Order(models.Model):
@@ -40,22 +220,99 @@ class Order(models.Model):
         ('pending', 'Pending'),
         ('paid', 'Paid'),
         ('failed', 'Failed'),
+        # Paid for a book the user already owns (see books/payments.py); the payment needs a refund
+        ('duplicate', 'Duplicate payment'),
     ]
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='orders')
     order_type = models.CharField(max_length=10, choices=ORDER_TYPE_CHOICES)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
+    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True, db_index=True) # Payment callbacks and webhooks update by this
     razorpay_payment_id = models.CharField(max_length=100, blank=True, null=True)
     razorpay_signature = models.CharField(max_length=200, blank=True, null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     paid_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        # Nearly every read is of paid purchases, so the indexes only cover those rows
+        indexes = [
+            # Entitlements and the profile page: a user's purchases, newest first
+            models.Index(
+                fields=['user', '-paid_at'], name='order_paid_user_idx',
+                condition=models.Q(status='paid', order_type='purchase'),
+            ),
+            # Seller dashboard and earnings: paid purchases of a seller's books
+            models.Index(
+                fields=['book', '-created_at'], name='order_paid_book_idx',
+                condition=models.Q(status='paid', order_type='purchase'),
+            ),
+        ]
+        constraints = [
+            # A user pays for a book once; a second capture is refused (see books/payments.py)
+            models.UniqueConstraint(
+                fields=['user', 'book'], name='order_one_paid_purchase',
+                condition=models.Q(status='paid', order_type='purchase'),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.order_type} for {self.book.title} by {self.user.username} - {self.status}"
 
 
+# Daily sales rollups for the seller dashboard, maintained by books/analytics.py
+# when an order turns paid, so the dashboard never aggregates orders
+class SellerDailySales(models.Model):
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'seller daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'day'], name='seller_sales_day_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.seller.username} on {self.day}: ₹{self.revenue} ({self.units})"
+
+
+class BookDailySales(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_sales')
+    # The book's owner, so a seller's top books need no join
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='book_daily_sales')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'book daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'day'], name='book_sales_day_unique'),
+        ]
+        indexes = [
+            # Seller dashboard: top books over a seller's rollup rows
+            models.Index(fields=['seller', 'book'], name='book_sales_seller_book_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book.title} on {self.day}: ₹{self.revenue} ({self.units})"
+
+
+# Razorpay webhook event, recorded once per event ID (see books/payments.py)
+class PaymentEvent(models.Model):
+    event_id = models.CharField(max_length=100, unique=True) # Unique constraint makes redelivered events no-ops
+    event_type = models.CharField(max_length=50)
+    razorpay_order_id = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    payload = models.TextField(help_text="Raw request body, as signed by Razorpay.")
+    outcome = models.CharField(max_length=20, blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id}) - {self.outcome}"
+
+
 # Review Model
 class Review(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
@@ -68,6 +325,108 @@ class Review(models.Model):
         # Ensure a user can only leave one review per book
         unique_together = ('book', 'user')
         ordering = ['-created_at'] # Order reviews by newest first
+        indexes = [
+            # Book detail review feed, newest first / highest rated first
+            # (id breaks ties, for keyset pagination in books/pagination.py)
+            models.Index(fields=['book', '-created_at', '-id'], name='review_book_created_idx'),
+            models.Index(fields=['book', '-rating', '-created_at', '-id'], name='review_book_rating_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.username} for {self.book.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save() can apply only the difference
+        instance._stored_rating = instance.__dict__.get('rating')
+        instance._stored_book_id = instance.__dict__.get('book_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep Book's rating aggregates in the same transaction as the review row
+        with transaction.atomic():
+            is_new = self._state.adding
+            super().save(*args, **kwargs)
+            stored_rating = getattr(self, '_stored_rating', None)
+            stored_book_id = getattr(self, '_stored_book_id', None)
+            if is_new:
+                Book.adjust_rating(self.book_id, self.rating, 1)
+            elif stored_rating is None:
+                # Loaded with rating deferred, so the old value is unknown
+                Book.rebuild_rating_aggregates(Book.objects.filter(pk__in={stored_book_id, self.book_id}))
+            elif stored_book_id != self.book_id:
+                Book.adjust_rating(stored_book_id, -stored_rating, -1)
+                Book.adjust_rating(self.book_id, self.rating, 1)
+            elif stored_rating != self.rating:
+                Book.adjust_rating(self.book_id, self.rating - stored_rating, 0)
+        self._stored_rating = self.rating
+        self._stored_book_id = self.book_id
+
+
+# Background job for a freshly uploaded book (see books/processing.py)
+class BookProcessingJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='processing_jobs')
+    staged_path = models.CharField(max_length=500, help_text="Absolute path of the staged upload.")
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # A queued job is not claimed before this time (retries back off exponentially)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Workers poll for the queued job that has been due longest,
+            # and for running jobs whose worker stopped (by started_at)
+            models.Index(fields=['status', 'next_attempt_at'], name='job_status_due_idx'),
+            models.Index(fields=['status', 'started_at'], name='job_status_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"Processing job for {self.book.title} - {self.status}"
+
+
+# Last page a user read in a book. Readers report their page every few seconds;
+# books/reading.py buffers the reports in the cache and upserts them here in bulk
+class ReadingProgress(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_progress')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reading_progress')
+    page = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(help_text="When the reader reported the page (not when it was flushed).")
+
+    class Meta:
+        verbose_name_plural = 'reading progress'
+        constraints = [
+            # The conflict target of the bulk upsert
+            models.UniqueConstraint(fields=['user', 'book'], name='reading_progress_user_book_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} on page {self.page} of {self.book.title}"
+
+
+class Bookmark(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookmarks')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='bookmarks')
+    page = models.PositiveIntegerField()
+    label = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # One bookmark per page; also serves the reader's (user, book) lookup
+            models.UniqueConstraint(fields=['user', 'book', 'page'], name='bookmark_user_book_page_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.book.title}, page {self.page}"
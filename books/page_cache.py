@@ -0,0 +1,167 @@
+# books/page_cache.py
+"""
+Per-page raster cache for the server-rendered reader mode.
+
+Pages are rendered once with books/pdf_render.py and stored on disk under
+settings.READER_PAGE_CACHE_DIR/<hash[:2]>/<file_hash>/<dpi>/<page>.webp,
+next to a manifest.json holding the page count and page sizes. Entries are
+keyed by Book.file_hash, so they stay valid for as long as the file exists
+and identical files share them. Rendering a page costs the same whatever the
+size of the PDF, so the reader's time to first page no longer depends on it.
+When the book storage has no local paths (BOOK_STORAGE=s3), the PDF is
+downloaded once into the same directory (source.pdf) and reused by later
+renders.
+"""
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import pdf_render
+from .pdf_render import local_pdf_path
+
+PAGE_FORMAT = 'webp'
+PAGE_QUALITY = 80
+
+
+def dpi_levels():
+    return tuple(getattr(settings, 'READER_PAGE_DPI_LEVELS', (72, 110, 150)))
+
+
+def _book_dir(book):
+    key = book.file_hash or f"book-{book.pk}"
+    return os.path.join(os.fspath(settings.READER_PAGE_CACHE_DIR), key[:2], key)
+
+
+def _atomic_write(path, data):
+    """
+    Writes via a temp file and rename so readers never see a partial file,
+    even when two workers render the same page at once.
+    """
+    _atomic_write_chunks(path, [data])
+
+
+def _atomic_write_chunks(path, chunks):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def source_pdf(book):
+    """
+    Yields a local path of the book's PDF. A storage without local paths is
+    downloaded once per file hash and kept next to the rendered pages, so a
+    cache miss renders one page without fetching the whole PDF again.
+    """
+    try:
+        local_path = book.file.path
+    except NotImplementedError:
+        local_path = None
+    if local_path:
+        yield local_path
+        return
+    if not book.file_hash:
+        # No stable key to keep the copy under
+        with local_pdf_path(book.file) as path:
+            yield path
+        return
+
+    path = os.path.join(_book_dir(book), 'source.pdf')
+    if not os.path.exists(path):
+        with book.file.open('rb') as src:
+            _atomic_write_chunks(path, src.chunks())
+    yield path
+
+
+def get_manifest(book, pdf_path=None):
+    """
+    Returns {'page_count': int, 'page_sizes': [[width_pt, height_pt], ...]},
+    reading the PDF only the first time.
+    """
+    manifest_path = os.path.join(_book_dir(book), 'manifest.json')
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    if pdf_render.pdfium is None:
+        raise pdf_render.RenderError("Page manifests need pypdfium2.")
+
+    def read_sizes(path):
+        pdf = pdf_render.pdfium.PdfDocument(path)
+        try:
+            return [list(pdf.get_page_size(index)) for index in range(len(pdf))]
+        finally:
+            pdf.close()
+
+    if pdf_path:
+        sizes = read_sizes(pdf_path)
+    else:
+        with source_pdf(book) as path:
+            sizes = read_sizes(path)
+
+    manifest = {'page_count': len(sizes), 'page_sizes': sizes}
+    _atomic_write(manifest_path, json.dumps(manifest).encode())
+    return manifest
+
+
+def page_path(book, page_number, dpi):
+    return os.path.join(_book_dir(book), str(dpi), f"{page_number}.{PAGE_FORMAT}")
+
+
+def get_page(book, page_number, dpi, pdf_path=None):
+    """
+    Returns the path of a cached page raster, rendering it first if needed.
+    Raises ValueError for an unsupported dpi or page number.
+    """
+    if dpi not in dpi_levels():
+        raise ValueError(f"Unsupported dpi {dpi}")
+    path = page_path(book, page_number, dpi)
+    if os.path.exists(path):
+        return path
+
+    manifest = get_manifest(book, pdf_path)
+    if not 1 <= page_number <= manifest['page_count']:
+        raise ValueError(f"Page {page_number} out of range")
+
+    def render(source):
+        from io import BytesIO
+
+        image = pdf_render.render_page(source, page_number, dpi=dpi)
+        buffer = BytesIO()
+        image.save(buffer, format=PAGE_FORMAT.upper(), quality=PAGE_QUALITY, method=4)
+        return buffer.getvalue()
+
+    if pdf_path:
+        data = render(pdf_path)
+    else:
+        with source_pdf(book) as source:
+            data = render(source)
+    _atomic_write(path, data)
+    return path
+
+
+def prerender(book, pdf_path=None, pages=None, dpi=None):
+    """
+    Renders the first `pages` pages (settings.READER_PRERENDER_PAGES by
+    default) so the first open of a book is served straight from the cache.
+    """
+    pages = getattr(settings, 'READER_PRERENDER_PAGES', 3) if pages is None else pages
+    dpi = dpi or dpi_levels()[len(dpi_levels()) // 2]
+    manifest = get_manifest(book, pdf_path)
+    for page_number in range(1, min(pages, manifest['page_count']) + 1):
+        get_page(book, page_number, dpi, pdf_path)
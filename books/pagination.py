@@ -0,0 +1,163 @@
+# books/pagination.py
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a ?cursor= value cannot be decoded."""
+
+
+# Review orderings accepted by review_page(); each matches an index on Review
+REVIEW_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'rating': ('-rating', '-created_at', '-id'),
+}
+
+
+def _encode(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+
+
+def _decode_id(value):
+    # Beyond a 64-bit key the database would reject the comparison (500 on PostgreSQL)
+    pk = int(value)
+    if not 0 < pk < 2 ** 63:
+        raise ValueError("Cursor id out of range")
+    return pk
+
+
+def encode_cursor(book):
+    """
+    Builds an opaque cursor from the sort key (uploaded_at, id) of the last
+    book on a page.
+    """
+    return _encode(book.uploaded_at.isoformat(), book.pk)
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (uploaded_at, id) pair stored in a cursor.
+    """
+    try:
+        uploaded_at, pk = _decode(cursor)
+        return datetime.fromisoformat(uploaded_at), _decode_id(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def encode_review_cursor(review, sort):
+    """
+    Builds a cursor from the sort key (rating, created_at, id) of the last
+    review on a page. The sort is part of it, so it cannot be reused with another.
+    """
+    return _encode(sort, review.rating, review.created_at.isoformat(), review.pk)
+
+
+def decode_review_cursor(cursor, sort):
+    """
+    Returns the (rating, created_at, id) stored in a review cursor for `sort`.
+    """
+    try:
+        cursor_sort, rating, created_at, pk = _decode(cursor)
+        if cursor_sort != sort:
+            raise ValueError("Cursor belongs to another sort order")
+        return int(rating), datetime.fromisoformat(created_at), _decode_id(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def encode_order_cursor(order):
+    """
+    Builds a cursor from the sort key (created_at, id) of the last order on a page.
+    """
+    return _encode(order.created_at.isoformat(), order.pk)
+
+
+def decode_order_cursor(cursor):
+    """
+    Returns the (created_at, id) pair stored in an order cursor.
+    """
+    try:
+        created_at, pk = _decode(cursor)
+        return datetime.fromisoformat(created_at), _decode_id(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(queryset, cursor=None, page_size=24):
+    """
+    Returns one page of books newest first plus the cursor for the next page.
+
+    Seeks past the cursor with WHERE (uploaded_at, id) < (…) instead of
+    OFFSET, so every page is a bounded range scan of the
+    (uploaded_at, id) / (category, uploaded_at, id) indexes on Book.
+    """
+    queryset = queryset.order_by('-uploaded_at', '-id')
+    if cursor:
+        uploaded_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk)
+        )
+
+    # Fetch one extra row to learn whether another page exists
+    rows = list(queryset[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(rows[-1]) if has_next else None
+    return rows, next_cursor
+
+
+def review_page(queryset, sort='newest', cursor=None, page_size=10):
+    """
+    Returns one page of reviews in one of the REVIEW_SORTS orders plus the
+    cursor for the next page.
+
+    Like keyset_page(), seeks past the cursor instead of using OFFSET, so a
+    book's later pages are bounded range scans of review_book_created_idx
+    (newest) or review_book_rating_idx (rating).
+    """
+    queryset = queryset.order_by(*REVIEW_SORTS[sort])
+    if cursor:
+        rating, created_at, pk = decode_review_cursor(cursor, sort)
+        after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        if sort == 'rating':
+            after = Q(rating__lt=rating) | (Q(rating=rating) & after)
+        queryset = queryset.filter(after)
+
+    # Fetch one extra row to learn whether another page exists
+    rows = list(queryset[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_review_cursor(rows[-1], sort) if has_next else None
+    return rows, next_cursor
+
+
+def order_page(queryset, cursor=None, page_size=25):
+    """
+    Returns one page of orders newest first plus the cursor for the next page.
+
+    Like keyset_page(), seeks past the cursor instead of using OFFSET, so the
+    seller dashboard's older pages cost the same as the first.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_order_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    # Fetch one extra row to learn whether another page exists
+    rows = list(queryset[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_order_cursor(rows[-1]) if has_next else None
+    return rows, next_cursor
@@ -0,0 +1,363 @@
+# books/payments.py
+"""
+Razorpay order creation over a pooled HTTP session.
+
+create_order_view used to call the Razorpay SDK synchronously with no
+timeout, so a slow gateway held a worker for as long as it liked. Calls
+here go through one shared requests.Session (connection pooling and
+keep-alive), with connect/read timeouts, retries with exponential backoff
+and jitter, and a circuit breaker that fails fast while the gateway is down.
+
+acreate_order() is the async entry point used by the view: each HTTP
+attempt runs in a worker thread and backoff waits use asyncio.sleep, so
+under ASGI a slow gateway never blocks the event loop.
+
+For offline load tests, point settings.RAZORPAY_API_BASE at
+`manage.py run_fake_gateway`.
+
+The second half of the module confirms payments. Both the browser callback
+and the server-to-server webhook flip an order to paid with one conditional
+UPDATE, so concurrent or repeated deliveries cannot apply it twice. Webhook
+events are also recorded by event ID, which makes redeliveries no-ops.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from . import analytics
+from .entitlements import invalidate_entitlements
+from .models import Order, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limiting and gateway-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PaymentGatewayError(Exception):
+    """
+    Raised when the gateway rejects a request or cannot be reached.
+    """
+
+
+class DuplicatePurchase(Exception):
+    """
+    Raised when a payment is confirmed for a book the user already paid for
+    (the order_one_paid_purchase constraint). The gateway worked, so this is
+    not a PaymentGatewayError. The extra payment needs a refund.
+    """
+
+
+class GatewayUnavailable(PaymentGatewayError):
+    """
+    Raised without calling the gateway while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    State is per process.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            # A trial that never reported back (e.g. a cancelled request) expires
+            trial_expired = time.monotonic() - self._trial_started >= self.reset_timeout
+            if state == 'half-open' and (not self._trial_in_flight or trial_expired):
+                self._trial_in_flight = True
+                self._trial_started = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_in_flight:
+                    logger.warning("Payment gateway circuit opened after %s failure(s).", self.failures)
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+breaker = CircuitBreaker(
+    failure_threshold=getattr(settings, 'PAYMENT_GATEWAY_FAILURE_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'PAYMENT_GATEWAY_RESET_TIMEOUT', 30),
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the process-wide pooled session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                pool_size = getattr(settings, 'PAYMENT_GATEWAY_POOL_SIZE', 20)
+                # Retries are handled in _call() so they can back off without holding a thread
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.auth = (settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+                session.headers['User-Agent'] = 'BookStore/1.0'
+                _session = session
+    return _session
+
+
+class _Retryable(Exception):
+    pass
+
+
+def _attempt(path, payload):
+    """
+    Makes one POST to the gateway and returns the decoded JSON body.
+    Raises _Retryable for timeouts, connection errors and RETRY_STATUSES,
+    PaymentGatewayError for any other error response.
+    """
+    url = settings.RAZORPAY_API_BASE.rstrip('/') + path
+    timeout = (
+        getattr(settings, 'PAYMENT_GATEWAY_CONNECT_TIMEOUT', 3.05),
+        getattr(settings, 'PAYMENT_GATEWAY_READ_TIMEOUT', 10),
+    )
+    try:
+        response = get_session().post(url, json=payload, timeout=timeout)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        # A read timeout may mean the order was created anyway; an unused
+        # Razorpay order is harmless (it expires unpaid), so retrying is safe.
+        raise _Retryable(str(e)) from e
+
+    if response.status_code in RETRY_STATUSES:
+        raise _Retryable(f"HTTP {response.status_code}")
+    try:
+        body = response.json()
+    except ValueError:
+        raise PaymentGatewayError(f"Invalid response from payment gateway (HTTP {response.status_code}).")
+    if response.status_code >= 400:
+        description = (body.get('error') or {}).get('description') or f"HTTP {response.status_code}"
+        raise PaymentGatewayError(description)
+    return body
+
+
+def _backoff(attempt):
+    base = getattr(settings, 'PAYMENT_GATEWAY_BACKOFF', 0.5)
+    delay = base * (2 ** attempt)
+    return delay + random.uniform(0, delay / 2)
+
+
+def _before_call():
+    if not breaker.allow():
+        raise GatewayUnavailable("Payment service is temporarily unavailable.")
+
+
+def _after_failure(error):
+    breaker.record_failure()
+    raise PaymentGatewayError(f"Payment gateway did not respond: {error}") from error
+
+
+def _order_payload(amount, currency, receipt):
+    return {
+        'amount': amount,
+        'currency': currency,
+        'receipt': receipt,
+        'payment_capture': 1,  # Auto-capture payment upon successful transaction
+    }
+
+
+async def acreate_order(amount, currency, receipt):
+    """
+    Creates a Razorpay order and returns its JSON (with 'id').
+    `amount` is in the smallest currency unit (paise). The HTTP call runs in
+    a thread; backoff waits do not.
+    """
+    _before_call()
+    payload = _order_payload(amount, currency, receipt)
+    retries = getattr(settings, 'PAYMENT_GATEWAY_MAX_RETRIES', 2)
+    attempt_async = sync_to_async(_attempt, thread_sensitive=False)
+    for attempt in range(retries + 1):
+        try:
+            order = await attempt_async('/orders', payload)
+        except _Retryable as e:
+            if attempt == retries:
+                _after_failure(e)
+            await asyncio.sleep(_backoff(attempt))
+        except PaymentGatewayError:
+            # The gateway answered: it is up, the request was rejected
+            breaker.record_success()
+            raise
+        else:
+            breaker.record_success()
+            return order
+
+
+# --- Payment confirmation ---
+
+# Webhook events that confirm or fail a payment; everything else is only recorded
+PAID_EVENTS = {'payment.captured', 'order.paid'}
+FAILED_EVENTS = {'payment.failed'}
+
+
+def _invalidate_buyer(razorpay_order_id):
+    # QuerySet.update() sends no post_save, so bump the buyer's entitlements here
+    for user_id in Order.objects.filter(razorpay_order_id=razorpay_order_id).values_list('user_id', flat=True):
+        transaction.on_commit(lambda user_id=user_id: invalidate_entitlements(user_id))
+
+
+def mark_order_paid(razorpay_order_id, payment_id, signature=None, from_statuses=('pending',)):
+    """
+    Marks the order paid with a single conditional UPDATE.
+    Returns True if this call made the change, False if the order was already
+    paid (or is not in `from_statuses`), so only one of several concurrent
+    confirmations does the work. Raises DuplicatePurchase if the user already
+    has another paid order for the same book, after marking this one 'duplicate'.
+    """
+    try:
+        # Savepoint, so a constraint violation leaves the caller's transaction usable
+        with transaction.atomic():
+            updated = Order.objects.filter(
+                razorpay_order_id=razorpay_order_id, status__in=from_statuses,
+            ).update(
+                status='paid',
+                razorpay_payment_id=payment_id,
+                razorpay_signature=signature,
+                paid_at=timezone.now(),
+            )
+            if updated:
+                # Same transaction, so the seller's sales rollups count each payment exactly once
+                paid = Order.objects.filter(razorpay_order_id=razorpay_order_id, status='paid', order_type='purchase')
+                for order in paid.select_related('book'):
+                    analytics.record_sale(order)
+    except IntegrityError:
+        logger.error("Duplicate paid purchase for Razorpay order %s (payment %s); refund required.", razorpay_order_id, payment_id)
+        # Close the order, keeping the payment ID for the refund, so it is not left looking open
+        Order.objects.filter(razorpay_order_id=razorpay_order_id, status__in=from_statuses).update(
+            status='duplicate',
+            razorpay_payment_id=payment_id,
+            razorpay_signature=signature,
+        )
+        raise DuplicatePurchase("This book has already been paid for.")
+    if updated:
+        _invalidate_buyer(razorpay_order_id)
+    return bool(updated)
+
+
+def mark_order_failed(razorpay_order_id):
+    """
+    Marks a still-pending order failed. Never touches a paid order.
+    """
+    return bool(Order.objects.filter(razorpay_order_id=razorpay_order_id, status='pending').update(status='failed'))
+
+
+def verify_webhook_signature(body, signature):
+    """
+    Checks the X-Razorpay-Signature header: hex HMAC-SHA256 of the raw body
+    keyed with settings.RAZORPAY_WEBHOOK_SECRET.
+    """
+    secret = getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', '')
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def sign_webhook_body(body):
+    """
+    Returns the signature Razorpay would send for `body` (used by the replay tool).
+    """
+    return hmac.new(settings.RAZORPAY_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _event_order_and_payment(event):
+    payload = event.get('payload') or {}
+    payment = (payload.get('payment') or {}).get('entity') or {}
+    order = (payload.get('order') or {}).get('entity') or {}
+    return payment.get('order_id') or order.get('id') or '', payment.get('id')
+
+
+def process_webhook_event(body, event_id=None):
+    """
+    Applies one verified webhook body. Returns the outcome recorded for it:
+    'duplicate' (event ID seen before), 'paid', 'failed', 'noop' (the order
+    was already in its final state or is unknown), 'duplicate_purchase' (the
+    user had already paid for the book) or 'ignored' (other events).
+    Raises ValueError for a body that is not a JSON event.
+    """
+    event = json.loads(body)
+    if not isinstance(event, dict) or not event.get('event'):
+        raise ValueError("Not a Razorpay event.")
+    event_type = event['event']
+    razorpay_order_id, payment_id = _event_order_and_payment(event)
+    # Razorpay sends X-Razorpay-Event-Id; fall back to the body hash for replays without it
+    event_id = event_id or hashlib.sha256(body).hexdigest()
+
+    with transaction.atomic():
+        try:
+            # Insert first: the unique event_id makes a concurrent redelivery fail here.
+            # Own savepoint, so only this insert's IntegrityError means 'duplicate';
+            # any other propagates and the webhook answers 5xx for a redelivery.
+            with transaction.atomic():
+                payment_event = PaymentEvent.objects.create(
+                    event_id=event_id,
+                    event_type=event_type,
+                    razorpay_order_id=razorpay_order_id,
+                    payload=body.decode(),
+                )
+        except IntegrityError:
+            return 'duplicate'
+        if event_type in PAID_EVENTS and razorpay_order_id:
+            # The gateway is authoritative: a captured payment also overrides
+            # a 'failed' set by an earlier callback
+            try:
+                changed = mark_order_paid(razorpay_order_id, payment_id, from_statuses=('pending', 'failed'))
+                outcome = 'paid' if changed else 'noop'
+            except DuplicatePurchase:
+                outcome = 'duplicate_purchase'
+        elif event_type in FAILED_EVENTS and razorpay_order_id:
+            outcome = 'failed' if mark_order_failed(razorpay_order_id) else 'noop'
+        else:
+            outcome = 'ignored'
+        PaymentEvent.objects.filter(pk=payment_event.pk).update(outcome=outcome)
+    return outcome
@@ -0,0 +1,135 @@
+# books/pdf_render.py
+"""
+CPU-only rasterisation of PDF pages with Pillow output.
+
+Uses pypdfium2 (a self-contained PDFium wheel, listed in requirements.txt)
+and falls back to poppler's `pdftoppm` command if the module is not
+installed. Neither needs a GPU, a display or network access.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+# PDF user space is 72 units per inch
+PDF_POINTS_PER_INCH = 72
+
+RENDER_TIMEOUT = 60  # seconds allowed for one pdftoppm call
+
+
+class RenderError(Exception):
+    """The page could not be rendered by any available backend."""
+
+
+def available():
+    return pdfium is not None or shutil.which('pdftoppm') is not None
+
+
+def render_page(path, page_number=1, width=None, dpi=None):
+    """
+    Renders one page (1-based) of the PDF at `path` to a Pillow RGB image.
+    Give either a target pixel `width` or a `dpi`; the default is 96 dpi.
+    """
+    if pdfium is not None:
+        try:
+            return _render_pdfium(path, page_number, width, dpi)
+        except pdfium.PdfiumError as e:
+            # Only PDFium's own failures (e.g. a file it cannot parse) go to
+            # pdftoppm; a RenderError such as a page out of range is final.
+            logger.warning("pdfium could not render page %s of %s: %s", page_number, path, e)
+    if shutil.which('pdftoppm'):
+        return _render_pdftoppm(path, page_number, width, dpi)
+    raise RenderError("No PDF renderer available (install pypdfium2 or poppler-utils).")
+
+
+def page_count(path):
+    """
+    Number of pages according to the renderer, or None if unavailable.
+    """
+    if pdfium is None:
+        return None
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _render_pdfium(path, page_number, width, dpi):
+    pdf = pdfium.PdfDocument(path)
+    try:
+        if not 1 <= page_number <= len(pdf):
+            raise RenderError(f"Page {page_number} out of range")
+        page = pdf[page_number - 1]
+        try:
+            if width:
+                scale = width / page.get_width()
+            else:
+                scale = (dpi or 96) / PDF_POINTS_PER_INCH
+            bitmap = page.render(scale=scale)
+            return bitmap.to_pil().convert('RGB')
+        finally:
+            page.close()
+    finally:
+        pdf.close()
+
+
+def _render_pdftoppm(path, page_number, width, dpi):
+    from PIL import Image
+
+    with _temp_dir() as out_dir:
+        prefix = os.path.join(out_dir, 'page')
+        command = ['pdftoppm', '-png', '-singlefile', '-f', str(page_number), '-l', str(page_number)]
+        if width:
+            command += ['-scale-to-x', str(width), '-scale-to-y', '-1']
+        else:
+            command += ['-r', str(dpi or 96)]
+        command += [path, prefix]
+        try:
+            subprocess.run(command, check=True, capture_output=True, timeout=RENDER_TIMEOUT)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            raise RenderError(f"pdftoppm failed: {e}") from e
+        with Image.open(prefix + '.png') as image:
+            return image.convert('RGB')
+
+
+@contextmanager
+def _temp_dir():
+    path = tempfile.mkdtemp(prefix='pdf_render_')
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def local_pdf_path(field_file):
+    """
+    Yields a filesystem path for a FieldFile, downloading it to a temporary
+    file when the storage backend has no local paths.
+    """
+    try:
+        local_path = field_file.path
+    except NotImplementedError:
+        local_path = None
+    if local_path:
+        yield local_path
+        return
+
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as out, field_file.open('rb') as src:
+            for chunk in src.chunks():
+                out.write(chunk)
+        yield path
+    finally:
+        os.remove(path)
@@ -0,0 +1,321 @@
+# books/processing.py
+"""
+Background processing for uploaded books.
+
+upload_book_view saves the Book with processing_status='processing' and
+queues a BookProcessingJob pointing at the staged upload. A worker
+(`manage.py process_upload_jobs`) claims jobs from the database and runs
+PIPELINE_STEPS: PDF validation, page counting, cover generation, reader page
+pre-rendering and the final move of the file into storage. No external broker is involved; claiming uses
+a conditional UPDATE, so several workers can poll the same table safely.
+Failed attempts are retried after an exponentially growing delay, and a job
+left 'running' by a worker that died is claimed again once it goes stale.
+"""
+import logging
+import os
+import re
+import textwrap
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .covers import build_derivatives, cover_from_first_page
+from . import page_cache, pdf_render
+from .pdf_render import RenderError
+from .models import Book, BookProcessingJob
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingError(Exception):
+    """A permanent problem with an upload (retrying will not help)."""
+
+
+class StagedFile(File):
+    """
+    File wrapper exposing temporary_file_path(), so the book storage moves
+    the staged upload into place instead of copying it, and the upload's
+    SHA-256 (.sha256), which names the stored file (books/storage.py).
+    """
+
+    def __init__(self, path, name, sha256=None):
+        super().__init__(open(path, 'rb'), name=name)
+        self._path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self._path
+
+
+# --- Pipeline steps: each takes (job, book, path) ---
+
+def validate_pdf(job, book, path):
+    """
+    Checks that the staged file is a complete PDF (header and EOF marker).
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        raise ProcessingError("The uploaded file is empty.")
+    with open(path, 'rb') as f:
+        header = f.read(1024)
+        f.seek(max(size - 2048, 0))
+        trailer = f.read()
+    if b'%PDF-' not in header:
+        raise ProcessingError("The uploaded file is not a PDF.")
+    if b'%%EOF' not in trailer:
+        raise ProcessingError("The uploaded PDF is truncated or corrupt.")
+
+
+_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+
+def count_pages(path):
+    """
+    Returns the number of pages in a PDF, or None if it cannot be determined.
+    Uses pypdf or pypdfium2 when installed; otherwise counts /Type /Page objects, which
+    works for PDFs whose page objects are not inside compressed object streams.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+
+    if PdfReader is not None:
+        try:
+            return len(PdfReader(path).pages)
+        except Exception:
+            logger.warning("pypdf could not read %s, falling back to scanning", path)
+
+    try:
+        count = pdf_render.page_count(path)
+        if count:
+            return count
+    except Exception:
+        logger.warning("pdfium could not read %s, falling back to scanning", path)
+
+    count = 0
+    tail = b''
+    overlap = 64  # longer than any marker, so one split across chunks is seen whole
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            data = tail + chunk
+            cut = max(len(data) - overlap, 0)
+            # Count markers starting before the cut; the rest are rescanned with the next chunk
+            count += sum(1 for match in _PAGE_RE.finditer(data) if match.start() < cut)
+            tail = data[cut:]
+    count += len(_PAGE_RE.findall(tail))
+    return count or None
+
+
+def extract_page_count(job, book, path):
+    book.page_count = count_pages(path)
+
+
+def generate_cover(job, book, path):
+    """
+    Gives books uploaded without a cover one rendered from the first PDF page
+    (cached by file hash), or a generated title card if the page cannot be
+    rendered, so the catalog never shows an empty placeholder.
+    """
+    if book.cover_image:
+        return
+    if book.file_hash:
+        try:
+            book.cover_image.name = cover_from_first_page(book.file_hash, path)
+            return
+        except (RenderError, OSError) as e:
+            logger.warning("Could not render a cover from page 1 of book %s: %s", book.pk, e)
+    book.cover_image.save(f"cover_{book.pk}.png", ContentFile(render_title_card(book.title, book.author)), save=False)
+
+
+def render_title_card(title, author, size=(600, 900)):
+    """
+    Renders a plain typographic cover (PNG bytes) with Pillow.
+    """
+    from io import BytesIO
+
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new('RGB', size, '#1E293B')  # slate
+    draw = ImageDraw.Draw(image)
+    try:
+        title_font = ImageFont.load_default(size=56)
+        author_font = ImageFont.load_default(size=32)
+    except TypeError:
+        # Pillow < 10.1 has no sized default font
+        title_font = author_font = ImageFont.load_default()
+
+    draw.rectangle([40, 40, size[0] - 40, size[1] - 40], outline='#D4AF37', width=6)  # gold frame
+    y = 160
+    for line in textwrap.wrap(title, width=16)[:6]:
+        draw.text((size[0] // 2, y), line, fill='#FEF8EC', font=title_font, anchor='mt')
+        y += 72
+    draw.text((size[0] // 2, size[1] - 160), author[:40], fill='#D4AF37', font=author_font, anchor='mt')
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def build_cover_derivatives(job, book, path):
+    """
+    Pre-renders the resized WebP/JPEG cover variants used by the catalog.
+    """
+    build_derivatives(book)
+
+
+def prerender_pages(job, book, path):
+    """
+    Renders the first few reader pages into the page cache, so the first
+    server-rendered open does not wait on a render. Failures are not fatal:
+    pages are rendered on demand anyway.
+    """
+    if not getattr(settings, 'READER_PRERENDER_PAGES', 0):
+        return
+    try:
+        page_cache.prerender(book, pdf_path=path)
+    except (RenderError, OSError) as e:
+        logger.warning("Could not pre-render reader pages for book %s: %s", book.pk, e)
+
+
+def store_file(job, book, path):
+    """
+    Moves the staged PDF into the Book.file storage, named after its content hash.
+    """
+    book.file.save(job.original_name, StagedFile(path, job.original_name, sha256=book.file_hash), save=False)
+    book.file.close()
+
+
+PIPELINE_STEPS = [
+    validate_pdf,
+    extract_page_count,
+    generate_cover,
+    build_cover_derivatives,
+    prerender_pages,
+    store_file,
+]
+
+
+# --- Queue operations ---
+
+def enqueue(book, staged_path, original_name):
+    """
+    Queues processing for a just-saved book. With settings.BOOK_PROCESSING_EAGER
+    the job runs in-process once the surrounding transaction commits.
+    """
+    job = BookProcessingJob.objects.create(book=book, staged_path=staged_path, original_name=original_name)
+    if getattr(settings, 'BOOK_PROCESSING_EAGER', False):
+        transaction.on_commit(lambda: _claim(job.pk, Q(status='queued')) and run_job(job.pk))
+    return job
+
+
+def _claim(job_id, condition):
+    # Conditional UPDATE: only one worker's claim can match the row
+    return BookProcessingJob.objects.filter(condition, id=job_id).update(
+        status='running', started_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+
+
+def claim_next_job():
+    """
+    Atomically claims the queued job that has been due longest, or else a
+    'running' job whose worker stopped more than
+    settings.BOOK_PROCESSING_STALE_AFTER seconds ago. Returns its id, or None
+    if there is nothing to do. A job is only returned to the worker whose
+    UPDATE flipped it to a fresh 'running' state.
+    """
+    now = timezone.now()
+    stale_after = getattr(settings, 'BOOK_PROCESSING_STALE_AFTER', 1800)
+    claimable = [
+        (False, Q(status='queued', next_attempt_at__lte=now), ('next_attempt_at', 'id')),
+        (True, Q(status='running', started_at__lt=now - timedelta(seconds=stale_after)), ('started_at', 'id')),
+    ]
+    for stale, condition, ordering in claimable:
+        while True:
+            job_id = (
+                BookProcessingJob.objects.filter(condition)
+                .order_by(*ordering)
+                .values_list('id', flat=True)
+                .first()
+            )
+            if job_id is None:
+                break
+            if _claim(job_id, condition):
+                if stale:
+                    logger.warning("Reclaimed processing job %s from a worker that stopped", job_id)
+                return job_id
+            # Another worker won the race; try the next job
+    return None
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before retrying a job that failed `attempts` times:
+    settings.BOOK_PROCESSING_RETRY_DELAY, doubled after every attempt.
+    """
+    base = getattr(settings, 'BOOK_PROCESSING_RETRY_DELAY', 30)
+    return base * 2 ** max(attempts - 1, 0)
+
+
+def run_job(job_id):
+    """
+    Runs the pipeline for a job claimed by claim_next_job() and records the
+    outcome on the job and book. Transient errors are retried, with a growing
+    delay, up to settings.BOOK_PROCESSING_MAX_ATTEMPTS.
+    """
+    job = BookProcessingJob.objects.select_related('book').get(pk=job_id)
+    book = job.book
+    path = job.staged_path
+    max_attempts = getattr(settings, 'BOOK_PROCESSING_MAX_ATTEMPTS', 3)
+
+    try:
+        if job.attempts > max_attempts:
+            # Every attempt so far stopped its worker (e.g. a PDF that exhausts memory)
+            raise ProcessingError("Processing did not finish after repeated attempts.")
+        if not os.path.exists(path):
+            raise ProcessingError("The staged upload is missing.")
+        for step in PIPELINE_STEPS:
+            step(job, book, path)
+    except Exception as e:
+        permanent = isinstance(e, ProcessingError)
+        job.error = str(e)
+        if permanent or job.attempts >= max_attempts:
+            logger.warning("Processing failed for book %s: %s", book.pk, e)
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+            # Drop whatever the steps set on the instance, then save() so the
+            # post_save handlers refresh the catalog cache and entitlements
+            book.refresh_from_db()
+            book.processing_status = 'failed'
+            book.save(update_fields=['processing_status'])
+            _remove(path)
+        else:
+            delay = retry_delay(job.attempts)
+            logger.info("Processing attempt %s failed for book %s, retrying in %ss: %s", job.attempts, book.pk, delay, e)
+            job.status = 'queued'
+            job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['status', 'error', 'finished_at', 'next_attempt_at'])
+        return job
+
+    book.processing_status = 'ready'
+    book.save(update_fields=['file', 'cover_image', 'cover_hash', 'page_count', 'processing_status'])
+    # store_file moved the upload away; clean up if a copy was left behind
+    _remove(path)
+
+    job.status = 'done'
+    job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,193 @@
+# books/reading.py
+"""
+Reading progress with write-behind batching.
+
+The readers report the current page every few seconds
+(settings.READING_PROGRESS_REPORT_INTERVAL). A report never touches the
+database; record_progress() only writes to the cache:
+
+- reading:progress:<user>:<book> holds the latest (page, timestamp). Pages
+  read progress from here first, so a report is visible at once, on any
+  device;
+- the first report for a (user, book) pair since the last flush also appends
+  the pair to a log (reading:log:<n>, numbered by an incremented counter) and
+  sets a reading:queued marker, so a reader sending a page every few seconds
+  adds one log entry per flush, not one per report.
+
+flush() reads the new log entries, drops their markers, and upserts the
+latest values of those pairs into ReadingProgress with one bulk INSERT ...
+ON CONFLICT UPDATE per batch. It runs at most once per
+settings.READING_PROGRESS_FLUSH_INTERVAL: piggybacked on the report that
+finds the flush lock free (READING_PROGRESS_INLINE_FLUSH), and/or from
+`manage.py flush_reading_progress`, which can poll or drain the buffer.
+
+The cache is not durable: a report still buffered when its entries are
+evicted is lost, but the next report from that reader queues the pair again.
+Markers expire after a few intervals, so a log entry lost in a race is
+retried the same way.
+
+The buffer needs a cache shared by the processes involved. With LocMemCache
+(the default) it lives in each web process: `manage.py flush_reading_progress`
+sees an empty buffer, and whatever a process has not flushed yet (up to one
+flush interval) is lost when it restarts. Only the inline flush works there,
+so check_cache_backend() warns when it is turned off.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.module_loading import import_string
+
+from .models import Book, ReadingProgress
+
+SEQUENCE_KEY = 'reading:log:sequence'
+FLUSHED_KEY = 'reading:log:flushed'
+FLUSH_LOCK_KEY = 'reading:flush:lock'
+
+# Cached for a book the user has no progress in, so unread books cost no query either
+NO_PROGRESS = (0, 0)
+
+
+def _progress_key(user_id, book_id):
+    return f"reading:progress:{user_id}:{book_id}"
+
+
+def _queued_key(user_id, book_id):
+    return f"reading:queued:{user_id}:{book_id}"
+
+
+def _log_key(sequence):
+    return f"reading:log:{sequence}"
+
+
+def _timeout():
+    return getattr(settings, 'READING_PROGRESS_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _flush_interval():
+    return getattr(settings, 'READING_PROGRESS_FLUSH_INTERVAL', 10)
+
+
+@checks.register(checks.Tags.caches)
+def check_cache_backend(app_configs, **kwargs):
+    """
+    Warns when buffered reports could only be flushed by a process that cannot see them.
+    """
+    backend = import_string(settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'])
+    if issubclass(backend, LocMemCache) and not getattr(settings, 'READING_PROGRESS_INLINE_FLUSH', True):
+        return [checks.Warning(
+            "Reading progress is buffered in a per-process cache, but READING_PROGRESS_INLINE_FLUSH is off.",
+            hint=(
+                "manage.py flush_reading_progress cannot see another process's LocMemCache, so buffered "
+                "reports are never written. Use a shared cache (CACHE_BACKEND=redis) or the inline flush."
+            ),
+            id='books.W001',
+        )]
+    return []
+
+
+def _next_sequence():
+    cache.add(SEQUENCE_KEY, 0, None)
+    try:
+        return cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        # Evicted between add() and incr(): start again
+        cache.add(SEQUENCE_KEY, 0, None)
+        return cache.incr(SEQUENCE_KEY)
+
+
+def record_progress(user_id, book_id, page):
+    """
+    Buffers a reader's current page. Returns nothing; the database row is
+    written by the next flush().
+    """
+    cache.set(_progress_key(user_id, book_id), (page, time.time()), _timeout())
+    # Queue the pair once per flush, however often the reader reports
+    if cache.add(_queued_key(user_id, book_id), 1, max(_flush_interval() * 6, 60)):
+        cache.set(_log_key(_next_sequence()), (user_id, book_id), _timeout())
+    if getattr(settings, 'READING_PROGRESS_INLINE_FLUSH', True):
+        flush_if_due()
+
+
+def flush_if_due():
+    """
+    Flushes the buffer unless another process did so within the flush interval.
+    Returns the number of rows written, or None if no flush was due.
+    """
+    # The lock expires by itself: it doubles as the timer
+    if not cache.add(FLUSH_LOCK_KEY, 1, _flush_interval()):
+        return None
+    return flush()
+
+
+def flush(batch_size=None):
+    """
+    Upserts every buffered report into ReadingProgress. Returns the number of rows written.
+    """
+    batch_size = batch_size or getattr(settings, 'READING_PROGRESS_FLUSH_BATCH', 1000)
+    written = 0
+    while True:
+        flushed = cache.get(FLUSHED_KEY, 0)
+        last = min(cache.get(SEQUENCE_KEY, 0), flushed + batch_size)
+        if last <= flushed:
+            return written
+        log_keys = [_log_key(sequence) for sequence in range(flushed + 1, last + 1)]
+        pairs = set(cache.get_many(log_keys).values())
+        # Reports from now on queue their pair again, for the next flush
+        cache.delete_many([_queued_key(user_id, book_id) for user_id, book_id in pairs])
+        written += _upsert(pairs)
+        cache.set(FLUSHED_KEY, last, None)
+        cache.delete_many(log_keys)
+
+
+def _upsert(pairs):
+    if not pairs:
+        return 0
+    values = cache.get_many([_progress_key(user_id, book_id) for user_id, book_id in pairs])
+    # Skip users and books deleted since the report
+    user_ids = set(User.objects.filter(pk__in={user_id for user_id, _ in pairs}).values_list('pk', flat=True))
+    book_ids = set(Book.objects.filter(pk__in={book_id for _, book_id in pairs}).values_list('pk', flat=True))
+    rows = []
+    for user_id, book_id in pairs:
+        page, reported_at = values.get(_progress_key(user_id, book_id), NO_PROGRESS)
+        if page and user_id in user_ids and book_id in book_ids:
+            rows.append(ReadingProgress(
+                user_id=user_id, book_id=book_id, page=page,
+                updated_at=datetime.fromtimestamp(reported_at, tz=dt_timezone.utc),
+            ))
+    ReadingProgress.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'book'],
+        update_fields=['page', 'updated_at'],
+    )
+    return len(rows)
+
+
+def get_progress(user_id, book_ids):
+    """
+    Returns {book_id: page} for the books the user has started. One cache
+    round trip; the books missing from the cache cost a single query together.
+    """
+    keys = {_progress_key(user_id, book_id): book_id for book_id in book_ids}
+    cached = cache.get_many(keys)
+    pages = {keys[key]: page for key, (page, _) in cached.items() if page}
+    missing = [book_id for key, book_id in keys.items() if key not in cached]
+    if missing:
+        stored = {
+            book_id: (page, updated_at.timestamp())
+            for book_id, page, updated_at in ReadingProgress.objects.filter(
+                user_id=user_id, book_id__in=missing,
+            ).values_list('book_id', 'page', 'updated_at')
+        }
+        for book_id in missing:
+            value = stored.get(book_id, NO_PROGRESS)
+            if value[0]:
+                pages[book_id] = value[0]
+            # add(), not set(): a report that arrived meanwhile is newer
+            cache.add(_progress_key(user_id, book_id), value, _timeout())
+    return pages
@@ -0,0 +1,246 @@
+# books/search.py
+"""
+Catalog search backed by an SQLite FTS5 index over Book.
+
+The books_book_fts table is an external-content FTS5 index on books_book
+(title, author, description, category). install_index() (run by migration 0013) creates it together
+with AFTER INSERT/UPDATE/DELETE triggers, so the index follows every Book
+write, including queryset.update() and cascaded deletes. On databases other
+than SQLite (or an SQLite build without FTS5) search falls back to
+icontains filtering.
+"""
+import re
+
+from django.db import connection, OperationalError
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'books_book_fts'
+
+# Column weights passed to bm25(): title, author, description, category
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+# Sentinels wrapped around matches by snippet(); swapped for <mark> after escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Database aliases already known to have the FTS5 table
+_fts_aliases = set()
+
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, description, category,
+        content='books_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, description, category)
+        VALUES (new.id, new.title, new.author, new.description, new.category);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description, category)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.category);
+    END
+    """,
+    # Only reindex when a searchable column changes, not on rating aggregate updates
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author, description, category ON books_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description, category)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, description, category)
+        VALUES (new.id, new.title, new.author, new.description, new.category);
+    END
+    """,
+]
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def install_index(conn=None):
+    """
+    Creates the FTS5 table and its sync triggers if they are missing (SQLite only).
+    Safe to re-run, e.g. after a migration rebuilds books_book and drops its triggers.
+    """
+    conn = connection if conn is None else conn
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        with conn.cursor() as cursor:
+            for statement in CREATE_SQL:
+                cursor.execute(statement)
+    except OperationalError:
+        # SQLite built without FTS5: search keeps using the icontains fallback
+        return False
+    return True
+
+
+def uninstall_index(conn=None):
+    conn = connection if conn is None else conn
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        for statement in DROP_SQL:
+            cursor.execute(statement)
+    return True
+
+
+def ensure_index(conn=None):
+    """
+    Reinstalls the sync triggers and rebuilds the index if any trigger is missing.
+
+    SQLite migrations that alter books_book recreate the table, which silently
+    drops its triggers; BooksConfig runs this after every migrate.
+    """
+    conn = connection if conn is None else conn
+    if conn.vendor != 'sqlite' or FTS_TABLE not in conn.introspection.table_names():
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'books_book'"
+        )
+        installed = {row[0] for row in cursor.fetchall()}
+    if installed >= {f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'}:
+        return False
+    install_index(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def fts_available(conn=None):
+    """
+    True when the current database has the FTS5 index installed.
+    """
+    conn = connection if conn is None else conn
+    if conn.vendor != 'sqlite':
+        return False
+    if conn.alias not in _fts_aliases and FTS_TABLE in conn.introspection.table_names():
+        # Remember the positive answer so searches skip the sqlite_master lookup
+        _fts_aliases.add(conn.alias)
+    return conn.alias in _fts_aliases
+
+
+def build_match_query(query):
+    """
+    Turns free text into an FTS5 MATCH expression.
+    Every word must match, and the last word is treated as a prefix so
+    results appear while the user is still typing. Words are quoted, so
+    FTS5 operators in user input are never interpreted.
+    """
+    tokens = _TOKEN_RE.findall(query or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    return ' '.join(terms)
+
+
+def _highlight(text):
+    return mark_safe(
+        escape(text).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    )
+
+
+def search_books(query, limit=20, offset=0):
+    """
+    Returns (results, has_more) for a search query.
+
+    Each result is a dict with 'book_id', 'rank', and HTML-safe
+    'title_html' / 'snippet_html' strings with matches wrapped in <mark>.
+    Results are ordered by bm25 relevance (best first). Only ready books are
+    returned, so a page is never cut short by books still being processed.
+    """
+    if not fts_available():
+        return _fallback_search(query, limit, offset)
+
+    match = build_match_query(query)
+    if not match:
+        return [], False
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    sql = f"""
+        SELECT {FTS_TABLE}.rowid,
+               bm25({FTS_TABLE}, {weights}) AS rank,
+               highlight({FTS_TABLE}, 0, %s, %s) AS title_hl,
+               snippet({FTS_TABLE}, 2, %s, %s, '…', 24) AS snippet_hl
+        FROM {FTS_TABLE}
+        JOIN books_book ON books_book.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND books_book.processing_status = 'ready'
+        ORDER BY rank
+        LIMIT %s OFFSET %s
+    """
+    params = [_MARK_START, _MARK_END, _MARK_START, _MARK_END, match, limit + 1, offset]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    except OperationalError:
+        # Malformed MATCH expressions should not surface as server errors
+        return [], False
+
+    results = [
+        {
+            'book_id': book_id,
+            'rank': rank,
+            'title_html': _highlight(title_hl or ''),
+            'snippet_html': _highlight(snippet_hl or ''),
+        }
+        for book_id, rank, title_hl, snippet_hl in rows[:limit]
+    ]
+    return results, len(rows) > limit
+
+
+def _fallback_search(query, limit, offset):
+    # Imported here to keep this module importable from migrations
+    from .models import Book
+
+    tokens = _TOKEN_RE.findall(query or '')
+    if not tokens:
+        return [], False
+
+    queryset = Book.objects.filter(processing_status='ready')
+    for token in tokens:
+        queryset = queryset.filter(
+            Q(title__icontains=token) | Q(author__icontains=token)
+            | Q(description__icontains=token) | Q(category__icontains=token)
+        )
+    rows = list(queryset.order_by('-uploaded_at', '-id').values_list('pk', 'title', 'description')[offset:offset + limit + 1])
+
+    results = [
+        {
+            'book_id': pk,
+            'rank': 0,
+            'title_html': escape(title),
+            'snippet_html': escape(description[:160]),
+        }
+        for pk, title, description in rows[:limit]
+    ]
+    return results, len(rows) > limit
+
+
+def rebuild_index():
+    """
+    Reinstalls missing triggers and rebuilds the FTS5 index from books_book.
+    Returns False when the database is not SQLite.
+    """
+    if not install_index():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return True
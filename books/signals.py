@@ -0,0 +1,63 @@
+# books/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog_cache
+from .entitlements import invalidate_entitlements
+from .models import Book, Category, Order, Review
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    """
+    Removes a deleted review from its book's rating aggregates.
+    Runs for cascades and queryset deletes too, which bypass Review.delete().
+    """
+    Book.adjust_rating(instance.book_id, -instance.rating, -1)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    """
+    Removes a deleted book from its category's count.
+    Runs for cascades (e.g. a deleted seller) and queryset deletes too.
+    """
+    if instance.processing_status == 'ready':
+        Category.adjust_count(instance.category, -1)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_ownership_changed(sender, instance, **kwargs):
+    # Uploading or deleting a book changes its owner's entitlements. After commit,
+    # so a concurrent request cannot cache the old rows under the new version
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: invalidate_entitlements(owner_id))
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, created=False, **kwargs):
+    # A freshly created pending order cannot grant access yet
+    if created and instance.status != 'paid':
+        return
+    # Covers payment_callback_view marking an order paid, and admin edits
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_entitlements(user_id))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    # New cached catalog pages, category list and detail fragments for this book
+    catalog_cache.bump_catalog()
+    catalog_cache.bump_book(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    # Reviews change the rating on the book's card and its detail page
+    catalog_cache.bump_catalog()
+    catalog_cache.bump_book(instance.book_id)
@@ -23,8 +23,11 @@ document.addEventListener('DOMContentLoaded', function() {
     // Get device pixel ratio to improve rendering on high-DPI screens
     const devicePixelRatio = window.devicePixelRatio || 1;
 
-    // Specify workerSrc explicitly for PDF.js
-    pdfjsLib.GlobalWorkerOptions.workerSrc = 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/pdf.worker.min.js';
+    // Report the page to the server like the main reader (reading_progress.js)
+    const readingProgress = createReadingProgress(fullscreenViewerContainer);
+
+    // Specify workerSrc explicitly for PDF.js (set by the template: vendored copy, or the CDN before `build_assets`)
+    pdfjsLib.GlobalWorkerOptions.workerSrc = pdfWorkerUrl;
 
     // bookPk and bookFileUrl are now available as global variables
     // because they are defined in the <script> tag before this script is loaded.
@@ -159,6 +162,7 @@ document.addEventListener('DOMContentLoaded', function() {
         pageNumSpan.textContent = num;
         prevPageButton.disabled = (num <= 1);
         nextPageButton.disabled = (num >= pdfDoc.numPages);
+        readingProgress.setPage(num);
     }
 
     function queueRenderPage(num) {
@@ -248,12 +252,22 @@ document.addEventListener('DOMContentLoaded', function() {
     loadingIndicator.classList.remove('hidden'); // Show loading indicator initially
     const loadingTaskOptions = {
         url: bookFileUrl,
-        cMapUrl: 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/cmaps/',
+        cMapUrl: pdfCMapUrl,
         cMapPacked: true,
-        standardFontDataUrl: 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/standard_fonts/'
+        standardFontDataUrl: pdfStandardFontUrl,
+        // The file endpoint supports Range requests: fetch only the chunks needed
+        // for the pages being shown instead of downloading the whole PDF up front
+        rangeChunkSize: 262144,
+        disableAutoFetch: true,
+        disableStream: true
     };
 
-    pdfjsLib.getDocument(loadingTaskOptions).promise.then(function(pdfDoc_) {
+    // bookPagesUrl is set by the template when the server renders the pages (server_pages.js)
+    const loadingPromise = bookPagesUrl
+        ? loadServerPages(bookPagesUrl)
+        : pdfjsLib.getDocument(loadingTaskOptions).promise;
+
+    loadingPromise.then(function(pdfDoc_) {
         pdfDoc = pdfDoc_;
         pageCountSpan.textContent = pdfDoc.numPages;
         // pageNum is already set to initialPage from the template
@@ -18,8 +18,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Look for URL overrides like ?mainScale=1.3
     const urlParams = new URLSearchParams(window.location.search);
     const overrideM = parseFloat(urlParams.get('mainScale'));
-    // Get initial page number from URL if navigating back from fullscreen
-    const initialPageFromUrl = parseInt(urlParams.get('page')) || 1;
+    // Initial page from the server: ?page= when navigating back from fullscreen, else the saved position
+    const initialPage = parseInt(mainViewerContainer.dataset.initialPage) || 1;
 
 
     // Get device pixel ratio to improve rendering on high-DPI screens
@@ -47,7 +47,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Main Reader State
     let mainPdfDoc = null;
-    let mainPageNum = initialPageFromUrl; // Use initial page from URL
+    let mainPageNum = initialPage; // Use initial page from the server
     let mainPageRendering = false;
     let mainPageNumPending = null;
     let mainCanvas = null; // Will be created by renderMainPage
@@ -56,10 +56,12 @@ document.addEventListener('DOMContentLoaded', function() {
     // Get book file URL and book primary key from data attributes
     const bookFileUrl = mainViewerContainer.dataset.bookUrl;
     const bookPk = mainViewerContainer.dataset.bookPk; // Get book PK
+    // Set when the server renders the pages (server_pages.js); empty for in-browser pdf.js
+    const bookPagesUrl = mainViewerContainer.dataset.pagesUrl;
 
 
-    // Specify workerSrc explicitly for PDF.js
-    pdfjsLib.GlobalWorkerOptions.workerSrc = 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/pdf.worker.min.js';
+    // Specify workerSrc explicitly for PDF.js (vendored copy, or the CDN before `build_assets`)
+    pdfjsLib.GlobalWorkerOptions.workerSrc = mainViewerContainer.dataset.pdfWorkerUrl;
 
 
     // --- Utility Function to create a high-resolution canvas and its context ---
@@ -160,6 +162,8 @@ document.addEventListener('DOMContentLoaded', function() {
         mainPageNumSpan.textContent = num;
         mainPrevPageButton.disabled = (num <= 1);
         mainNextPageButton.disabled = (num >= mainPdfDoc.numPages);
+        readingProgress.setPage(num);
+        updateBookmarkButton();
     }
 
     function queueRenderMainPage(num) {
@@ -193,11 +197,60 @@ document.addEventListener('DOMContentLoaded', function() {
         queueRenderMainPage(mainPageNum);
     }
 
+    // --- Reading progress and bookmarks (reading_progress.js) ---
+    const readingProgress = createReadingProgress(mainViewerContainer, parseInt(mainViewerContainer.dataset.savedPage));
+    const bookmarkButton = document.getElementById('bookmark-page');
+    const bookmarkSelect = document.getElementById('bookmark-select');
+
+    function bookmarkOption(page) {
+        return bookmarkSelect.querySelector(`option[value="${page}"]`);
+    }
+
+    function updateBookmarkButton() {
+        const marked = bookmarkOption(mainPageNum) !== null;
+        bookmarkButton.classList.toggle('text-gold', marked);
+        bookmarkButton.setAttribute('aria-pressed', marked);
+    }
+
+    function toggleBookmark() {
+        const page = mainPageNum;
+        const option = bookmarkOption(page);
+        const request = option
+            ? readingProgress.deleteBookmark(option.dataset.bookmarkId).then(function() { option.remove(); })
+            : readingProgress.addBookmark(page).then(function(bookmark) {
+                const newOption = document.createElement('option');
+                newOption.value = page;
+                newOption.dataset.bookmarkId = bookmark.id;
+                newOption.textContent = `Page ${page}`;
+                // Keep the list in page order
+                const next = Array.from(bookmarkSelect.options).find(o => o.value && parseInt(o.value) > page);
+                bookmarkSelect.insertBefore(newOption, next || null);
+            });
+        request.then(updateBookmarkButton).catch(function(error) {
+            console.error("Could not update bookmark:", error);
+        });
+    }
+
+    function goToBookmark() {
+        const page = parseInt(bookmarkSelect.value);
+        bookmarkSelect.value = '';
+        if (!page || !mainPdfDoc || page > mainPdfDoc.numPages) return;
+        mainPageNum = page;
+        queueRenderMainPage(mainPageNum);
+    }
+
+    bookmarkButton.addEventListener('click', toggleBookmark);
+    bookmarkSelect.addEventListener('change', goToBookmark);
+
     // --- Full-screen Page Navigation ---
     function openFullscreenPageHandler() {
         // Construct the URL for the new full-screen reader page
         // Pass book_pk and current page number
-        const fullscreenUrl = `/books/fullscreen_reader/?book_pk=${bookPk}&page=${mainPageNum}`;
+        let fullscreenUrl = `/books/fullscreen_reader/?book_pk=${bookPk}&page=${mainPageNum}`;
+        // Keep an explicit ?render= choice in the fullscreen reader
+        if (urlParams.get('render')) {
+            fullscreenUrl += `&render=${encodeURIComponent(urlParams.get('render'))}`;
+        }
 
         // Open the new page in a new tab/window
         window.open(fullscreenUrl, '_blank');
@@ -257,15 +310,26 @@ document.addEventListener('DOMContentLoaded', function() {
     mainLoadingIndicator.classList.remove('hidden'); // Show loading indicator initially
     const mainLoadingTaskOptions = {
         url: bookFileUrl,
-        cMapUrl: 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/cmaps/',
+        cMapUrl: mainViewerContainer.dataset.pdfCmapUrl,
         cMapPacked: true,
-        standardFontDataUrl: 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/standard_fonts/'
+        standardFontDataUrl: mainViewerContainer.dataset.pdfFontUrl,
+        // The file endpoint supports Range requests: fetch only the chunks needed
+        // for the pages being shown instead of downloading the whole PDF up front
+        rangeChunkSize: 262144,
+        disableAutoFetch: true,
+        disableStream: true
     };
 
-    pdfjsLib.getDocument(mainLoadingTaskOptions).promise.then(function(pdfDoc_) {
+    const mainLoadingPromise = bookPagesUrl
+        ? loadServerPages(bookPagesUrl)
+        : pdfjsLib.getDocument(mainLoadingTaskOptions).promise;
+
+    mainLoadingPromise.then(function(pdfDoc_) {
         mainPdfDoc = pdfDoc_;
         mainPageCountSpan.textContent = mainPdfDoc.numPages;
-        renderMainPage(mainPageNum); // Initial render using initialPageFromUrl
+        // A saved page past the end (e.g. the file was replaced) falls back to the last page
+        mainPageNum = Math.min(mainPageNum, mainPdfDoc.numPages);
+        renderMainPage(mainPageNum); // Initial render at the initial page
     }).catch(function (reason) {
         console.error("Main PDF loading error:", reason);
         mainLoadingIndicator.classList.add('hidden'); // Hide loading indicator on error
@@ -0,0 +1,69 @@
+// Saves the reader's position and bookmarks on the server (books/reading.py).
+// Used by reader.js and fullscreen_reader.js. The viewer container carries
+// the settings: data-progress-url, data-bookmarks-url, data-csrf-token and
+// data-progress-interval (seconds between reports).
+
+/**
+ * Starts reporting the current page and returns the progress API.
+ * The page is sent every data-progress-interval seconds when it changed,
+ * and once more (as a beacon) when the page is hidden or closed.
+ * @param {HTMLElement} container - The viewer container with the data attributes.
+ * @param {number} savedPage - The page the server already has, if any.
+ * @returns {{setPage: function(number), addBookmark: function(number, string=): Promise, deleteBookmark: function(number): Promise}}
+ */
+function createReadingProgress(container, savedPage) {
+    const progressUrl = container.dataset.progressUrl;
+    const bookmarksUrl = container.dataset.bookmarksUrl;
+    const csrfToken = container.dataset.csrfToken;
+    const intervalMs = (parseFloat(container.dataset.progressInterval) || 5) * 1000;
+
+    let currentPage = null;
+    let reportedPage = savedPage || null;
+
+    function formData(fields) {
+        const data = new FormData();
+        // Also accepted by the CSRF check when sent as a beacon, which cannot set headers
+        data.append('csrfmiddlewaretoken', csrfToken);
+        Object.entries(fields).forEach(([name, value]) => data.append(name, value));
+        return data;
+    }
+
+    function post(url, fields) {
+        return fetch(url, { method: 'POST', body: formData(fields), credentials: 'same-origin' })
+            .then(function(response) {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            });
+    }
+
+    function report(asBeacon) {
+        if (currentPage === null || currentPage === reportedPage) return;
+        const page = currentPage;
+        if (asBeacon && navigator.sendBeacon) {
+            // Survives the page being closed, unlike fetch()
+            if (navigator.sendBeacon(progressUrl, formData({ page: page }))) reportedPage = page;
+            return;
+        }
+        post(progressUrl, { page: page })
+            .then(function() { reportedPage = page; })
+            .catch(function(error) { console.warn("Could not save reading progress:", error); });
+    }
+
+    if (progressUrl) {
+        setInterval(function() { report(false); }, intervalMs);
+        document.addEventListener('visibilitychange', function() {
+            if (document.visibilityState === 'hidden') report(true);
+        });
+        window.addEventListener('pagehide', function() { report(true); });
+    }
+
+    return {
+        setPage: function(page) { currentPage = page; },
+        addBookmark: function(page, label) {
+            return post(bookmarksUrl, { page: page, label: label || '' }).then(function(data) { return data.bookmark; });
+        },
+        deleteBookmark: function(bookmarkId) {
+            return post(`${bookmarksUrl}${bookmarkId}/delete/`, {});
+        },
+    };
+}
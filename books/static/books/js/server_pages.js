@@ -0,0 +1,87 @@
+/**
+ * Server-rendered reader pages.
+ *
+ * Loads a book's page manifest (books:book_pages) and exposes the small part
+ * of the pdf.js document/page API the readers use (numPages, getPage,
+ * getViewport, render), drawing pre-rendered page images instead of parsing
+ * the PDF in the browser. The next few pages are prefetched so page turns are
+ * served from the browser cache.
+ */
+(function(window) {
+    const PDF_POINTS_PER_INCH = 72;
+
+    function loadImage(url) {
+        return new Promise(function(resolve, reject) {
+            const img = new Image();
+            img.onload = function() { resolve(img); };
+            img.onerror = function() { reject(new Error('Could not load page image')); };
+            img.src = url;
+        });
+    }
+
+    function ServerPagesDocument(manifest) {
+        this.manifest = manifest;
+        this.numPages = manifest.page_count;
+        this.prefetched = {};
+    }
+
+    // Smallest rendered resolution that is sharp at this scale, or the largest available
+    ServerPagesDocument.prototype.pickDpi = function(scale) {
+        const wanted = scale * (window.devicePixelRatio || 1) * PDF_POINTS_PER_INCH;
+        const levels = this.manifest.dpi_levels;
+        for (let i = 0; i < levels.length; i++) {
+            if (levels[i] >= wanted) return levels[i];
+        }
+        return levels[levels.length - 1];
+    };
+
+    ServerPagesDocument.prototype.pageUrl = function(num, dpi) {
+        return this.manifest.page_url_template.replace('{page}', num).replace('{dpi}', dpi);
+    };
+
+    ServerPagesDocument.prototype.prefetch = function(num, dpi) {
+        for (let i = 1; i <= this.manifest.prefetch_pages; i++) {
+            const next = num + i;
+            const url = this.pageUrl(next, dpi);
+            if (next > this.numPages || this.prefetched[url]) continue;
+            this.prefetched[url] = true;
+            loadImage(url).catch(function() {}); // Warm the browser cache only
+        }
+    };
+
+    ServerPagesDocument.prototype.getPage = function(num) {
+        const doc = this;
+        const size = doc.manifest.page_sizes[num - 1];
+        if (!size) return Promise.reject(new Error('Invalid page number'));
+
+        return Promise.resolve({
+            getViewport: function(params) {
+                const scale = params.scale;
+                return { scale: scale, width: size[0] * scale, height: size[1] * scale };
+            },
+            render: function(renderContext) {
+                const viewport = renderContext.viewport;
+                const dpi = doc.pickDpi(viewport.scale);
+                const promise = loadImage(doc.pageUrl(num, dpi)).then(function(img) {
+                    // The readers' canvas context is already scaled for devicePixelRatio
+                    renderContext.canvasContext.drawImage(img, 0, 0, viewport.width, viewport.height);
+                    doc.prefetch(num, dpi);
+                });
+                return { promise: promise };
+            }
+        });
+    };
+
+    /**
+     * Resolves to a document object for the given manifest URL.
+     * Mirrors pdfjsLib.getDocument(...).promise.
+     */
+    window.loadServerPages = function(manifestUrl) {
+        return fetch(manifestUrl, { credentials: 'same-origin' }).then(function(response) {
+            if (!response.ok) throw new Error('Could not load book pages (' + response.status + ')');
+            return response.json();
+        }).then(function(manifest) {
+            return new ServerPagesDocument(manifest);
+        });
+    };
+})(window);
@@ -0,0 +1,292 @@
+# books/storage.py
+"""
+Content-addressed storage for book PDFs.
+
+A file is stored under its SHA-256: upload_to/ab/cd/<sha256>.pdf. The two
+levels of two hex digits spread files over 65,536 directories, so no
+directory grows past a few dozen entries even at millions of books. Because a
+name always holds the same bytes, a stored file is never overwritten or
+renamed, and caches (browsers, a CDN, the reader page cache) can keep it
+forever.
+
+save() takes the digest from content.sha256 when the caller already computed
+it (StagingHashUploadHandler, the processing job), and otherwise hashes the
+content first. Saving content that is already stored is a no-op.
+
+Backends, chosen through settings.STORAGES['books'] (BOOK_STORAGE):
+- ContentAddressedFileSystemStorage writes to a temporary file in the target
+  directory and renames it into place, so readers never see a partial file;
+- ContentAddressedS3Storage keeps the files in an S3-compatible bucket
+  (AWS, MinIO, ...; boto3 required). An object only becomes visible once its
+  upload completes.
+
+`manage.py relocate_book_files` moves files stored under the old flat
+book_pdfs/<name>.pdf names to their content-addressed names.
+"""
+import hashlib
+import io
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.utils.deconstruct import deconstructible
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+CHUNK_SIZE = 1024 * 1024
+# Stored files never change, so any cache may keep them
+IMMUTABLE_CACHE_CONTROL = 'max-age=31536000, immutable'
+
+_CONTENT_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def book_storage():
+    """
+    The storage for Book.file (a callable, so settings can switch backends).
+    """
+    return storages['books']
+
+
+def file_digest(content):
+    """
+    Returns the SHA-256 hex digest of a File, leaving it at position 0.
+    """
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def content_name(name, digest):
+    """
+    Returns the sharded name for a file with this digest, keeping the
+    directory (upload_to) and extension of `name`:
+    book_pdfs/report.pdf -> book_pdfs/ab/cd/abcd...ef.pdf
+    """
+    directory, filename = posixpath.split(name)
+    ext = os.path.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest[2:4], f"{digest}{ext}")
+
+
+def is_content_name(name):
+    return bool(_CONTENT_NAME_RE.search(name or ''))
+
+
+class ContentAddressedMixin:
+    """
+    Turns a storage's save() into content addressing. The backend's _save()
+    must make a file appear atomically under its final name.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = getattr(content, 'sha256', None) or file_digest(content)
+        name = content_name(self.generate_filename(name), digest)
+        if max_length is not None and len(name) > max_length:
+            raise ValueError(f"Storage name {name!r} is longer than {max_length} characters.")
+        if self.exists(name):
+            # The same bytes are already stored
+            return name
+        return self._save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        # Names are content-derived: the same name always means the same bytes
+        return name
+
+
+@deconstructible(path='books.storage.ContentAddressedFileSystemStorage')
+class ContentAddressedFileSystemStorage(ContentAddressedMixin, FileSystemStorage):
+    """
+    Content-addressed storage in a local directory (MEDIA_ROOT by default).
+    """
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # A staged upload on the same filesystem is renamed into place; anything
+        # else is written to a temporary file next to the target and renamed
+        if hasattr(content, 'temporary_file_path'):
+            try:
+                os.replace(content.temporary_file_path(), full_path)
+                self._set_permissions(full_path)
+                return name
+            except OSError:
+                # Another filesystem: copy instead
+                pass
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._set_permissions(full_path)
+        return name
+
+    def _set_permissions(self, full_path):
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+
+class _S3RangeReader(io.RawIOBase):
+    """
+    A seekable read-only view of an S3 object that fetches only the bytes
+    read, with ranged GETs, so a Range response does not download the whole PDF.
+    """
+
+    def __init__(self, client, bucket, key, size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size or not len(buffer):
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-{end}')
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+@deconstructible(path='books.storage.ContentAddressedS3Storage')
+class ContentAddressedS3Storage(ContentAddressedMixin, Storage):
+    """
+    Content-addressed storage in an S3-compatible bucket.
+
+    Options (settings.STORAGES['books']['OPTIONS']): bucket, prefix (key
+    prefix, e.g. 'media/'), endpoint_url (for MinIO or another S3-compatible
+    server), region_name, access_key, secret_key, and url_expires (seconds
+    a url() stays valid; the bucket is private).
+    """
+
+    def __init__(self, bucket=None, prefix='', endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, url_expires=3600):
+        if boto3 is None:
+            raise ImproperlyConfigured("ContentAddressedS3Storage requires boto3 (pip install boto3).")
+        if not bucket:
+            raise ImproperlyConfigured("ContentAddressedS3Storage needs a bucket option.")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.url_expires = url_expires
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use: boto3 clients are thread-safe, so one per storage is enough
+        if self._client is None:
+            self._client = boto3.session.Session().client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region_name,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            )
+        return self._client
+
+    def _key(self, name):
+        return self.prefix + name
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError("ContentAddressedS3Storage files are read-only.")
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        reader = _S3RangeReader(self.client, self.bucket, self._key(name), head['ContentLength'])
+        return File(io.BufferedReader(reader, buffer_size=CHUNK_SIZE), name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        # A single PUT or a completed multipart upload: the object appears whole or not at all
+        self.client.upload_fileobj(
+            content, self.bucket, self._key(name),
+            ExtraArgs={
+                'ContentType': 'application/pdf' if name.endswith('.pdf') else 'application/octet-stream',
+                'CacheControl': IMMUTABLE_CACHE_CONTROL,
+            },
+        )
+        return name
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(name)}, ExpiresIn=self.url_expires,
+        )
+
+    def listdir(self, path):
+        prefix = self._key(path.rstrip('/') + '/' if path else '')
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            directories += [p['Prefix'][len(prefix):].rstrip('/') for p in page.get('CommonPrefixes', [])]
+            files += [o['Key'][len(prefix):] for o in page.get('Contents', [])]
+        return directories, files
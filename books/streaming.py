@@ -0,0 +1,161 @@
+# books/streaming.py
+"""
+Serves Book PDFs with HTTP Range support so pdf.js can fetch only the bytes
+it needs for the first pages instead of the whole file.
+
+Responses carry an ETag derived from Book.file_hash and honour
+If-None-Match (304) and If-Range. With settings.BOOK_FILE_OFFLOAD set to
+'x-sendfile' or 'x-accel-redirect', the view only sets a header and the
+front-end web server (Apache mod_xsendfile / nginx internal location)
+streams the file, including ranges, without copying bytes through Django.
+"""
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.utils.text import slugify
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def book_etag(book):
+    """
+    Strong ETag for a book's file. The content hash identifies the bytes
+    exactly; books without a hash fall back to name and size.
+    """
+    if book.file_hash:
+        return f'"{book.file_hash}"'
+    return f'"{book.pk}-{book.file.size}"'
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    # Weak comparison for If-None-Match: ignore the W/ prefix
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range "bytes=" header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range) and raises ValueError when the range is unsatisfiable.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _iter_range(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def _offload_response(book, filename, as_attachment):
+    """
+    Returns an empty response that tells the web server to send the file, or
+    None when offloading is disabled (or, for X-Sendfile, when the storage has
+    no local paths, e.g. BOOK_STORAGE=s3).
+    """
+    mode = getattr(settings, 'BOOK_FILE_OFFLOAD', None)
+    if not mode:
+        return None
+
+    response = HttpResponse(content_type='application/pdf')
+    if mode == 'x-sendfile':
+        try:
+            response['X-Sendfile'] = book.file.path
+        except NotImplementedError:
+            # Remote storage: the web server cannot read the file, so stream it instead
+            return None
+    elif mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'BOOK_FILE_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + book.file.name
+    else:
+        raise ValueError(f"Unknown BOOK_FILE_OFFLOAD mode: {mode!r}")
+
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+def serve_book_file(request, book, as_attachment=False):
+    """
+    Returns a response for the book's PDF, honouring conditional and Range requests.
+    Raises FileNotFoundError if the file is missing from storage.
+    """
+    # Stored names are content hashes (books/storage.py): name the download after the book
+    filename = f"{slugify(book.title) or 'book'}.pdf"
+    etag = book_etag(book)
+
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    response = _offload_response(book, filename, as_attachment)
+    if response is None:
+        size = book.file.size
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range.strip() != etag:
+            # The client's copy is stale: send the whole (new) file
+            range_header = None
+
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['ETag'] = etag
+            return response
+
+        if byte_range is None:
+            response = FileResponse(book.file.open('rb'), as_attachment=as_attachment, filename=filename, content_type='application/pdf')
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_range(book.file.open('rb'), start, length),
+                status=206,
+                content_type='application/pdf',
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    # Purchased content: browsers may cache it, shared caches may not
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
@@ -1,7 +1,70 @@
 from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from bookstore import assets
+from books.covers import cover_srcset, cover_variant_url
 
 register = template.Library()
 
 @register.filter
 def get_item(dictionary, key):
     return dictionary.get(key)
+
+
+@register.simple_tag
+def cover_picture(book, sizes='100vw', img_class='', default_width=320):
+    """
+    Renders a <picture> for a book cover with WebP and JPEG srcsets, so the
+    browser downloads the smallest variant that fits the layout.
+    Usage: {% cover_picture book sizes="(min-width: 1024px) 25vw, 50vw" img_class="w-full" %}
+    """
+    alt = f"{book.title} Cover"
+    if not book.cover_hash:
+        # Variants not built yet: fall back to the original image
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+                           book.cover_image.url, alt, img_class)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        cover_srcset(book, 'webp'), sizes,
+        cover_variant_url(book, default_width, 'jpg'), cover_srcset(book, 'jpg'), sizes,
+        alt, img_class,
+    )
+
+
+def _built_url(path):
+    return static(path) if assets.is_built(path) else None
+
+
+@register.simple_tag
+def asset_url(package, path):
+    """
+    URL of a vendored file: the hashed static file once `build_assets` has
+    fetched it, else the same file on the package's CDN.
+    Usage: {% asset_url 'pdfjs' 'pdf.worker.min.js' %} or {% asset_url 'pdfjs' 'cmaps/' %}
+    """
+    name = f"vendor/{package}/{path}"
+    if not assets.is_built(name):
+        return assets.VENDOR_PACKAGES[package].cdn + path
+    if path.endswith('/'):
+        # A directory (e.g. pdf.js cmaps/): its files are fetched by name, unhashed
+        return settings.STATIC_URL + name
+    return static(name)
+
+
+@register.inclusion_tag('books/asset_head.html')
+def asset_head():
+    """
+    Stylesheets and scripts for <head>: the built Tailwind, fonts, icons and
+    Alpine, with the CDN versions standing in for any that are not built.
+    """
+    return {
+        'app_css': _built_url(assets.APP_CSS),
+        'fonts_css': _built_url(assets.FONTS_CSS),
+        'icons_css': _built_url(assets.ICONS_CSS),
+        'alpine_js': asset_url('alpine', 'cdn.min.js'),
+    }
@@ -1,3 +1,1776 @@
-from django.test import TestCase
+import csv
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import runpy
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from bookstore import assets, db_routers
+from bookstore.testing import QueryBudgetMixin
+
+from .models import (
+    Book, Bookmark, BookProcessingJob, Category, Order, PaymentEvent, ReadingProgress, Review, SellerDailySales,
+)
+from . import analytics, benchmark, covers, page_cache, pagination, payments, pdf_render, processing, reading, search, streaming
+from .entitlements import get_entitlements
+from .storage import ContentAddressedFileSystemStorage, ContentAddressedS3Storage, boto3
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on every query the hot views issue and fails if any of them
+    reads one of the app's tables with a full table scan instead of an index.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        cls.books = [
+            Book.objects.create(
+                owner=cls.seller, title=f"Book {i}", author="Author", purchase_price=100,
+                category='Fiction' if i % 2 else 'Science', file=f"book_pdfs/book_{i}.pdf",
+            )
+            for i in range(6)
+        ]
+        for i, book in enumerate(cls.books[:4]):
+            Order.objects.create(
+                user=cls.buyer, book=book, order_type='purchase', amount=100,
+                razorpay_order_id=f"order_test_{i}", status='paid' if i < 3 else 'pending',
+            )
+            Review.objects.create(book=book, user=cls.buyer, rating=4, comment="Good")
+
+    def setUp(self):
+        # Cached catalog pages would hide the queries being checked
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables make a sequential scan the cheapest plan; only
+                # fall back to one when no usable index exists
+                cursor.execute("SET enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = [row[0] for row in cursor.fetchall()]
+                cursor.execute("RESET enable_seqscan")
+                return plan
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def table_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            return [line for line in plan if re.search(r'Seq Scan on books_', line)]
+        # SQLite: "SCAN books_order" is a table scan, "SCAN ... USING INDEX" is not.
+        # Tables joined twice appear under Django's aliases (T3, T4, ...)
+        return [line for line in plan if re.fullmatch(r'SCAN (books_\w+|T\d+)( AS \w+)?', line.strip())]
+
+    def assertNoTableScans(self, captured):
+        selects = [q['sql'] for q in captured.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, "No queries were captured.")
+        for sql in selects:
+            scans = self.table_scans(self.explain(sql))
+            self.assertFalse(scans, f"Table scan {scans} in query:\n{sql}")
+
+    def get(self, url, user=None):
+        if user:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return captured
+
+    def test_book_list(self):
+        self.assertNoTableScans(self.get(reverse('books:book_list')))
+        self.assertNoTableScans(self.get(reverse('books:book_list') + '?category=Fiction'))
+
+    def test_book_detail(self):
+        self.assertNoTableScans(self.get(reverse('books:book_detail', args=[self.books[0].pk]), self.buyer))
+
+    def test_review_feed(self):
+        feed = reverse('books:book_reviews', args=[self.books[0].pk])
+        self.assertNoTableScans(self.get(feed + '?sort=rating'))
+        self.assertNoTableScans(self.get(feed + '?format=html'))
+
+    def test_user_dashboard(self):
+        self.assertNoTableScans(self.get(reverse('accounts:user_dashboard'), self.seller))
+        cursor = pagination.encode_order_cursor(Order.objects.filter(status='paid').latest('created_at', 'id'))
+        self.assertNoTableScans(self.get(reverse('accounts:user_dashboard') + f'?cursor={cursor}', self.seller))
+
+    def test_user_profile(self):
+        self.assertNoTableScans(self.get(reverse('accounts:user_profile'), self.buyer))
+
+    def test_payment_confirmation(self):
+        with CaptureQueriesContext(connection) as captured:
+            payments.mark_order_paid('order_test_3', 'pay_test_3')
+            Order.objects.filter(razorpay_order_id='order_test_3').select_related('book').first()
+        self.assertNoTableScans(captured)
+
+    def test_one_paid_purchase_per_user_and_book(self):
+        Order.objects.create(
+            user=self.buyer, book=self.books[0], order_type='purchase', amount=100,
+            razorpay_order_id='order_test_again',
+        )
+        with self.assertRaises(payments.DuplicatePurchase):
+            payments.mark_order_paid('order_test_again', 'pay_test_again')
+        # Closed, with the payment kept for the refund
+        order = Order.objects.get(razorpay_order_id='order_test_again')
+        self.assertEqual((order.status, order.razorpay_payment_id), ('duplicate', 'pay_test_again'))
+        self.assertNotIsInstance(payments.DuplicatePurchase(), payments.PaymentGatewayError)
+
+
+class BenchmarkSuiteTests(TestCase):
+    """
+    Runs every benchmark scenario on a tiny dataset, so the suite keeps
+    working as the views change (see books/benchmark.py).
+    """
+
+    def tearDown(self):
+        benchmark.delete_files()
+
+    def test_scenarios_run_without_errors(self):
+        dataset = benchmark.seed(sellers=2, buyers=4, books=6, reviews=4, orders=8, pending=3)
+        results = benchmark.run_client(dataset, benchmark.SCENARIOS, iterations=3, warmup=1)
+        for scenario in benchmark.SCENARIOS:
+            self.assertEqual(results[scenario]['errors'], 0, f"{scenario}: {results[scenario]['statuses']}")
+            self.assertIsNotNone(results[scenario]['queries_mean'])
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Fails when a view runs more queries than its @query_budget, e.g. after a
+    template starts querying once per book or review. The cache is cleared
+    first, so these are cold-cache counts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        cls.buyers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pw') for i in range(5)]
+        cls.books = [
+            Book.objects.create(
+                owner=cls.seller, title=f"Book {i}", author="Author", purchase_price=100,
+                category='Fiction' if i % 2 else 'Science', file=f"book_pdfs/book_{i}.pdf",
+            )
+            for i in range(8)
+        ]
+        for i, buyer in enumerate(cls.buyers):
+            for book in cls.books[:3]:
+                Order.objects.create(
+                    user=buyer, book=book, order_type='purchase', amount=100, status='paid',
+                    razorpay_order_id=f"order_{i}_{book.pk}", paid_at=timezone.now(),
+                )
+                Review.objects.create(book=book, user=buyer, rating=i % 5 + 1, comment="Review")
+        cls.pending = Order.objects.create(
+            user=cls.buyers[0], book=cls.books[5], order_type='purchase', amount=100,
+            razorpay_order_id='order_pending',
+        )
+        analytics.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, user=None):
+        if user:
+            self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_catalog(self):
+        self.assertWithinQueryBudget(self.get(reverse('books:book_list')))
+        self.assertWithinQueryBudget(self.get(reverse('books:book_list') + '?category=Fiction', self.buyers[0]))
+        self.assertWithinQueryBudget(self.get(reverse('books:book_list_json')))
+        self.assertWithinQueryBudget(self.get(reverse('books:book_search') + '?q=book'))
+
+    def test_book_detail(self):
+        self.assertWithinQueryBudget(self.get(reverse('books:book_detail', args=[self.books[0].pk])))
+        self.assertWithinQueryBudget(self.get(reverse('books:book_detail', args=[self.books[0].pk]), self.buyers[0]))
+
+    def test_read_book(self):
+        self.assertWithinQueryBudget(self.get(reverse('books:read_book', args=[self.books[0].pk]), self.buyers[0]))
+
+    def test_user_pages(self):
+        self.assertWithinQueryBudget(self.get(reverse('accounts:user_dashboard'), self.seller))
+        self.assertWithinQueryBudget(self.get(reverse('accounts:user_profile'), self.buyers[0]))
+
+    def test_payment_callback(self):
+        response = self.client.post(reverse('books:payment_callback'), benchmark.callback_payload('order_pending'))
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+    def test_server_timing_header(self):
+        response = self.get(reverse('books:book_list'))
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries, \d+ duplicated", tpl;dur=')
+
+
+@override_settings(REVIEW_PAGE_SIZE=4)
+class ReviewFeedTests(TestCase):
+    """
+    Walks a book's review feed page by page in each sort order and checks
+    that every review comes back once, in order, with the reviewers loaded
+    in the same query.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        cls.book = Book.objects.create(
+            owner=seller, title="Book", author="Author", purchase_price=100,
+            category='Science', file="book_pdfs/book.pdf",
+        )
+        for i in range(11):
+            user = User.objects.create_user(f'reader{i}', f'reader{i}@example.com', 'pw')
+            Review.objects.create(book=cls.book, user=user, rating=i % 3 + 2, comment=f"Review {i}")
+        # Ties on created_at, which the cursor must break by id
+        Review.objects.filter(rating=3).update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, sort):
+        # Cold cache on every page, so each page's queries are counted
+        ids = []
+        params = {'sort': sort}
+        while True:
+            cache.clear()
+            with self.assertNumQueries(2): # the book and one page of reviews with their users
+                data = self.client.get(reverse('books:book_reviews', args=[self.book.pk]), params).json()
+            self.assertLessEqual(len(data['results']), 4)
+            ids += [review['id'] for review in data['results']]
+            if not data['next_cursor']:
+                return ids
+            params['cursor'] = data['next_cursor']
+
+    def test_sort_orders(self):
+        reviews = Review.objects.filter(book=self.book)
+        self.assertEqual(self.walk('newest'), list(reviews.order_by('-created_at', '-id').values_list('id', flat=True)))
+        self.assertEqual(self.walk('rating'), list(reviews.order_by('-rating', '-created_at', '-id').values_list('id', flat=True)))
+
+    def test_html_fragment(self):
+        response = self.client.get(reverse('books:book_reviews', args=[self.book.pk]), {'format': 'html'})
+        self.assertContains(response, 'reader10')
+        self.assertTrue(response['X-Next-Cursor'])
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        cursor = self.client.get(reverse('books:book_reviews', args=[self.book.pk])).json()['next_cursor']
+        response = self.client.get(reverse('books:book_reviews', args=[self.book.pk]), {'sort': 'rating', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(METRICS_TOKEN='metrics-token')
+class MetricsTests(TestCase):
+    """
+    Checks that requests, payments and cache lookups update the Prometheus
+    metrics and that /metrics only serves them with the token.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        cls.book = Book.objects.create(
+            owner=cls.seller, title="Book", author="Author", purchase_price=100,
+            category='Science', file="book_pdfs/book.pdf",
+        )
+        Order.objects.create(
+            user=cls.buyer, book=cls.book, order_type='purchase', amount=100,
+            razorpay_order_id='order_metrics',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, name, **labels):
+        # Metrics are process-wide, so the tests compare before and after
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_and_cache_hits(self):
+        requests = self.sample('bookstore_request_duration_seconds_count', url_name='books:book_list', method='GET')
+        hits = self.sample('bookstore_cache_requests_total', cache='catalog', result='hit')
+        misses = self.sample('bookstore_cache_requests_total', cache='catalog', result='miss')
+        self.client.get(reverse('books:book_list'))
+        self.client.get(reverse('books:book_list'))
+        self.assertEqual(self.sample('bookstore_request_duration_seconds_count', url_name='books:book_list', method='GET'), requests + 2)
+        self.assertEqual(self.sample('bookstore_cache_requests_total', cache='catalog', result='miss'), misses + 1)
+        self.assertEqual(self.sample('bookstore_cache_requests_total', cache='catalog', result='hit'), hits + 1)
+
+    def test_order_transitions(self):
+        paid = self.sample('bookstore_order_transitions_total', source='callback', status='paid')
+        self.client.post(reverse('books:payment_callback'), benchmark.callback_payload('order_metrics'))
+        # A repeated callback changes nothing
+        self.client.post(reverse('books:payment_callback'), benchmark.callback_payload('order_metrics'))
+        self.assertEqual(self.sample('bookstore_order_transitions_total', source='callback', status='paid'), paid + 1)
+
+    def test_endpoint_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'bookstore_request_duration_seconds_bucket{', response.content)
+
+
+class IconSubsetTests(TestCase):
+    """
+    Checks that build_assets keeps only the Font Awesome rules and glyphs our templates use.
+    """
+    css = (
+        '.fa,.fas{font-weight:900}'
+        '.fa-book:before{content:"\\f02d"}'
+        '.fa-house:before,.fa-home:before{content:"\\f015"}'
+        '.fa-unused:before{content:"\\f999"}'
+        '@keyframes fa-spin{0%{transform:rotate(0)}to{transform:rotate(1turn)}}'
+        '@font-face{font-family:"FA";src:url(../webfonts/fa-solid-900.woff2) format("woff2"),url(../webfonts/fa-solid-900.ttf) format("truetype")}'
+    )
+
+    def test_subset(self):
+        css, codepoints = assets.subset_icon_css(self.css, {'fa-book', 'fa-home'})
+        self.assertEqual(codepoints, {0xf02d, 0xf015})
+        self.assertIn('.fa,.fas{font-weight:900}', css)
+        self.assertIn('.fa-home:before{', css)
+        self.assertNotIn('fa-house', css)
+        self.assertNotIn('fa-unused', css)
+        self.assertIn('@keyframes fa-spin{0%{transform:rotate(0)}', css)
+        self.assertIn('src:url("fa-solid-900.woff2") format("woff2")}', css)
+
+    def test_templates_are_scanned(self):
+        self.assertTrue({'fa-book', 'fa-star', 'fa-spinner'} <= assets.used_icons())
+
+
+class BookStorageTests(TestCase):
+    """
+    Checks the content-addressed book storage and the relocation of old files.
+    """
+    data = b'%PDF-1.4 storage test\n%%EOF\n'
+    digest = hashlib.sha256(data).hexdigest()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_filesystem_names_are_sharded_and_deduplicated(self):
+        storage = ContentAddressedFileSystemStorage()
+        name = storage.save('book_pdfs/My Book.PDF', ContentFile(self.data))
+        self.assertEqual(name, f'book_pdfs/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.pdf')
+        self.assertEqual(storage.save('book_pdfs/other.pdf', ContentFile(self.data)), name)
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), self.data)
+        # Nothing but the file itself is left in the shard directory
+        self.assertEqual(storage.listdir(name.rsplit('/', 1)[0]), ([], [f'{self.digest}.pdf']))
+
+    def test_failed_write_leaves_nothing_behind(self):
+        class BrokenFile(ContentFile):
+            def chunks(self, chunk_size=None):
+                yield b'%PDF-partial'
+                raise OSError("disk full")
+
+        storage = ContentAddressedFileSystemStorage()
+        content = BrokenFile(self.data)
+        content.sha256 = self.digest
+        with self.assertRaises(OSError):
+            storage.save('book_pdfs/broken.pdf', content)
+        self.assertFalse(storage.exists(f'book_pdfs/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.pdf'))
+        self.assertEqual(storage.listdir(f'book_pdfs/{self.digest[:2]}/{self.digest[2:4]}'), ([], []))
+
+    @unittest.skipUnless(boto3 is not None and mock_aws is not None, "needs boto3 and moto")
+    def test_s3_storage(self):
+        with mock_aws():
+            boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='books')
+            storage = ContentAddressedS3Storage(bucket='books', prefix='media/', region_name='us-east-1')
+            name = storage.save('book_pdfs/book.pdf', ContentFile(self.data))
+            self.assertEqual(name, f'book_pdfs/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.pdf')
+            self.assertTrue(storage.exists(name))
+            self.assertEqual(storage.size(name), len(self.data))
+            head = storage.client.head_object(Bucket='books', Key=f'media/{name}')
+            self.assertEqual(head['CacheControl'], 'max-age=31536000, immutable')
+            with storage.open(name) as f:
+                f.seek(5)
+                self.assertEqual(f.read(3), self.data[5:8])
+            self.assertIn(f'media/{name}', storage.url(name))
+            storage.delete(name)
+            self.assertFalse(storage.exists(name))
+
+    def test_relocate_command(self):
+        seller = User.objects.create_user(username='seller', password='pw')
+        old_names = [default_storage.save(f'book_pdfs/book_{i}.pdf', ContentFile(self.data + bytes([i]))) for i in range(3)]
+        for i, old_name in enumerate(old_names):
+            Book.objects.create(
+                title=f"Book {i}", author="Author", category='Science', file=old_name,
+                owner=seller, purchase_price=100, file_hash=None if i else hashlib.sha256(self.data + b'\x00').hexdigest(),
+            )
+        call_command('relocate_book_files', workers=2, stdout=io.StringIO())
+
+        for i, (old_name, book) in enumerate(zip(old_names, Book.objects.order_by('title'))):
+            digest = hashlib.sha256(self.data + bytes([i])).hexdigest()
+            self.assertEqual(book.file.name, f'book_pdfs/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+            self.assertEqual(book.file_hash, digest)
+            self.assertFalse(default_storage.exists(old_name))
+            with book.file.open('rb') as f:
+                self.assertEqual(f.read(), self.data + bytes([i]))
+
+
+@override_settings(READING_PROGRESS_INLINE_FLUSH=False)
+class ReadingProgressTests(QueryBudgetMixin, TestCase):
+    """
+    Checks that progress reports are buffered in the cache and written in bulk,
+    and that the reader and profile pages resume from them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'pw')
+        cls.books = [
+            Book.objects.create(
+                owner=seller, title=f"Book {i}", author="Author", purchase_price=100,
+                category='Science', file=f"book_pdfs/book_{i}.pdf", page_count=50,
+            )
+            for i in range(3)
+        ]
+        for book in cls.books:
+            Order.objects.create(
+                user=cls.reader, book=book, order_type='purchase', amount=100, status='paid',
+                razorpay_order_id=f"order_{book.pk}", paid_at=timezone.now(),
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def report(self, book, page):
+        return self.client.post(reverse('books:reading_progress', args=[book.pk]), {'page': page})
+
+    def test_reports_are_buffered_and_flushed_in_bulk(self):
+        for page in (3, 4, 5):
+            self.assertEqual(self.report(self.books[0], page).status_code, 202)
+        self.report(self.books[1], 9)
+        self.assertEqual(self.report(self.books[1], 51).status_code, 400)
+        self.assertFalse(ReadingProgress.objects.exists())
+        # Visible before the flush
+        response = self.client.get(reverse('books:reading_progress', args=[self.books[0].pk]))
+        self.assertEqual(response.json(), {'page': 5})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reading.flush(), 2)
+        # Existence checks for users and books, then one upsert for every pair
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            dict(ReadingProgress.objects.values_list('book_id', 'page')),
+            {self.books[0].pk: 5, self.books[1].pk: 9},
+        )
+        self.assertEqual(reading.flush(), 0)
+
+        self.report(self.books[0], 6)
+        self.assertEqual(reading.flush(), 1)
+        self.assertEqual(ReadingProgress.objects.get(book=self.books[0]).page, 6)
+
+    @override_settings(READING_PROGRESS_INLINE_FLUSH=True)
+    def test_inline_flush_runs_once_per_interval(self):
+        self.report(self.books[0], 3)
+        self.assertEqual(ReadingProgress.objects.get().page, 3)
+        self.report(self.books[0], 4)
+        self.assertEqual(ReadingProgress.objects.get().page, 3)
+        call_command('flush_reading_progress', once=True, stdout=io.StringIO())
+        self.assertEqual(ReadingProgress.objects.get().page, 4)
+
+    def test_reader_and_profile_resume(self):
+        ReadingProgress.objects.create(user=self.reader, book=self.books[0], page=12, updated_at=timezone.now())
+        self.report(self.books[1], 7)
+
+        response = self.client.get(reverse('books:read_book', args=[self.books[0].pk]))
+        self.assertEqual(response.context['initial_page'], 12)
+        self.assertWithinQueryBudget(response)
+        response = self.client.get(reverse('books:read_book', args=[self.books[0].pk]) + '?page=2')
+        self.assertEqual(response.context['initial_page'], 2)
+
+        cache.delete(reading._progress_key(self.reader.pk, self.books[0].pk))
+        response = self.client.get(reverse('accounts:user_profile'))
+        self.assertWithinQueryBudget(response)
+        pages = {order.book_id: order.reading_page for order in response.context['purchased_orders']}
+        self.assertEqual(pages, {self.books[0].pk: 12, self.books[1].pk: 7, self.books[2].pk: None})
+        self.assertContains(response, 'Continue reading (page 12)')
+
+    def test_bookmarks(self):
+        url = reverse('books:bookmarks', args=[self.books[0].pk])
+        self.assertEqual(self.client.post(url, {'page': 8, 'label': 'Chapter 2'}).status_code, 201)
+        self.assertEqual(self.client.post(url, {'page': 8, 'label': 'Chapter two'}).status_code, 200)
+        self.client.post(url, {'page': 3})
+        results = self.client.get(url).json()['results']
+        self.assertEqual([(b['page'], b['label']) for b in results], [(3, ''), (8, 'Chapter two')])
+
+        bookmark = Bookmark.objects.get(page=3)
+        self.client.post(reverse('books:delete_bookmark', args=[self.books[0].pk, bookmark.pk]))
+        self.assertEqual(list(Bookmark.objects.values_list('page', flat=True)), [8])
+
+        self.client.force_login(User.objects.get(username='seller'))
+        other = Book.objects.create(
+            owner=self.reader, title="Other", author="Author", purchase_price=100,
+            category='Science', file="book_pdfs/other.pdf",
+        )
+        self.assertEqual(self.client.get(reverse('books:bookmarks', args=[other.pk])).status_code, 404)
+        self.assertEqual(self.report(other, 1).status_code, 404)
+
+    def test_process_local_cache_without_inline_flush_warns(self):
+        # The flush worker runs in another process and would never see the reports
+        self.assertEqual([w.id for w in reading.check_cache_backend(None)], ['books.W001'])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(reading.check_cache_backend(None), [])
+        with self.settings(READING_PROGRESS_INLINE_FLUSH=True):
+            self.assertEqual(reading.check_cache_backend(None), [])
+
+
+class BulkImportTests(TestCase):
+    """
+    Checks that import_books hashes, deduplicates, stores and inserts a manifest's books, and resumes.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.seller = User.objects.create_user('publisher', password='pw')
+
+        pdfs = {'a.pdf': benchmark.make_pdf(2), 'b.pdf': benchmark.make_pdf(3), 'c.pdf': benchmark.make_pdf(5)}
+        pdfs['copy_of_a.pdf'] = pdfs['a.pdf']
+        pdfs['broken.pdf'] = b'not a pdf'
+        for name, data in pdfs.items():
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(data)
+        # c.pdf is already in the catalog
+        Book.objects.create(
+            owner=self.seller, title="Existing", author="Author", purchase_price=100, category='Science',
+            file="book_pdfs/c.pdf", file_hash=hashlib.sha256(pdfs['c.pdf']).hexdigest(),
+        )
+        with open(os.path.join(self.directory, 'manifest.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['file', 'title', 'author', 'purchase_price', 'category', 'description'])
+            writer.writerow(['a.pdf', 'Algebra', 'A. Author', '249', 'bsc', 'A book.'])
+            writer.writerow(['b.pdf', 'Biology', 'B. Author', '', '', 'A book.'])
+            writer.writerow(['c.pdf', 'Chemistry', 'C. Author', '99', 'BSC', 'A book.'])
+            writer.writerow(['copy_of_a.pdf', 'Algebra again', 'A. Author', '249', 'BSC', 'A book.'])
+            writer.writerow(['broken.pdf', 'Broken', 'D. Author', '10', 'BSC', 'A book.'])
+            writer.writerow(['missing.pdf', 'Missing', 'E. Author', '10', 'BSC', 'A book.'])
+            writer.writerow(['../outside.pdf', 'Outside', 'F. Author', '10', 'BSC', 'A book.'])
+
+    def import_books(self, **options):
+        out = io.StringIO()
+        call_command('import_books', self.directory, owner='publisher', price='150', workers=2, batch_size=1, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import(self):
+        output = self.import_books(dry_run=True)
+        self.assertIn("Dry run: 2 book(s) would be imported", output)
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '.import_books.checkpoint.json')))
+
+        output = self.import_books(no_covers=True)
+        self.assertIn("2 book(s) imported", output)
+        self.assertIn("2 duplicate(s), 3 invalid", output)
+        algebra = Book.objects.get(title='Algebra')
+        self.assertEqual((algebra.page_count, algebra.processing_status, algebra.category), (2, 'ready', 'bsc'))
+        # Spellings share the first one's category and its count is rebuilt
+        self.assertEqual(Category.objects.get(key=Category.make_key('BSC')).book_count, 1)
+        self.assertEqual(algebra.file.name, f'book_pdfs/{algebra.file_hash[:2]}/{algebra.file_hash[2:4]}/{algebra.file_hash}.pdf')
+        with algebra.file.open('rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), algebra.file_hash)
+        self.assertEqual(Book.objects.get(title='Biology').purchase_price, 150)
+        # The source files stay where they are
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'a.pdf')))
+
+        # Resuming skips what was imported
+        output = self.import_books(no_covers=True)
+        self.assertIn("0 book(s) imported", output)
+        self.assertIn("2 already imported", output)
+        self.assertEqual(Book.objects.count(), 3)
+
+    @unittest.skipUnless(pdf_render.pdfium is not None, "needs pypdfium2")
+    def test_covers(self):
+        self.import_books()
+        book = Book.objects.get(title='Biology')
+        self.assertTrue(book.cover_image.name.startswith('generated_covers/'))
+        with book.cover_image.open('rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), book.cover_hash)
+
+
+class RatingAggregateTests(TestCase):
+    """
+    Checks that reviews keep Book's rating aggregates in step, and that rebuild_ratings repairs them.
+    """
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.readers = [User.objects.create_user(f'reader{i}', password='pw') for i in range(3)]
+        self.book = Book.objects.create(
+            owner=self.seller, title="Rated", author="Author", purchase_price=100, file="book_pdfs/rated.pdf",
+        )
+        self.other = Book.objects.create(
+            owner=self.seller, title="Other", author="Author", purchase_price=100, file="book_pdfs/other.pdf",
+        )
+
+    def assertAggregates(self, book, rating_sum, rating_count, avg_rating):
+        book.refresh_from_db()
+        self.assertEqual((book.rating_sum, book.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(book.avg_rating, avg_rating)
+
+    def test_create_edit_delete(self):
+        reviews = [Review.objects.create(book=self.book, user=user, rating=rating, comment="-")
+                   for user, rating in zip(self.readers, (5, 4, 2))]
+        self.assertAggregates(self.book, 11, 3, 11 / 3)
+
+        reviews[2].rating = 5
+        reviews[2].save()
+        self.assertAggregates(self.book, 14, 3, 14 / 3)
+
+        # Moving a review takes its rating along
+        reviews[1].book = self.other
+        reviews[1].save()
+        self.assertAggregates(self.book, 10, 2, 5.0)
+        self.assertAggregates(self.other, 4, 1, 4.0)
+
+        # A save with the rating deferred falls back to a rebuild
+        review = Review.objects.only('id', 'book').get(pk=reviews[0].pk)
+        review.comment = "Edited"
+        review.save()
+        self.assertAggregates(self.book, 10, 2, 5.0)
+
+        reviews[0].delete()
+        self.assertAggregates(self.book, 5, 1, 5.0)
+        # Queryset deletes go through the post_delete signal too
+        Review.objects.filter(book=self.book).delete()
+        self.assertAggregates(self.book, 0, 0, 0.0)
+
+    def test_rebuild_ratings(self):
+        for user, rating in zip(self.readers, (3, 4, 5)):
+            Review.objects.create(book=self.book, user=user, rating=rating, comment="-")
+        Book.objects.update(rating_sum=0, rating_count=0, avg_rating=0)
+
+        out = io.StringIO()
+        call_command('rebuild_ratings', self.book.pk, stdout=out)
+        self.assertIn("1 book(s)", out.getvalue())
+        self.assertAggregates(self.book, 12, 3, 4.0)
+
+        Book.objects.filter(pk=self.other.pk).update(rating_sum=7, rating_count=2, avg_rating=3.5)
+        call_command('rebuild_ratings', stdout=out)
+        self.assertAggregates(self.other, 0, 0, 0.0)
+        self.assertAggregates(self.book, 12, 3, 4.0)
+
+
+class SearchTests(TestCase):
+    """
+    Checks FTS5 ranking, trigger sync and the icontains fallback of the catalog search (books/search.py).
+    """
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pw')
+
+    def add_book(self, title, description='', status='ready', author="Author"):
+        return Book.objects.create(
+            owner=self.seller, title=title, author=author, description=description, purchase_price=100,
+            file=f"book_pdfs/{title}.pdf", processing_status=status,
+        )
+
+    def require_fts(self):
+        if not search.fts_available():
+            self.skipTest("needs SQLite with FTS5")
+
+    def book_ids(self, query, **kwargs):
+        results, has_more = search.search_books(query, **kwargs)
+        return [result['book_id'] for result in results], has_more
+
+    def test_ranking_and_highlighting(self):
+        self.require_fts()
+        in_description = self.add_book("Cooking at home", description="A dragon guards the pantry.")
+        in_title = self.add_book("The Dragon Book")
+        self.assertEqual(self.book_ids('dragon')[0], [in_title.pk, in_description.pk])
+        # The last word matches as a prefix; operators in the query are not interpreted
+        self.assertEqual(self.book_ids('drag')[0], [in_title.pk, in_description.pk])
+        self.assertEqual(self.book_ids('dragon OR "cooking')[0], [])
+        results, _ = search.search_books('dragon')
+        self.assertEqual(results[0]['title_html'], 'The <mark>Dragon</mark> Book')
+
+    def test_index_follows_book_writes(self):
+        self.require_fts()
+        book = self.add_book("Old title")
+        Book.objects.filter(pk=book.pk).update(title="Fresh title")
+        self.assertEqual(self.book_ids('old')[0], [])
+        self.assertEqual(self.book_ids('fresh')[0], [book.pk])
+        book.delete()
+        self.assertEqual(self.book_ids('fresh')[0], [])
+
+    def test_only_ready_books_fill_a_page(self):
+        ready = [self.add_book(f"Atlas {i}") for i in range(3)]
+        for i in range(3):
+            self.add_book(f"Atlas draft {i}", status='processing')
+        self.add_book("Atlas broken", status='failed')
+
+        for fts in (True, False):
+            with self.subTest(fts=fts), mock.patch.object(search, 'fts_available', return_value=fts and search.fts_available()):
+                book_ids, has_more = self.book_ids('atlas', limit=2)
+                self.assertEqual(len(book_ids), 2)
+                self.assertTrue(has_more)
+                book_ids, has_more = self.book_ids('atlas', limit=2, offset=2)
+                self.assertEqual(len(book_ids), 1)
+                self.assertFalse(has_more)
+
+        with self.settings(BOOK_SEARCH_PAGE_SIZE=2):
+            response = self.client.get(reverse('books:book_search'), {'q': 'atlas'})
+        self.assertEqual(len(response.context['results']), 2)
+        self.assertTrue({result['book'].pk for result in response.context['results']} <= {book.pk for book in ready})
+
+    def test_fallback_matches_every_word(self):
+        book = self.add_book("Gardening", description="Roses and tulips", author="Ann Bloom")
+        self.add_book("Roses only")
+        with mock.patch.object(search, 'fts_available', return_value=False):
+            self.assertEqual(self.book_ids('roses bloom')[0], [book.pk])
+            results, _ = search.search_books('<script>')
+        self.assertEqual(results, [])
+
+
+class EntitlementsCacheTests(QueryBudgetMixin, TestCase):
+    """
+    Checks that the per-user entitlements cache (books/entitlements.py) is
+    invalidated by purchases, failed orders and ownership changes, only once
+    the change commits.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.buyer = User.objects.create_user('buyer', password='pw')
+        self.book = Book.objects.create(
+            owner=self.seller, title="Entitled", author="Author", purchase_price=100, file="book_pdfs/entitled.pdf",
+        )
+        self.order = Order.objects.create(
+            user=self.buyer, book=self.book, order_type='purchase', amount=100, razorpay_order_id='order_ent',
+        )
+
+    def can_read(self, user):
+        return get_entitlements(user).can_read(self.book.pk)
+
+    def test_purchase_and_failure(self):
+        self.assertFalse(self.can_read(self.buyer))
+        with self.captureOnCommitCallbacks(execute=True):
+            payments.mark_order_paid('order_ent', 'pay_ent')
+        self.assertTrue(self.can_read(self.buyer))
+
+        # An admin marking the payment failed revokes access
+        self.order.refresh_from_db()
+        self.order.status = 'failed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+        self.assertFalse(self.can_read(self.buyer))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(pk=self.order.pk).update(status='pending')
+            payments.mark_order_paid('order_ent', 'pay_ent')
+        self.assertTrue(self.can_read(self.buyer))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.delete()
+        self.assertFalse(self.can_read(self.buyer))
+
+    def test_ownership(self):
+        self.assertTrue(self.can_read(self.seller))
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(
+                owner=self.seller, title="Second", author="Author", purchase_price=100, file="book_pdfs/second.pdf",
+            )
+        self.assertTrue(get_entitlements(self.seller).owns(book.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertFalse(get_entitlements(self.seller).owns(book.pk))
+
+    def test_invalidated_only_after_commit(self):
+        self.assertFalse(self.can_read(self.buyer))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.order.status = 'paid'
+            self.order.save()
+            # Still the cached set until the transaction commits
+            self.assertFalse(self.can_read(self.buyer))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.can_read(self.buyer))
+
+        # A rolled-back change leaves the cache alone
+        version = cache.get(f"entitlements:version:{self.buyer.pk}")
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.order.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(cache.get(f"entitlements:version:{self.buyer.pk}"), version)
+
+    def test_warm_cache_views(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            payments.mark_order_paid('order_ent', 'pay_ent')
+        self.client.force_login(self.buyer)
+        for name in ('books:book_detail', 'books:read_book'):
+            url = reverse(name, args=[self.book.pk])
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertWithinQueryBudget(response)
+            # Entitlements come from the cache
+            self.assertFalse([q for q in captured.captured_queries if 'books_order' in q['sql']], name)
+
+
+class StreamingTests(TestCase):
+    """
+    Checks Range, conditional requests and offload headers of the PDF stream (books/streaming.py).
+    """
+    data = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, BOOK_FILE_OFFLOAD=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.book = Book.objects.create(
+            owner=self.seller, title="Streamed Book", author="Author", purchase_price=100,
+            file=ContentFile(self.data, name='streamed.pdf'), file_hash=hashlib.sha256(self.data).hexdigest(),
+        )
+        self.url = reverse('books:stream_book', args=[self.book.pk])
+        self.etag = f'"{self.book.file_hash}"'
+        self.client.force_login(self.seller)
+
+    def test_parse_range(self):
+        size = 1000
+        cases = {
+            None: None,
+            '': None,
+            'bytes=0-99': (0, 99),
+            'bytes=900-': (900, 999),
+            'bytes=-100': (900, 999),
+            'bytes=-5000': (0, 999),
+            'bytes=990-5000': (990, 999),
+            'bytes=-': None,
+            'bytes=0-1,5-9': None,
+            'items=0-9': None,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(streaming.parse_range(header, size), expected)
+        for header in ('bytes=1000-', 'bytes=50-10', 'bytes=-0'):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                streaming.parse_range(header, size)
+
+    def test_ranges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual((response['ETag'], response['Accept-Ranges']), (self.etag, 'bytes'))
+        self.assertIn('streamed-book.pdf', response['Content-Disposition'])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+        # A stale If-Range gets the whole file
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_if_none_match(self):
+        for header in (self.etag, f'W/{self.etag}', f'"other", {self.etag}', '*'):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_offload(self):
+        with self.settings(BOOK_FILE_OFFLOAD='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.book.file.name}')
+        with self.settings(BOOK_FILE_OFFLOAD='x-sendfile'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Sendfile'], self.book.file.path)
+            self.assertEqual(response.content, b'')
+
+    @unittest.skipUnless(boto3 is not None and mock_aws is not None, "needs boto3 and moto")
+    def test_sendfile_from_s3_streams(self):
+        with mock_aws():
+            boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='books')
+            storage = ContentAddressedS3Storage(bucket='books', region_name='us-east-1')
+            self.assertEqual(storage.save('book_pdfs/streamed.pdf', ContentFile(self.data)), self.book.file.name)
+            # S3 has no local paths, so Django streams the file itself
+            with mock.patch.object(Book._meta.get_field('file'), 'storage', storage), \
+                    self.settings(BOOK_FILE_OFFLOAD='x-sendfile'):
+                response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+                self.assertEqual(response.status_code, 206)
+                self.assertNotIn('X-Sendfile', response)
+                self.assertEqual(b''.join(response.streaming_content), self.data[:10])
+
+
+@override_settings(BOOK_PROCESSING_MAX_ATTEMPTS=3, BOOK_PROCESSING_RETRY_DELAY=30, BOOK_PROCESSING_STALE_AFTER=600)
+class ProcessingQueueTests(TestCase):
+    """
+    Checks claiming, retry backoff and stale-job recovery of the upload queue (books/processing.py).
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, READER_PAGE_CACHE_DIR=os.path.join(self.media_root, 'pages'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staging = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging)
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.book = Book.objects.create(
+            owner=self.seller, title="Queued", author="Author", purchase_price=100, file='', processing_status='processing',
+        )
+        path = os.path.join(self.staging, 'upload.pdf')
+        with open(path, 'wb') as f:
+            f.write(benchmark.make_pdf(1))
+        self.job = processing.enqueue(self.book, path, 'upload.pdf')
+
+    def flaky_step(self, job, book, path):
+        raise OSError("storage unavailable")
+
+    def make_due(self):
+        BookProcessingJob.objects.filter(pk=self.job.pk).update(next_attempt_at=timezone.now())
+
+    def test_transient_failures_back_off(self):
+        with mock.patch.object(processing, 'PIPELINE_STEPS', [self.flaky_step]):
+            for attempt, delay in ((1, 30), (2, 60)):
+                self.assertEqual(processing.claim_next_job(), self.job.pk)
+                job = processing.run_job(self.job.pk)
+                self.assertEqual((job.status, job.attempts), ('queued', attempt))
+                self.assertAlmostEqual((job.next_attempt_at - timezone.now()).total_seconds(), delay, delta=5)
+                # Not claimed again before the delay has passed
+                self.assertIsNone(processing.claim_next_job())
+                self.make_due()
+
+            self.assertEqual(processing.claim_next_job(), self.job.pk)
+            job = processing.run_job(self.job.pk)
+        self.assertEqual((job.status, job.attempts, job.error), ('failed', 3, "storage unavailable"))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.processing_status, 'failed')
+        self.assertFalse(os.path.exists(self.job.staged_path))
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        self.assertEqual(processing.claim_next_job(), self.job.pk)
+        # The worker died: nothing to claim until the job goes stale
+        self.assertIsNone(processing.claim_next_job())
+        BookProcessingJob.objects.filter(pk=self.job.pk).update(started_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(processing.claim_next_job(), self.job.pk)
+        self.assertIsNone(processing.claim_next_job())
+
+        job = processing.run_job(self.job.pk)
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.processing_status, self.book.page_count), ('ready', 1))
+
+    def test_job_that_keeps_killing_workers_fails(self):
+        BookProcessingJob.objects.filter(pk=self.job.pk).update(
+            status='running', attempts=3, started_at=timezone.now() - timedelta(seconds=601),
+        )
+        self.assertEqual(processing.claim_next_job(), self.job.pk)
+        job = processing.run_job(self.job.pk)
+        self.assertEqual(job.status, 'failed')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.processing_status, 'failed')
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec_test')
+class PaymentWebhookTests(TestCase):
+    """
+    Checks signature verification and idempotent event handling of the Razorpay webhook.
+    """
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.buyer = User.objects.create_user('buyer', password='pw')
+        self.book = Book.objects.create(
+            owner=self.seller, title="Hooked", author="Author", purchase_price=100, file="book_pdfs/hooked.pdf",
+        )
+        self.order = Order.objects.create(
+            user=self.buyer, book=self.book, order_type='purchase', amount=100, razorpay_order_id='order_hook',
+        )
+
+    def event(self, event_type, razorpay_order_id='order_hook'):
+        return json.dumps({
+            'event': event_type,
+            'payload': {'payment': {'entity': {'id': 'pay_hook', 'order_id': razorpay_order_id}}},
+        }).encode()
+
+    def post(self, body, event_id=None, signature=None):
+        headers = {'HTTP_X_RAZORPAY_SIGNATURE': payments.sign_webhook_body(body) if signature is None else signature}
+        if event_id:
+            headers['HTTP_X_RAZORPAY_EVENT_ID'] = event_id
+        return self.client.post(reverse('books:payment_webhook'), body, content_type='application/json', **headers)
+
+    def order_status(self):
+        self.order.refresh_from_db()
+        return self.order.status
+
+    def test_rejects_bad_signatures(self):
+        body = self.event('payment.captured')
+        for signature in ('', 'deadbeef', payments.sign_webhook_body(body + b' ')):
+            with self.subTest(signature=signature):
+                self.assertEqual(self.post(body, signature=signature).status_code, 400)
+        with self.settings(RAZORPAY_WEBHOOK_SECRET=''):
+            self.assertEqual(self.post(body, signature='anything').status_code, 400)
+        self.assertEqual(self.order_status(), 'pending')
+        self.assertFalse(PaymentEvent.objects.exists())
+        # Signed but not an event
+        self.assertEqual(self.post(b'[1, 2]').status_code, 400)
+
+    def test_redelivery_is_a_noop(self):
+        body = self.event('payment.captured')
+        response = self.post(body, event_id='evt_1')
+        self.assertEqual(response.json()['outcome'], 'paid')
+        self.assertEqual(self.order_status(), 'paid')
+
+        self.assertEqual(self.post(body, event_id='evt_1').json()['outcome'], 'duplicate')
+        # Without an event ID, the body hash identifies the event
+        self.assertEqual(self.post(body).json()['outcome'], 'noop')
+        self.assertEqual(self.post(body).json()['outcome'], 'duplicate')
+        self.assertEqual(PaymentEvent.objects.count(), 2)
+        # The sale was counted once
+        self.assertEqual(SellerDailySales.objects.get(seller=self.seller).units, 1)
+
+    def test_failure_and_late_capture(self):
+        self.assertEqual(self.post(self.event('payment.failed'), event_id='evt_f').json()['outcome'], 'failed')
+        self.assertEqual(self.order_status(), 'failed')
+        # The gateway's capture overrides an earlier failure
+        self.assertEqual(self.post(self.event('payment.captured'), event_id='evt_c').json()['outcome'], 'paid')
+        self.assertEqual(self.post(self.event('payment.failed'), event_id='evt_f2').json()['outcome'], 'noop')
+        self.assertEqual(self.order_status(), 'paid')
+        self.assertEqual(self.post(self.event('refund.created'), event_id='evt_r').json()['outcome'], 'ignored')
+        self.assertEqual(self.post(self.event('payment.captured', 'order_unknown'), event_id='evt_u').json()['outcome'], 'noop')
+
+    def test_duplicate_purchase_closes_the_order(self):
+        Order.objects.create(
+            user=self.buyer, book=self.book, order_type='purchase', amount=100, status='paid',
+            razorpay_order_id='order_first', paid_at=timezone.now(),
+        )
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse('books:payment_callback'), benchmark.callback_payload('order_hook'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.order_status(), 'duplicate')
+        self.assertEqual(self.order.razorpay_payment_id, 'pay_order_hook')
+
+        # The webhook for the same payment changes nothing
+        self.assertEqual(self.post(self.event('payment.captured'), event_id='evt_d').json()['outcome'], 'noop')
+        self.assertEqual(self.order_status(), 'duplicate')
+
+    def test_other_integrity_errors_are_not_duplicates(self):
+        body = self.event('payment.captured')
+        self.client.raise_request_exception = False
+        with mock.patch.object(payments, 'mark_order_paid', side_effect=IntegrityError("NOT NULL constraint failed")):
+            self.assertEqual(self.post(body, event_id='evt_e').status_code, 500)
+        # Nothing was recorded, so the gateway's redelivery is applied
+        self.assertFalse(PaymentEvent.objects.exists())
+        self.assertEqual(self.post(body, event_id='evt_e').json()['outcome'], 'paid')
+
+
+class CategoryCountTests(TestCase):
+    """
+    Checks that Category.book_count follows the ready books of each category.
+    """
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pw')
+
+    def make_book(self, category, **fields):
+        return Book.objects.create(
+            owner=self.seller, title="Counted", author="Author", purchase_price=100,
+            file="book_pdfs/counted.pdf", category=category, **fields,
+        )
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'book_count'))
+
+    def test_spellings_share_a_category(self):
+        self.make_book("Fine Arts")
+        book = self.make_book("  fine   ARTS ")
+        self.assertEqual(book.category, "Fine Arts")
+        self.assertEqual(self.counts(), {"Fine Arts": 2})
+
+    def test_counts_follow_books(self):
+        book = self.make_book("Science", processing_status='processing')
+        self.assertEqual(self.counts(), {"Science": 0})
+
+        book.processing_status = 'ready'
+        book.save(update_fields=['processing_status'])
+        self.assertEqual(self.counts(), {"Science": 1})
+
+        book.category = "history"
+        book.save()
+        self.assertEqual(self.counts(), {"Science": 0, "history": 1})
+
+        book.processing_status = 'failed'
+        book.save(update_fields=['processing_status'])
+        self.assertEqual(self.counts(), {"Science": 0, "history": 0})
+
+        book.processing_status = 'ready'
+        book.save()
+        Book.objects.filter(pk=book.pk).delete()
+        self.assertEqual(self.counts(), {"Science": 0, "history": 0})
+
+        # Deleting the seller cascades to their books
+        self.make_book("Science")
+        self.seller.delete()
+        self.assertEqual(self.counts(), {"Science": 0, "history": 0})
+
+    def test_rebuild_command(self):
+        book = self.make_book("Science")
+        self.make_book("Poetry")
+        # Queryset updates bypass Book.save()
+        Book.objects.filter(pk=book.pk).update(category="  poetry")
+        Book.objects.create(
+            owner=self.seller, title="Raw", author="Author", purchase_price=100, file="book_pdfs/raw.pdf",
+        )
+        Book.objects.filter(title="Raw").update(category="Drama")
+
+        out = io.StringIO()
+        call_command('rebuild_category_counts', stdout=out)
+        self.assertIn("Rebuilt book counts for 4 categories (1 book(s) moved", out.getvalue())
+        self.assertEqual(self.counts(), {"Science": 0, "Poetry": 2, "Others": 0, "Drama": 1})
+
+    def test_data_migration_merges_spellings(self):
+        from django.apps import apps
+
+        populate_categories = importlib.import_module('books.migrations.0018_categories').populate_categories
+        books = [self.make_book("Poetry") for _ in range(3)]
+        books += [self.make_book("Science"), self.make_book("Science", processing_status='processing')]
+        # Spellings as they were before categories were normalized
+        for book, category in zip(books, ("poetry", "poetry", "Poetry ", "Science", "science")):
+            Book.objects.filter(pk=book.pk).update(category=category)
+        Category.objects.all().delete()
+
+        populate_categories(apps, None)
+        # The most used spelling wins
+        self.assertEqual(self.counts(), {"poetry": 3, "Science": 1})
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('category', flat=True)),
+            ["poetry", "poetry", "poetry", "Science", "Science"],
+        )
+
+
+class CatalogCacheTests(TestCase):
+    """
+    Checks that the cached detail page (books/catalog_cache.py) follows changes made by the upload pipeline.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.staging = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging)
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.book = Book.objects.create(
+            owner=self.seller, title="Cached", author="Author", purchase_price=100, file='', processing_status='processing',
+        )
+        self.url = reverse('books:book_detail', args=[self.book.pk])
+
+    def test_failed_processing_updates_detail_page(self):
+        self.assertContains(self.client.get(self.url), "This book is being processed.")
+
+        # The staged upload is gone: a permanent failure
+        processing.enqueue(self.book, os.path.join(self.staging, 'missing.pdf'), 'missing.pdf')
+        self.assertIsNotNone(processing.claim_next_job())
+        with self.captureOnCommitCallbacks(execute=True):
+            job = processing.run_job(self.book.processing_jobs.get().pk)
+        self.assertEqual(job.status, 'failed')
+
+        response = self.client.get(self.url)
+        self.assertContains(response, "PDF failed. Please upload the file again.")
+        self.assertNotContains(response, "This book is being processed.")
+
+
+@override_settings(DASHBOARD_ORDERS_PAGE_SIZE=2)
+class DashboardPaginationTests(TestCase):
+    """
+    Checks the keyset-paginated sales list on the seller dashboard.
+    """
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pw')
+        book = Book.objects.create(
+            owner=self.seller, title="Sold", author="Author", purchase_price=100, file="book_pdfs/sold.pdf",
+        )
+        buyers = [User.objects.create_user(f'buyer{i}', password='pw') for i in range(5)]
+        self.orders = [
+            Order.objects.create(
+                user=buyer, book=book, order_type='purchase', amount=100, status='paid',
+                razorpay_order_id=f'order_sold_{i}', paid_at=timezone.now(),
+            )
+            for i, buyer in enumerate(buyers)
+        ]
+        # Ties on created_at are broken by id
+        Order.objects.filter(pk__in=[order.pk for order in self.orders[1:4]]).update(created_at=self.orders[0].created_at)
+        self.client.force_login(self.seller)
+
+    def test_walks_every_order_once(self):
+        url = reverse('accounts:user_dashboard')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {'cursor': cursor} if cursor else {})
+            self.assertEqual(response.context['is_first_page'], cursor is None)
+            seen += [order.pk for order in response.context['relevant_orders']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+        expected = Order.objects.order_by('-created_at', '-id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    """
+    Checks that page renders from remote book storage reuse one local copy of the PDF.
+    """
+
+    def setUp(self):
+        if pdf_render.pdfium is None:
+            self.skipTest("needs pypdfium2")
+        if boto3 is None or mock_aws is None:
+            self.skipTest("needs boto3 and moto")
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(READER_PAGE_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_remote_pdf_is_downloaded_once(self):
+        data = benchmark.make_pdf(3)
+        with mock_aws():
+            boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='books')
+            storage = ContentAddressedS3Storage(bucket='books', region_name='us-east-1')
+            name = storage.save('book_pdfs/remote.pdf', ContentFile(data))
+            book = Book(pk=1, file=name, file_hash=hashlib.sha256(data).hexdigest())
+            book.file.storage = storage
+
+            with mock.patch.object(storage, '_open', wraps=storage._open) as opened:
+                for page_number in (1, 2, 3):
+                    self.assertTrue(os.path.exists(page_cache.get_page(book, page_number, 72)))
+        self.assertEqual(opened.call_count, 1)
+        with open(os.path.join(self.cache_dir, book.file_hash[:2], book.file_hash, 'source.pdf'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+@override_settings(BOOK_LIST_PAGE_SIZE=3)
+class CatalogPaginationTests(TestCase):
+    """
+    Checks the keyset-paginated catalog (books/pagination.py) and its JSON feed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user('seller', password='pw')
+        self.books = [
+            Book.objects.create(
+                owner=seller, title=f"Book {i}", author="Author", purchase_price=100,
+                category='Fiction' if i % 2 else 'Science', file=f"book_pdfs/page_{i}.pdf",
+            )
+            for i in range(8)
+        ]
+        # Ties on uploaded_at are broken by id
+        Book.objects.filter(pk__in=[book.pk for book in self.books[2:6]]).update(uploaded_at=self.books[2].uploaded_at)
+        Book.objects.create(
+            owner=seller, title="Draft", author="Author", purchase_price=100, file="book_pdfs/draft.pdf",
+            processing_status='processing',
+        )
+
+    def walk(self, **params):
+        url = reverse('books:book_list_json')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(set(data), {'results', 'next_cursor'})
+            self.assertLessEqual(len(data['results']), 3)
+            seen += [result['id'] for result in data['results']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return seen, data
+
+    def test_walks_every_book_once(self):
+        seen, data = self.walk()
+        expected = Book.objects.filter(processing_status='ready').order_by('-uploaded_at', '-id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(
+            set(data['results'][0]),
+            {'id', 'title', 'author', 'category', 'avg_rating', 'rating_count', 'cover_url', 'cover_srcset', 'detail_url'},
+        )
+
+    def test_category_with_cursor(self):
+        seen, _ = self.walk(category='Fiction')
+        expected = Book.objects.filter(category='Fiction').order_by('-uploaded_at', '-id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+
+        # The HTML list follows the same cursors
+        first = self.client.get(reverse('books:book_list'), {'category': 'Fiction'})
+        response = self.client.get(reverse('books:book_list'), {'category': 'Fiction', 'cursor': first.context['next_cursor']})
+        self.assertEqual([book.pk for book in response.context['books']], seen[3:6])
+
+    def test_bad_cursors_are_404(self):
+        book = self.books[0]
+        tampered = [
+            'not-a-cursor',
+            '!!!',
+            pagination._encode('yesterday', book.pk),
+            pagination._encode(book.uploaded_at.isoformat(), 'x'),
+            pagination._encode(book.uploaded_at.isoformat(), 10 ** 30),
+            pagination._encode(book.uploaded_at.isoformat()),
+        ]
+        for cursor in tampered:
+            for name in ('books:book_list', 'books:book_list_json'):
+                with self.subTest(cursor=cursor, view=name):
+                    self.assertEqual(self.client.get(reverse(name), {'cursor': cursor}).status_code, 404)
+
+
+class CoverVariantTests(TestCase):
+    """
+    Checks the resized cover variants served by cover_variant_view (books/covers.py).
+    """
+
+    def setUp(self):
+        from PIL import Image
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 1200), '#336699').save(buffer, format='PNG')
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.book = Book.objects.create(
+            owner=self.seller, title="Covered", author="Author", purchase_price=100, file="book_pdfs/covered.pdf",
+            cover_image=ContentFile(buffer.getvalue(), name='covered.png'),
+        )
+        self.assertTrue(self.book.cover_hash)
+
+    def url(self, width=320, ext='webp', cover_hash=None):
+        return reverse('books:cover_variant', args=[cover_hash or self.book.cover_hash, width, ext])
+
+    def test_allow_list(self):
+        for width, ext in ((200, 'webp'), (320, 'png'), (320, 'gif')):
+            with self.subTest(width=width, ext=ext):
+                self.assertEqual(self.client.get(self.url(width, ext)).status_code, 404)
+        self.assertEqual(self.client.get(self.url(cover_hash='0' * 64)).status_code, 404)
+
+    def test_built_on_first_request(self):
+        from PIL import Image
+
+        name = covers.derivative_name(self.book.cover_hash, 320, 'webp')
+        self.assertFalse(default_storage.exists(name))
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (320, 480))
+        self.assertTrue(default_storage.exists(name))
+
+        response = self.client.get(self.url(160, 'jpg'))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_unpublished_books_are_not_built(self):
+        Book.objects.filter(pk=self.book.pk).update(processing_status='processing')
+        self.assertEqual(self.client.get(self.url()).status_code, 404)
+
+    def test_concurrent_builds_leave_one_file(self):
+        # Both builders passed the exists() check: the second write replaces the first
+        covers.build_derivatives(self.book, widths=(160,), formats=('jpg',))
+        covers.build_derivatives(self.book, widths=(160,), formats=('jpg',), force=True)
+        directory = os.path.dirname(covers.derivative_name(self.book.cover_hash, 160, 'jpg'))
+        self.assertEqual(default_storage.listdir(directory), ([], [f'{self.book.cover_hash}_160.jpg']))
+
+
+class PdfCoverTests(TestCase):
+    """
+    Checks covers rendered from page 1 of the PDF (books/pdf_render.py, generate_pdf_covers).
+    """
+
+    def setUp(self):
+        if pdf_render.pdfium is None:
+            self.skipTest("needs pypdfium2")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.pdf_path = os.path.join(self.media_root, 'sample.pdf')
+        with open(self.pdf_path, 'wb') as f:
+            f.write(benchmark.make_pdf(2))
+        self.seller = User.objects.create_user('seller', password='pw')
+
+    def test_page_out_of_range_is_not_retried(self):
+        with mock.patch.object(pdf_render, '_render_pdftoppm') as fallback:
+            with self.assertRaisesMessage(pdf_render.RenderError, "Page 3 out of range"):
+                pdf_render.render_page(self.pdf_path, 3)
+        fallback.assert_not_called()
+
+    def test_unreadable_pdf_falls_back_to_pdftoppm(self):
+        with open(self.pdf_path, 'wb') as f:
+            f.write(b'not a pdf')
+        with mock.patch.object(pdf_render.shutil, 'which', return_value='/usr/bin/pdftoppm'), \
+                mock.patch.object(pdf_render, '_render_pdftoppm', return_value='image') as fallback:
+            with self.assertLogs('books.pdf_render', 'WARNING'):
+                self.assertEqual(pdf_render.render_page(self.pdf_path, 1, width=100), 'image')
+        fallback.assert_called_once_with(self.pdf_path, 1, 100, None)
+
+    def test_cover_from_first_page(self):
+        from PIL import Image
+
+        name = covers.cover_from_first_page('ab' * 32, self.pdf_path)
+        self.assertEqual(name, covers.generated_cover_name('ab' * 32))
+        with default_storage.open(name) as f, Image.open(f) as image:
+            self.assertEqual((image.format, image.width), ('JPEG', covers.GENERATED_COVER_WIDTH))
+
+        # Cached by file hash: the same file is not rendered again
+        with mock.patch.object(pdf_render, 'render_page') as render:
+            self.assertEqual(covers.cover_from_first_page('ab' * 32, self.pdf_path), name)
+        render.assert_not_called()
+
+    def test_generate_pdf_covers(self):
+        def make_book(title, data, **fields):
+            return Book.objects.create(
+                owner=self.seller, title=title, author="Author", purchase_price=100,
+                file=ContentFile(data, name=f'{title.lower()}.pdf'), **fields,
+            )
+
+        book = make_book("Plain", benchmark.make_pdf(1))
+        broken = make_book("Broken", b'not a pdf')
+        pending = make_book("Pending", benchmark.make_pdf(1), processing_status='processing')
+
+        out = io.StringIO()
+        with mock.patch.object(pdf_render.shutil, 'which', return_value=None), self.assertLogs('books.pdf_render', 'WARNING'):
+            call_command('generate_pdf_covers', stdout=out)
+        output = out.getvalue()
+        self.assertIn(f"Skipping 'Broken' (id {broken.pk})", output)
+        self.assertIn("Generated covers for 1 book(s).", output)
+
+        book.refresh_from_db()
+        self.assertTrue(book.cover_image.name.startswith('generated_covers/'))
+        self.assertTrue(book.cover_hash)
+        self.assertTrue(default_storage.exists(covers.derivative_name(book.cover_hash, 320, 'webp')))
+        pending.refresh_from_db()
+        self.assertFalse(pending.cover_image)
+
+
+class ReaderPageTests(TestCase):
+    """
+    Checks access, validation and caching headers of the server-rendered reader pages.
+    """
+
+    def setUp(self):
+        if pdf_render.pdfium is None:
+            self.skipTest("needs pypdfium2")
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, READER_PAGE_CACHE_DIR=os.path.join(self.media_root, 'pages'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.seller = User.objects.create_user('seller', password='pw')
+        self.buyer = User.objects.create_user('buyer', password='pw')
+        data = benchmark.make_pdf(3)
+        self.book = Book.objects.create(
+            owner=self.seller, title="Paged", author="Author", purchase_price=100,
+            file=ContentFile(data, name='paged.pdf'), file_hash=hashlib.sha256(data).hexdigest(),
+        )
+        self.order = Order.objects.create(
+            user=self.buyer, book=self.book, order_type='purchase', amount=100, razorpay_order_id='order_pages',
+        )
+
+    def page_url(self, page_number=1, dpi=72):
+        return reverse('books:book_page', args=[self.book.pk, page_number, dpi])
+
+    def test_only_owner_and_purchasers(self):
+        manifest_url = reverse('books:book_pages', args=[self.book.pk])
+        self.client.login(username='buyer', password='pw')
+        self.assertEqual(self.client.get(manifest_url).status_code, 404)
+        self.assertEqual(self.client.get(self.page_url()).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payments.mark_order_paid('order_pages', 'pay_pages')
+        response = self.client.get(self.page_url())
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        self.client.login(username='seller', password='pw')
+        response = self.client.get(manifest_url)
+        self.assertEqual(response.status_code, 200)
+        manifest = response.json()
+        self.assertEqual(manifest['page_count'], 3)
+        self.assertEqual(len(manifest['page_sizes']), 3)
+        self.assertEqual(manifest['dpi_levels'], list(page_cache.dpi_levels()))
+        self.assertEqual(
+            manifest['page_url_template'].format(page=2, dpi=110),
+            reverse('books:book_page', args=[self.book.pk, 2, 110]),
+        )
+
+    def test_unknown_page_or_dpi(self):
+        self.client.login(username='seller', password='pw')
+        self.assertEqual(self.client.get(self.page_url(dpi=96)).status_code, 404)
+        self.assertEqual(self.client.get(self.page_url(page_number=4)).status_code, 404)
+        self.assertEqual(self.client.get(self.page_url(page_number=0)).status_code, 404)
+
+    def test_etag(self):
+        self.client.login(username='seller', password='pw')
+        response = self.client.get(self.page_url(page_number=2, dpi=110))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['ETag'], f'"{self.book.file_hash}-2-110"')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        response.close()
+
+        with mock.patch.object(page_cache, 'get_page') as get_page:
+            response = self.client.get(self.page_url(page_number=2, dpi=110), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        get_page.assert_not_called()
+
+
+@override_settings(PAYMENT_GATEWAY_BACKOFF=0, PAYMENT_GATEWAY_MAX_RETRIES=2)
+class PaymentGatewayTests(TestCase):
+    """
+    Checks retries and the circuit breaker around Razorpay order creation (books/payments.py).
+    """
+
+    def setUp(self):
+        self.breaker = payments.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        patcher = mock.patch.object(payments, 'breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = 1000.0
+        patcher = mock.patch.object(payments.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_order(self, *outcomes):
+        with mock.patch.object(payments, '_attempt', side_effect=outcomes) as attempt:
+            try:
+                return async_to_sync(payments.acreate_order)(10000, 'INR', 'rcpt_1')
+            finally:
+                self.attempts = attempt.call_count
+
+    def test_transient_error_is_retried(self):
+        order = self.create_order(payments._Retryable("HTTP 503"), {'id': 'order_1'})
+        self.assertEqual((order, self.attempts), ({'id': 'order_1'}, 2))
+        self.assertEqual((self.breaker.state, self.breaker.failures), ('closed', 0))
+
+    def test_gives_up_after_last_attempt(self):
+        with self.assertRaisesMessage(payments.PaymentGatewayError, "did not respond: HTTP 503"):
+            self.create_order(*[payments._Retryable("HTTP 503")] * 3)
+        self.assertEqual(self.attempts, 3)
+        self.assertEqual(self.breaker.failures, 1)
+
+        # A rejected request means the gateway is up: not retried, not a failure
+        with self.assertRaisesMessage(payments.PaymentGatewayError, "Amount too small"):
+            self.create_order(payments.PaymentGatewayError("Amount too small"))
+        self.assertEqual((self.attempts, self.breaker.failures), (1, 0))
+
+    def test_breaker_opens_and_recovers(self):
+        with self.assertLogs('books.payments', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(payments.PaymentGatewayError):
+                    self.create_order(*[payments._Retryable("timeout")] * 3)
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(payments.GatewayUnavailable):
+            self.create_order({'id': 'order_1'})
+        self.assertEqual(self.attempts, 0)
+
+        # Half-open: one trial call; a failure opens the circuit again
+        self.now += 30
+        self.assertEqual(self.breaker.state, 'half-open')
+        with self.assertRaises(payments.PaymentGatewayError), self.assertLogs('books.payments', 'WARNING'):
+            self.create_order(*[payments._Retryable("timeout")] * 3)
+        self.assertEqual(self.breaker.state, 'open')
+
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        # Only the trial gets through until it reports back
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.create_order({'id': 'order_2'}), {'id': 'order_2'})
+
+    def test_view_reports_unavailable_gateway(self):
+        seller = User.objects.create_user('seller', password='pw')
+        User.objects.create_user('buyer', password='pw')
+        book = Book.objects.create(
+            owner=seller, title="Gated", author="Author", purchase_price=100, file="book_pdfs/gated.pdf",
+        )
+        self.client.login(username='buyer', password='pw')
+        url = reverse('books:create_order', args=[book.pk, 'purchase'])
+        self.breaker.opened_at = self.now
+
+        with mock.patch.object(payments, '_attempt') as attempt:
+            response = self.client.post(url, follow=True)
+        attempt.assert_not_called()
+        self.assertRedirects(response, reverse('books:book_detail', args=[book.pk]))
+        self.assertContains(response, "Payment service is temporarily unavailable.")
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Checks which alias bookstore/db_routers.py picks for reads and writes.
+    A TransactionTestCase, as reads inside a transaction always use the primary.
+    """
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(db_routers, 'replica_is_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.seller = User.objects.create_user('seller', password='pw')
+        Book.objects.create(
+            owner=self.seller, title="Replicated", author="Author", purchase_price=100, file="book_pdfs/replicated.pdf",
+        )
+
+    def get_catalog(self):
+        """
+        Fetches the JSON catalog and returns the aliases the router picked for
+        its reads. The queries themselves run on the primary, as the test
+        database has no replica connection.
+        """
+        # A cached page would skip the database altogether
+        cache.clear()
+        decisions = []
+        db_for_read = db_routers.PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            decisions.append(db_for_read(router, model, **hints))
+            return db_routers.DEFAULT_DB_ALIAS
+
+        with mock.patch.object(db_routers.PrimaryReplicaRouter, 'db_for_read', record):
+            response = self.client.get(reverse('books:book_list_json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        return set(decisions)
+
+    def test_read_only_view_uses_replica(self):
+        self.assertEqual(self.get_catalog(), {db_routers.REPLICA_ALIAS})
+        self.assertNotIn(db_routers.PIN_COOKIE, self.client.cookies)
+
+    def test_unsafe_request_pins_client_to_primary(self):
+        response = self.client.post(reverse('accounts:login'), {'username': 'seller', 'password': 'pw'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[db_routers.PIN_COOKIE]['max-age'], 5)
+        self.assertEqual(self.get_catalog(), {db_routers.DEFAULT_DB_ALIAS})
+
+        # Once the pin expires, reads go back to the replica
+        del self.client.cookies[db_routers.PIN_COOKIE]
+        self.assertEqual(self.get_catalog(), {db_routers.REPLICA_ALIAS})
+
+    def test_writes_use_primary(self):
+        router = db_routers.PrimaryReplicaRouter()
+        # Outside a request (management commands, workers) everything uses the primary
+        self.assertEqual(router.db_for_read(Book), db_routers.DEFAULT_DB_ALIAS)
+
+        state = db_routers._RoutingState(pinned=False)
+        state.use_replica = True
+        token = db_routers._routing.set(state)
+        self.addCleanup(db_routers._routing.reset, token)
+        self.assertEqual(router.db_for_read(Book), db_routers.REPLICA_ALIAS)
+        # Sessions and auth always use the primary
+        self.assertEqual(router.db_for_read(User), db_routers.DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(Book), db_routers.DEFAULT_DB_ALIAS)
+        # Read-your-writes: the rest of the request reads from the primary
+        self.assertEqual(router.db_for_read(Book), db_routers.DEFAULT_DB_ALIAS)
+        with transaction.atomic():
+            state.wrote = False
+            self.assertEqual(router.db_for_read(Book), db_routers.DEFAULT_DB_ALIAS)
+
+
+class SqliteTuningTests(TestCase):
+    """
+    Checks the opt-in SQLite settings (SQLITE_TUNING=1) and `manage.py sqlite_maintenance`.
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+
+    def scratch_connection(self, alias, tuning):
+        """
+        Opens a connection to a scratch file with the DATABASES entry that
+        bookstore/settings.py builds for the given SQLITE_TUNING.
+        """
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with mock.patch.dict(os.environ, {'SQLITE_TUNING': '1' if tuning else '0', 'DB_ENGINE': 'sqlite'}):
+            database = runpy.run_path(os.path.join(settings.BASE_DIR, 'bookstore', 'settings.py'))['DATABASES']['default']
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        scratch = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3'), 'OPTIONS': database.get('OPTIONS', {})},
+            alias=alias,
+        )
+        self.addCleanup(scratch.close)
+        with scratch.cursor() as cursor:
+            cursor.execute("CREATE TABLE t (x INTEGER)")
+            cursor.execute("INSERT INTO t VALUES (1)")
+        return scratch
+
+    def test_pragmas_on_new_connections(self):
+        with self.scratch_connection('tuned', tuning=True).cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_maintenance_command(self):
+        databases = {'plain': self.scratch_connection('plain', tuning=False), 'tuned': self.scratch_connection('tuned', tuning=True)}
+        out = io.StringIO()
+        with mock.patch('books.management.commands.sqlite_maintenance.connections', databases):
+            call_command('sqlite_maintenance', stdout=out)
+        self.assertRegex(out.getvalue(), (
+            r"^plain: optimized \(not in WAL mode, nothing to checkpoint\)\n"
+            r"tuned: optimized, checkpointed (\d+)/\1 WAL frame\(s\)\n$"
+        ))
@@ -0,0 +1,98 @@
+# books/uploads.py
+"""
+Upload handling for book PDFs.
+
+StagingHashUploadHandler streams each uploaded file straight into
+settings.BOOK_UPLOAD_STAGING_DIR and computes its SHA-256 in the same pass,
+so BookUploadForm never has to re-read the file to hash it. Staged files are
+not deleted when the request ends; the processing job in books/processing.py
+validates them and moves them into storage.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+def staging_dir():
+    path = os.fspath(settings.BOOK_UPLOAD_STAGING_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    An uploaded file written to the staging directory.
+    Unlike TemporaryUploadedFile it survives the request, and it carries the
+    SHA-256 of its contents in .sha256 once the upload completes, and the
+    seconds spent hashing in .hash_seconds.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        fd, path = tempfile.mkstemp(suffix='.upload' + ext, dir=staging_dir())
+        file = os.fdopen(fd, 'w+b')
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.staged_path = path
+        self.sha256 = None
+        self.hash_seconds = None
+
+    def temporary_file_path(self):
+        # Lets FileSystemStorage move (rather than copy) the file into place
+        return self.staged_path
+
+    def discard(self):
+        """
+        Closes and deletes the staged file (e.g. when the form is invalid).
+        """
+        self.close()
+        try:
+            os.remove(self.staged_path)
+        except FileNotFoundError:
+            pass
+
+
+class StagingHashUploadHandler(FileUploadHandler):
+    """
+    Streams uploads to the staging directory while hashing them.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.hash_seconds = 0.0
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        started = time.perf_counter()
+        self.hasher.update(raw_data)
+        self.hash_seconds += time.perf_counter() - started
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        self.file.hash_seconds = self.hash_seconds
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.discard()
+
+
+def discard_staged_files(files):
+    """
+    Deletes every staged file in a request.FILES-style MultiValueDict.
+    """
+    for _, uploaded_files in files.lists():
+        for uploaded_file in uploaded_files:
+            if isinstance(uploaded_file, StagedUploadedFile):
+                uploaded_file.discard()
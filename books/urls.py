@@ -6,15 +6,26 @@ app_name = 'books'
 
 urlpatterns = [
     path('list/', views.book_list_view, name='book_list'),
+    path('list/json/', views.book_list_json_view, name='book_list_json'),
+    path('search/', views.book_search_view, name='book_search'),
+    path('covers/<slug:cover_hash>/<int:width>.<slug:ext>', views.cover_variant_view, name='cover_variant'),
     path('upload/', views.upload_book_view, name='upload_book'),
     path('book/<int:pk>/', views.book_detail_view, name='book_detail'),
+    path('book/<int:pk>/reviews/', views.book_reviews_view, name='book_reviews'),
     # Keep download and read views, but update their permissions in views.py
     path('book/<int:pk>/download/', views.download_book_view, name='download_book'),
     path('book/<int:pk>/read/', views.read_book_view, name='read_book'),
+    path('book/<int:pk>/file/', views.stream_book_view, name='stream_book'),
+    path('book/<int:pk>/pages/', views.book_pages_manifest_view, name='book_pages'),
+    path('book/<int:pk>/pages/<int:page_number>/<int:dpi>/', views.book_page_view, name='book_page'),
+    path('book/<int:pk>/progress/', views.reading_progress_view, name='reading_progress'),
+    path('book/<int:pk>/bookmarks/', views.bookmarks_view, name='bookmarks'),
+    path('book/<int:pk>/bookmarks/<int:bookmark_id>/delete/', views.delete_bookmark_view, name='delete_bookmark'),
 
     # Payment URL - kept the structure but will update the view to only handle 'purchase'
     path('book/<int:book_pk>/order/<str:order_type>/', views.create_order_view, name='create_order'),
     path('payment/callback/', views.payment_callback_view, name='payment_callback'),
+    path('payment/webhook/', views.payment_webhook_view, name='payment_webhook'),
 
     # Review URL (Kept as is)
     path('book/<int:book_pk>/add_review/', views.add_review_view, name='add_review'),
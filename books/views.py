@@ -2,24 +2,43 @@
 
 # library imports
 import razorpay # For payment processing
+from asgiref.sync import sync_to_async # For calling sync code from async views
 
 # Django imports
 from django.conf import settings
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required # For restricting access to logged-in users
-from django.http import FileResponse, Http404, JsonResponse # For handling file downloads, 404 errors, and JSON responses
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse # For handling file downloads, 404 errors, and JSON responses
 from django.urls import reverse # For generating URLs
-from django.views.decorators.csrf import csrf_exempt # For webhook endpoint (payment callback)
+from django.views.decorators.csrf import csrf_exempt, csrf_protect # For webhook endpoint (payment callback) and upload handlers
+from django.views.decorators.http import require_POST, require_http_methods # Method restrictions (payment webhook, reading API)
+from django.db import IntegrityError, OperationalError, transaction # For saving a book and its processing job together
 from django.utils import timezone # For working with timezones
-from django.db.models import Avg # For calculating average ratings
 from django.contrib import messages # For displaying user feedback messages
+from django.core.files.storage import default_storage # For cover variants
 from django.db.models import Count # For counting unique categories
 
+from bookstore.db_routers import replica_reads # Read-replica routing for read-only views
+from bookstore.instrumentation import query_budget # Per-view SQL query limits, checked in books/tests.py
+from bookstore import metrics # Prometheus counters (order transitions, downloads, reader opens)
+
 # Local application imports
-from .models import Book, Order, Review # Import necessary models
+from .models import Book, Bookmark, Category, Order, Review # Import necessary models
 from .forms import BookUploadForm, ReviewForm # Import necessary forms
-
-# Initialize Razorpay client
+from .pagination import keyset_page, review_page, InvalidCursor, REVIEW_SORTS # Cursor pagination for the catalog and reviews
+from . import catalog_cache # Versioned catalog/detail caching
+from .search import search_books # FTS5-backed catalog search
+from .entitlements import get_entitlements # Cached owned/purchased book IDs
+from .streaming import serve_book_file # Range/ETag-aware PDF delivery
+from .uploads import StagingHashUploadHandler, discard_staged_files # Stream-to-staging uploads
+from .processing import enqueue # Background upload processing queue
+from . import payments # Pooled, timeout/retry/circuit-breaker Razorpay order creation
+from . import page_cache # Server-rendered reader pages
+from . import reading # Write-behind reading progress
+from .pdf_render import RenderError # Raised when a page cannot be rendered
+from .covers import COVER_FORMATS, COVER_WIDTHS, cover_srcset, cover_variant_url, derivative_name, ensure_derivative # Resized cover variants
+
+# Initialize Razorpay client (used for payment signature verification; orders are created via books/payments.py)
 # Attempts to initialize the Razorpay client using keys from Django settings.
 # If keys are not found, sets client to None and prints a warning.
 try:
@@ -45,47 +64,147 @@ def home_redirect_view(request):
         return render(request, 'home.html')
 
 
-# --- View to display the list of books ---
-def book_list_view(request):
+# --- Helper shared by the HTML and JSON book lists ---
+def _book_list_page(request):
     """
-    Displays a list of books, with an option to filter by category.
-    Books are annotated with their average rating and ordered by upload date.
+    Returns (books, next_cursor, selected_category) for the requested page.
+    Uses keyset pagination on (uploaded_at, id) so deep pages cost the same as page 1.
+    Raises Http404 for a malformed cursor.
     """
-    # Get the category from the query parameters
+    # Get the category and cursor from the query parameters
     selected_category = request.GET.get('category')
+    cursor = request.GET.get('cursor')
 
-    # Start with all books annotated with average rating
-    books_queryset = Book.objects.annotate(
-        avg_rating=Avg('reviews__rating') # Calculate the average rating from related reviews
-    )
+    # Start with all processed books (avg_rating and rating_count are stored on the row)
+    books_queryset = Book.objects.filter(processing_status='ready')
 
     # If a category is selected (and not an empty string), filter the queryset
+    # The (category, uploaded_at, id) index serves this filter and the ordering together
     if selected_category and selected_category != '':
         books_queryset = books_queryset.filter(category=selected_category)
 
-    # Order the books by upload date (newest first)
-    books = books_queryset.order_by('-uploaded_at')
+    page_size = getattr(settings, 'BOOK_LIST_PAGE_SIZE', 24)
+    try:
+        # Cached until the next Book/Review change (books/catalog_cache.py)
+        books, next_cursor = catalog_cache.catalog_page(
+            selected_category, cursor, page_size,
+            lambda: keyset_page(books_queryset, cursor=cursor, page_size=page_size),
+        )
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+
+    return books, next_cursor, selected_category
 
-    # Get all unique categories from the database for the filter dropdown
-    # Use distinct() to get unique category values
-    unique_categories = Book.objects.values_list('category', flat=True).distinct()
-    # Convert the queryset result to a list
-    unique_categories_list = list(unique_categories)
+
+# --- View to display the list of books ---
+@query_budget(4)
+@replica_reads
+def book_list_view(request):
+    """
+    Displays one page of books, with an option to filter by category.
+    Ratings come from the denormalized columns on Book, so no per-card queries are needed.
+    """
+    books, next_cursor, selected_category = _book_list_page(request)
+
+    # Categories with their book counts for the filter dropdown, read from the
+    # Category table rather than a DISTINCT over all books (cached with the catalog pages)
+    unique_categories_list = catalog_cache.categories(
+        lambda: list(Category.objects.filter(book_count__gt=0).order_by('name').values('name', 'book_count'))
+    )
 
     context = {
         'books': books,
+        'next_cursor': next_cursor, # Cursor for the "Load more" link, None on the last page
+        'is_first_page': not request.GET.get('cursor'),
+        'cursor': request.GET.get('cursor', ''), # Part of the card fragment cache key
         'unique_categories': unique_categories_list, # Pass unique categories to the template
         'selected_category': selected_category, # Pass the selected category back to the template
+        'catalog_version': catalog_cache.catalog_version(), # Fragment cache keys
+        'catalog_cache_timeout': catalog_cache.timeout(),
     }
 
     return render(request, 'books/list.html', context)
 
+
+# --- JSON variant of the book list for infinite scroll ---
+@query_budget(2)
+@replica_reads
+def book_list_json_view(request):
+    """
+    Returns one page of books as JSON, with the cursor for the next page.
+    Accepts the same ?category= and ?cursor= parameters as book_list_view.
+    """
+    books, next_cursor, selected_category = _book_list_page(request)
+
+    results = [
+        {
+            'id': book.pk,
+            'title': book.title,
+            'author': book.author,
+            'category': book.category,
+            'avg_rating': round(book.avg_rating, 1),
+            'rating_count': book.rating_count,
+            'cover_url': cover_variant_url(book, 320, 'jpg'),
+            'cover_srcset': cover_srcset(book, 'webp'),
+            'detail_url': reverse('books:book_detail', args=[book.pk]),
+        }
+        for book in books
+    ]
+
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+# --- View to search the catalog ---
+@query_budget(6)
+def book_search_view(request):
+    """
+    Full-text search over title, author, description and category.
+    Results are ranked by relevance (FTS5 bm25) with highlighted snippets.
+    Accepts ?q= and an optional ?page= number.
+    """
+    query = request.GET.get('q', '').strip()
+    page_size = getattr(settings, 'BOOK_SEARCH_PAGE_SIZE', 20)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    results = []
+    has_more = False
+    if query:
+        hits, has_more = search_books(query, limit=page_size, offset=(page - 1) * page_size)
+        # Load the matching books in one query and keep the ranked order.
+        # search_books() already skipped books that are not ready
+        books_by_id = Book.objects.in_bulk([hit['book_id'] for hit in hits])
+        for hit in hits:
+            book = books_by_id.get(hit['book_id'])
+            if book is not None:
+                results.append({'book': book, 'title_html': hit['title_html'], 'snippet_html': hit['snippet_html']})
+
+    context = {
+        'query': query,
+        'results': results,
+        'page': page,
+        'has_more': has_more,
+    }
+    return render(request, 'books/search.html', context)
+
+
 # --- View to handle book uploads ---
 @login_required # Requires user to be logged in
+@csrf_exempt # Upload handlers must be swapped before the CSRF check reads request.POST...
 def upload_book_view(request):
     """
     Handles the uploading of new books by logged-in users.
+    The PDF is streamed to a staging area and hashed in the same pass; validation,
+    page counting, cover generation and the move into storage happen in a
+    background job (books/processing.py).
     """
+    request.upload_handlers = [StagingHashUploadHandler(request)]
+    return _upload_book(request)
+
+
+@csrf_protect # ...so the check is applied here instead
+def _upload_book(request):
     if request.method == 'POST':
         form = BookUploadForm(request.POST, request.FILES)
         if form.is_valid():
@@ -93,15 +212,28 @@ def upload_book_view(request):
             book = form.save(commit=False)
             # Assign the current logged-in user as the book owner
             book.owner = request.user
-            # Save the book object to the database
-            book.save()
-            messages.success(request, f"Book '{book.title}' uploaded successfully!")
+            # The PDF stays in staging until the processing job moves it into storage
+            uploaded_file = form.cleaned_data['file']
+            book.file = ''
+            book.processing_status = 'processing'
+            try:
+                with transaction.atomic():
+                    # Save the book object to the database and queue its processing job
+                    book.save()
+                    enqueue(book, uploaded_file.staged_path, uploaded_file.name)
+            except IntegrityError:
+                # An identical file was uploaded concurrently and won the file_hash unique constraint
+                discard_staged_files(request.FILES)
+                form.add_error(None, "This book file has already been uploaded.")
+                return render(request, 'books/upload.html', {'form': form})
+
+            messages.success(request, f"Book '{book.title}' uploaded successfully! It will be available once processing finishes.")
             # Redirect to the detail page of the newly uploaded book
             return redirect('books:book_detail', pk=book.pk)
         else:
             # If the form is invalid, errors will be available in the form object
-            # The template will display these errors.
-            pass
+            # The template will display these errors. Staged files are no longer needed.
+            discard_staged_files(request.FILES)
 
     else:
         # For GET requests, display a blank upload form
@@ -110,14 +242,75 @@ def upload_book_view(request):
     return render(request, 'books/upload.html', {'form': form})
 
 
+# --- View to serve resized cover images ---
+def cover_variant_view(request, cover_hash, width, ext):
+    """
+    Serves one resized cover variant, building it on first request.
+    Names are derived from the cover's content hash, so responses are cacheable forever.
+    """
+    if width not in COVER_WIDTHS or ext not in COVER_FORMATS:
+        raise Http404("Unknown cover size or format.")
+
+    name = derivative_name(cover_hash, width, ext)
+    if not default_storage.exists(name):
+        # Only covers of published books are built on request
+        book = Book.objects.filter(cover_hash=cover_hash, processing_status='ready').exclude(cover_image='').first()
+        if book is None:
+            raise Http404("Cover not found.")
+        ensure_derivative(book, width, ext)
+
+    response = FileResponse(default_storage.open(name, 'rb'), content_type=f"image/{'jpeg' if ext == 'jpg' else ext}")
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# Review orderings offered on the detail page (keys of REVIEW_SORTS)
+REVIEW_SORT_CHOICES = [('newest', 'Newest'), ('rating', 'Highest rated')]
+
+
+def _detail_book(pk):
+    """
+    Returns the book (with its owner) for the detail page and review feed, or raises Http404.
+    Cached until the book or one of its reviews changes (books/catalog_cache.py).
+    """
+    book = catalog_cache.book(pk, lambda: Book.objects.select_related('owner').filter(pk=pk).first())
+    if book is None:
+        raise Http404("No Book matches the given query.")
+    return book
+
+
+def _review_page(request, book):
+    """
+    Returns (reviews, next_cursor, sort) for the requested page of a book's reviews.
+    Accepts ?sort= (newest or rating) and ?cursor=; raises Http404 for a malformed cursor.
+    """
+    sort = request.GET.get('sort')
+    if sort not in REVIEW_SORTS:
+        sort = 'newest'
+    cursor = request.GET.get('cursor')
+    page_size = getattr(settings, 'REVIEW_PAGE_SIZE', 10)
+    # Reviewer names are shown on every review: load the users in the same query
+    queryset = Review.objects.filter(book=book).select_related('user')
+    try:
+        reviews, next_cursor = catalog_cache.reviews_page(
+            book.pk, sort, cursor, page_size,
+            lambda: review_page(queryset, sort=sort, cursor=cursor, page_size=page_size),
+        )
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    return reviews, next_cursor, sort
+
+
 # --- View to display book details ---
+@query_budget(8)
+@replica_reads
 def book_detail_view(request, pk):
     """
     Displays the details of a specific book, including reviews.
     Determines user permissions (download, read, review) based on ownership and purchase status.
     """
-    # Get the book object or return 404 if not found
-    book = get_object_or_404(Book, pk=pk)
+    # Get the book object (with its owner, shown on the page) or return 404 if not found
+    book = _detail_book(pk)
 
     # Initialize permission flags
     can_download = False # Only owner can download the file
@@ -125,8 +318,8 @@ def book_detail_view(request, pk):
     has_reviewed = False # Flag to check if the current user has reviewed this book
     can_review = False # Flag to determine if the current user is eligible to review
 
-    # Fetch all reviews for this book, ordered by newest first
-    reviews = Review.objects.filter(book=book).order_by('-created_at')
+    # One page of reviews; the rest load through book_reviews_view
+    reviews, reviews_next_cursor, review_sort = _review_page(request, book)
 
     # Initialize the review form
     review_form = ReviewForm()
@@ -134,19 +327,13 @@ def book_detail_view(request, pk):
     # Check permissions if the user is authenticated
     if request.user.is_authenticated:
         # Check if the current user owns the book
-        if book.owner == request.user:
+        if book.owner_id == request.user.id:
             can_download = True # Owner can always download
             can_read = True # Owner can always read in-app
             can_review = True # Owner can review their own book
         else:
-            # If not the owner, check if the user has purchased the book
-            purchase_order_exists = Order.objects.filter(
-                user=request.user,
-                book=book,
-                order_type='purchase', # Only check for purchase orders
-                status='paid'
-            ).exists()
-            if purchase_order_exists:
+            # If not the owner, check if the user has purchased the book (cached entitlements)
+            if get_entitlements(request.user).has_purchased(book.pk):
                 # User has purchased the book
                 can_read = True # Purchased users can read in-app
                 can_review = True # User can review if they purchased
@@ -160,12 +347,48 @@ def book_detail_view(request, pk):
         'can_download': can_download,
         'can_read': can_read,
         'reviews': reviews,
+        'reviews_next_cursor': reviews_next_cursor,
+        'review_sort': review_sort,
+        'review_sort_choices': REVIEW_SORT_CHOICES,
         'review_form': review_form,
         'has_reviewed': has_reviewed,
         'can_review': can_review,
+        'book_version': catalog_cache.book_version(book.pk), # Fragment cache keys; per-user flags above stay uncached
+        'catalog_cache_timeout': catalog_cache.timeout(),
     }
     return render(request, 'books/detail.html', context)
 
+# --- Review feed for "load more" on the detail page ---
+@query_budget(4)
+@replica_reads
+def book_reviews_view(request, pk):
+    """
+    Returns one page of a book's reviews with the cursor for the next page.
+    Accepts the same ?sort= and ?cursor= parameters as book_detail_view.
+    Responds with JSON, or with ?format=html the rendered review items and
+    the next cursor in the X-Next-Cursor header.
+    """
+    book = _detail_book(pk)
+    reviews, next_cursor, sort = _review_page(request, book)
+
+    if request.GET.get('format') == 'html':
+        response = render(request, 'books/review_items.html', {'reviews': reviews})
+        response['X-Next-Cursor'] = next_cursor or ''
+        return response
+
+    results = [
+        {
+            'id': review.pk,
+            'username': review.user.username,
+            'rating': review.rating,
+            'comment': review.comment,
+            'created_at': review.created_at.isoformat(),
+        }
+        for review in reviews
+    ]
+    return JsonResponse({'results': results, 'next_cursor': next_cursor, 'sort': sort})
+
+
 # --- View to handle adding a review ---
 @login_required # Requires user to be logged in
 def add_review_view(request, book_pk):
@@ -179,18 +402,11 @@ def add_review_view(request, book_pk):
     # Check if the user is eligible to review (owner or purchaser)
     user_eligible_to_review = False
     if request.user.is_authenticated:
-        if book.owner == request.user:
-            user_eligible_to_review = True
-        else:
-            # Check for purchase
-            purchase_order_exists = Order.objects.filter(
-                user=request.user,
-                book=book,
-                order_type='purchase',
-                status='paid'
-            ).exists()
-            if purchase_order_exists:
-                user_eligible_to_review = True
+        # Owners and purchasers may review (cached entitlements, no Order query)
+        user_eligible_to_review = (
+            book.owner_id == request.user.id
+            or get_entitlements(request.user).has_purchased(book.pk)
+        )
 
     # Process the form submission if it's a POST request and the user is eligible
     if request.method == 'POST' and user_eligible_to_review:
@@ -233,14 +449,16 @@ def add_review_view(request, book_pk):
 
 # --- View to create a payment order ---
 @login_required # Requires user to be logged in
-def create_order_view(request, book_pk, order_type):
+async def create_order_view(request, book_pk, order_type):
     """
     Creates a payment order for purchasing a book using Razorpay.
     Only 'purchase' order type is supported.
     Checks if the user has already purchased the book.
+    Async so that waiting on the gateway (books/payments.py) does not hold a worker under ASGI.
     """
     # Get the book object or return 404 if not found
-    book = get_object_or_404(Book, pk=book_pk)
+    book = await aget_object_or_404(Book, pk=book_pk)
+    user = await request.auser()
     amount = 0
 
     # Only allow 'purchase' order type
@@ -248,17 +466,17 @@ def create_order_view(request, book_pk, order_type):
         messages.error(request, "Invalid order type. Only purchase is allowed.")
         return redirect('books:book_detail', pk=book.pk)
 
+    # Books still being processed cannot be bought yet
+    if not book.is_ready:
+        messages.error(request, "This book is still being processed. Please try again shortly.")
+        return redirect('books:book_detail', pk=book.pk)
+
     # Set the amount for purchase
     amount = book.purchase_price
 
     # Check if the user already has a successful purchase order for this book
-    existing_order = Order.objects.filter(
-        user=request.user,
-        book=book,
-        order_type='purchase',
-        status='paid'
-    ).first()
-    if existing_order:
+    entitlements = await sync_to_async(get_entitlements)(user)
+    if entitlements.has_purchased(book.pk):
         messages.info(request, f"You have already purchased this book.")
         # Redirect to the read view directly since they already own it
         return redirect('books:read_book', pk=book.pk)
@@ -269,34 +487,28 @@ def create_order_view(request, book_pk, order_type):
         razorpay_amount = int(amount * 100)
         currency = 'INR'
         # Generate a unique receipt ID
-        receipt = f"order_rcptid_{book.pk}_{request.user.id}_{timezone.now().timestamp()}"
+        receipt = f"order_rcptid_{book.pk}_{user.id}_{timezone.now().timestamp()}"
 
         try:
-            # Create the order with Razorpay
-            if client:
-                razorpay_order = client.order.create(dict(
-                    amount=razorpay_amount,
-                    currency=currency,
-                    receipt=receipt,
-                    payment_capture='1' # Auto-capture payment upon successful transaction
-                ))
-            else:
-                messages.error(request, "Payment service is not available. Please contact support.")
-                return redirect('books:book_detail', pk=book.pk)
-
-        except Exception as e:
+            # Create the order with Razorpay (pooled session, timeouts, retries, circuit breaker)
+            razorpay_order = await payments.acreate_order(razorpay_amount, currency, receipt)
+        except payments.GatewayUnavailable:
+            messages.error(request, "Payment service is temporarily unavailable. Please try again in a minute.")
+            return redirect('books:book_detail', pk=book.pk)
+        except payments.PaymentGatewayError as e:
             messages.error(request, f"Error creating Razorpay order: {e}")
             return redirect('books:book_detail', pk=book.pk)
 
         # Create a local Order object to track the transaction
-        order = Order.objects.create(
-            user=request.user,
+        order = await Order.objects.acreate(
+            user=user,
             book=book,
             order_type='purchase', # Hardcoded to 'purchase' now
             amount=amount,
             razorpay_order_id=razorpay_order['id'],
             status='pending' # Initial status is pending
         )
+        metrics.record_order_status('checkout', 'pending')
 
         # Generate the callback URL for Razorpay to send payment response
         callback_url = request.build_absolute_uri(reverse('books:payment_callback'))
@@ -309,7 +521,7 @@ def create_order_view(request, book_pk, order_type):
             'currency': currency,
             'company_name': 'BookStore',
             'book_title': book.title,
-            'user_email': request.user.email,
+            'user_email': user.email,
             'user_contact': '9999999999', # Placeholder contact number
             'callback_url': callback_url,
             'order_id': order.id, # Pass local order ID to the template
@@ -317,7 +529,8 @@ def create_order_view(request, book_pk, order_type):
             'book': book, # Pass the book object
         }
         # Render the checkout page to initiate the Razorpay payment process
-        return render(request, 'books/checkout.html', context)
+        # (templates and context processors are sync code)
+        return await sync_to_async(render)(request, 'books/checkout.html', context)
 
     # Handle invalid request methods
     messages.error(request, "Invalid request method.")
@@ -325,111 +538,123 @@ def create_order_view(request, book_pk, order_type):
 
 
 # --- View to handle Razorpay payment callback ---
+@query_budget(16)
 @csrf_exempt # Exempt from CSRF protection as this is a webhook endpoint
 def payment_callback_view(request):
     """
     Handles the callback from Razorpay after a payment attempt.
     Verifies the payment signature and updates the order status.
+    The status change is a conditional UPDATE (books/payments.py), so a repeated
+    or concurrent callback for the same order is a no-op.
     """
     if request.method == "POST":
-        try:
-            # Get payment data from the POST request
-            payload = request.POST
-            razorpay_order_id = payload.get('razorpay_order_id')
-            razorpay_payment_id = payload.get('razorpay_payment_id')
-            razorpay_signature = payload.get('razorpay_signature')
-
-            # Check if all required payment data is present
-            if not all([razorpay_order_id, razorpay_payment_id, razorpay_signature]):
-                messages.error(request, "Missing payment data received from Razorpay.")
-                return JsonResponse({'status': 'error', 'message': 'Missing payment data'}, status=400)
-
-            # Prepare data for signature verification
-            params_dict = {
-                'razorpay_order_id': razorpay_order_id,
-                'razorpay_payment_id': razorpay_payment_id,
-                'razorpay_signature': razorpay_signature,
-            }
-
-            # Verify the payment signature with Razorpay
-            try:
-                if client:
-                    client.utility.verify_payment_signature(params_dict)
-                else:
-                    messages.error(request, "Payment service is not available for verification.")
-                    return redirect('/') # Redirect to home or an error page
-            except Exception as e:
-                # Raise a specific error for signature verification failure
-                raise razorpay.errors.SignatureVerificationError(f"Signature verification failed: {e}")
-
-            # Find the corresponding local order with pending status
-            order = get_object_or_404(Order, razorpay_order_id=razorpay_order_id, status='pending')
-
-            # Ensure the found order is a purchase order
-            if order.order_type != 'purchase':
-                 messages.error(request, "Invalid order type for this payment callback.")
-                 return redirect('/') # Redirect to home or an error page
-
-            # Check if the order is already paid to prevent double processing
-            if order.status == 'paid':
-                messages.info(request, "This order has already been processed.")
-                return redirect('books:book_detail', pk=order.book.pk)
-
-            # Update the order details and status upon successful verification
-            order.razorpay_payment_id = razorpay_payment_id
-            order.razorpay_signature = razorpay_signature
-            order.status = 'paid' # Set status to paid
-            order.paid_at = timezone.now() # Record payment time
-
-            # Save the updated order
-            order.save()
-
-            messages.success(request, f"Payment successful! You can now read '{order.book.title}' in the app reader.")
-            # Redirect directly to the book reader view
-            return redirect('books:read_book', pk=order.book.pk)
-
-        except razorpay.errors.SignatureVerificationError as e:
-            # Handle signature verification failure
-            razorpay_order_id = request.POST.get('razorpay_order_id')
-            if razorpay_order_id:
-                 try:
-                     # Attempt to find the order and mark it as failed if not already paid
-                     order = Order.objects.get(razorpay_order_id=razorpay_order_id)
-                     if order.status != 'paid':
-                         order.status = 'failed'
-                         order.save()
-                 except Order.DoesNotExist:
-                     # If order not found, do nothing
-                     pass
+        # Get payment data from the POST request
+        payload = request.POST
+        razorpay_order_id = payload.get('razorpay_order_id')
+        razorpay_payment_id = payload.get('razorpay_payment_id')
+        razorpay_signature = payload.get('razorpay_signature')
+
+        # Check if all required payment data is present
+        if not all([razorpay_order_id, razorpay_payment_id, razorpay_signature]):
+            messages.error(request, "Missing payment data received from Razorpay.")
+            return JsonResponse({'status': 'error', 'message': 'Missing payment data'}, status=400)
+
+        # Prepare data for signature verification
+        params_dict = {
+            'razorpay_order_id': razorpay_order_id,
+            'razorpay_payment_id': razorpay_payment_id,
+            'razorpay_signature': razorpay_signature,
+        }
 
-            messages.error(request, "Payment verification failed. Please contact support.")
+        if not client:
+            messages.error(request, "Payment service is not available for verification.")
             return redirect('/') # Redirect to home or an error page
-        except Order.DoesNotExist:
-            # Handle case where the order is not found or not in pending status
-            messages.error(request, "Order not found or already processed.")
+
+        # Verify the payment signature with Razorpay
+        try:
+            client.utility.verify_payment_signature(params_dict)
+        except Exception:
+            # Fail the order only if it is still pending (never a paid one)
+            if payments.mark_order_failed(razorpay_order_id):
+                metrics.record_order_status('callback', 'failed')
+            messages.error(request, "Payment verification failed. Please contact support.")
             return redirect('/') # Redirect to home or an error page
+
+        duplicate_purchase = False
+        try:
+            # pending -> paid in one UPDATE; only one of several concurrent callbacks gets True
+            newly_paid = payments.mark_order_paid(razorpay_order_id, razorpay_payment_id, razorpay_signature)
+        except payments.DuplicatePurchase:
+            # Paid twice for the same book (e.g. two checkout tabs); keep the first purchase
+            newly_paid, duplicate_purchase = False, True
+            metrics.DUPLICATE_PURCHASES.labels(source='callback').inc()
         except Exception as e:
             # Handle other unexpected errors during payment processing
-            razorpay_order_id = request.POST.get('razorpay_order_id')
-            if razorpay_order_id:
-                 try:
-                     # Attempt to find the order and mark it as failed if not already paid
-                     order = Order.objects.get(razorpay_order_id=razorpay_order_id, status__in=['pending', 'paid'])
-                     if order.status != 'paid':
-                         order.status = 'failed'
-                         order.save()
-                 except Order.DoesNotExist:
-                     # If order not found, do nothing
-                     pass
-
+            if payments.mark_order_failed(razorpay_order_id):
+                metrics.record_order_status('callback', 'failed')
             messages.error(request, f"An error occurred processing payment: {str(e)}")
             return redirect('/') # Redirect to home or an error page
 
+        if newly_paid:
+            metrics.record_order_status('callback', 'paid')
+
+        # One lookup for the redirect target
+        order = (
+            Order.objects.filter(razorpay_order_id=razorpay_order_id)
+            .select_related('book').only('status', 'book__id', 'book__title').first()
+        )
+        if order is not None and duplicate_purchase:
+            messages.warning(request, "You have already purchased this book. Please contact support to refund the second payment.")
+            return redirect('books:book_detail', pk=order.book.pk)
+
+        if order is None or (not newly_paid and order.status != 'paid'):
+            # Handle case where the order is not found or not in pending status
+            messages.error(request, "Order not found or already processed.")
+            return redirect('/') # Redirect to home or an error page
+
+        if not newly_paid:
+            # Already marked paid by an earlier callback or the webhook
+            messages.info(request, "This order has already been processed.")
+            return redirect('books:book_detail', pk=order.book.pk)
+
+        messages.success(request, f"Payment successful! You can now read '{order.book.title}' in the app reader.")
+        # Redirect directly to the book reader view
+        return redirect('books:read_book', pk=order.book.pk)
+
     # Handle invalid request methods to the callback URL
     messages.error(request, "Invalid request to callback.")
     return redirect('/') # Redirect to home or an error page
 
 
+# --- Server-to-server Razorpay webhook ---
+@csrf_exempt # Called by Razorpay, authenticated by the HMAC signature instead
+@require_POST
+def payment_webhook_view(request):
+    """
+    Receives Razorpay webhook events (payment.captured, order.paid, payment.failed).
+    Verifies X-Razorpay-Signature, records the event ID once and updates the order
+    with a conditional UPDATE, so redeliveries and concurrent workers are safe.
+    Confirms payments even when the buyer's browser never reaches the callback.
+    """
+    body = request.body
+    if not payments.verify_webhook_signature(body, request.headers.get('X-Razorpay-Signature')):
+        return JsonResponse({'status': 'error', 'message': 'Invalid signature'}, status=400)
+
+    try:
+        outcome = payments.process_webhook_event(body, request.headers.get('X-Razorpay-Event-Id'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid event'}, status=400)
+    except OperationalError:
+        # e.g. SQLite "database is locked" during a burst; Razorpay redelivers on non-2xx
+        return JsonResponse({'status': 'error', 'message': 'Try again'}, status=503)
+
+    if outcome in ('paid', 'failed'):
+        metrics.record_order_status('webhook', outcome)
+    elif outcome == 'duplicate_purchase':
+        metrics.DUPLICATE_PURCHASES.labels(source='webhook').inc()
+    return JsonResponse({'status': 'ok', 'outcome': outcome})
+
+
 # --- View to handle book downloads ---
 # Secure Content Delivery - ONLY FOR OWNERS
 @login_required # Requires user to be logged in
@@ -441,23 +666,31 @@ def download_book_view(request, pk):
     """
     # Get the book object or return 404 if not found
     book = get_object_or_404(Book, pk=pk)
-    is_owner = book.owner == request.user
+    is_owner = book.owner_id == request.user.id
 
     # Only the owner can download the file
     if not is_owner:
         messages.error(request, "You do not have permission to download this book.")
         # Check if the user has purchased the book
-        has_purchased = Order.objects.filter(user=request.user, book=book, order_type='purchase', status='paid').exists()
-        if has_purchased:
+        if get_entitlements(request.user).has_purchased(book.pk):
              # If purchased, redirect to the in-app reader
              return redirect('books:read_book', pk=book.pk)
         else:
             # If not owner and not purchased, redirect to book detail
             return redirect('books:book_detail', pk=book.pk)
 
+    # The file only reaches storage once background processing finishes
+    if not book.is_ready:
+        messages.error(request, "This book is still being processed.")
+        return redirect('books:book_detail', pk=book.pk)
+
     try:
-        # Serve the book file as an attachment for download
-        return FileResponse(book.file.open('rb'), as_attachment=True, filename=book.file.name.split('/')[-1])
+        # Serve the book file as an attachment for download (resumable via Range)
+        response = serve_book_file(request, book, as_attachment=True)
+        if response.status_code in (200, 206):
+            # Offloaded responses have no Content-Length: the web server sends the whole file
+            metrics.DOWNLOAD_BYTES.inc(int(response.get('Content-Length') or book.file.size))
+        return response
 
     except FileNotFoundError:
         # Handle case where the book file is not found on the server
@@ -468,7 +701,100 @@ def download_book_view(request, pk):
         return redirect('books:book_detail', pk=book.pk)
 
 
+# --- View to stream the PDF to the in-app reader ---
+@login_required # Requires user to be logged in
+def stream_book_view(request, pk):
+    """
+    Streams a book's PDF to its owner or a purchaser.
+    Supports Range/206, ETag and If-None-Match/If-Range, and optional
+    X-Sendfile/X-Accel-Redirect offload (settings.BOOK_FILE_OFFLOAD).
+    """
+    book = get_object_or_404(Book, pk=pk)
+
+    # Owner or purchaser only (cached entitlements, no Order query)
+    if not (book.owner_id == request.user.id or get_entitlements(request.user).has_purchased(book.pk)):
+        raise Http404("Book not found.")
+    if not book.is_ready:
+        raise Http404("Book file is still being processed.")
+
+    try:
+        return serve_book_file(request, book)
+    except FileNotFoundError:
+        raise Http404("Book file not found.")
+
+
+# --- Views for the server-rendered reader mode ---
+def _get_readable_book(request, pk):
+    """
+    Returns the book if the user may read it and its file is ready, else raises Http404.
+    """
+    book = get_object_or_404(Book, pk=pk)
+    if not (book.owner_id == request.user.id or get_entitlements(request.user).has_purchased(book.pk)):
+        raise Http404("Book not found.")
+    if not book.is_ready:
+        raise Http404("Book file is still being processed.")
+    return book
+
+
+@login_required # Requires user to be logged in
+def book_pages_manifest_view(request, pk):
+    """
+    Returns the page count, page sizes (PDF points) and DPI levels of a book,
+    plus the URL template for its pre-rendered page images.
+    """
+    book = _get_readable_book(request, pk)
+    try:
+        manifest = page_cache.get_manifest(book)
+    except (RenderError, OSError):
+        raise Http404("Pages are not available for this book.")
+
+    page_url = reverse('books:book_page', args=[book.pk, 0, 0])
+    return JsonResponse({
+        **manifest,
+        'dpi_levels': list(page_cache.dpi_levels()),
+        # The client swaps the placeholders for the page number and DPI
+        'page_url_template': page_url[:-len('0/0/')] + '{page}/{dpi}/',
+        'prefetch_pages': getattr(settings, 'READER_PREFETCH_PAGES', 2),
+    })
+
+
+@login_required # Requires user to be logged in
+def book_page_view(request, pk, page_number, dpi):
+    """
+    Serves one page of a book as a WebP image, rendering and caching it on first request.
+    """
+    book = _get_readable_book(request, pk)
+    etag = f'"{book.file_hash or book.pk}-{page_number}-{dpi}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            path = page_cache.get_page(book, page_number, dpi)
+        except ValueError:
+            raise Http404("Unknown page or resolution.")
+        except (RenderError, OSError):
+            raise Http404("Page could not be rendered.")
+        response = FileResponse(open(path, 'rb'), content_type=f"image/{page_cache.PAGE_FORMAT}")
+    response['ETag'] = etag
+    # Private: pages are only for the owner and purchasers
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def _reader_pages_url(request, book):
+    """
+    Returns the page manifest URL when the reader should use server-rendered pages, else ''.
+    settings.READER_SERVER_RENDER sets the default; ?render=server or ?render=client overrides it.
+    """
+    mode = request.GET.get('render')
+    use_server = mode == 'server' or (mode != 'client' and getattr(settings, 'READER_SERVER_RENDER', False))
+    if use_server and page_cache.pdf_render.pdfium is not None:
+        return reverse('books:book_pages', args=[book.pk])
+    return ''
+
+
 # --- View for the in-app book reader ---
+@query_budget(8)
 @login_required # Requires user to be logged in
 def read_book_view(request, pk):
     """
@@ -478,29 +804,33 @@ def read_book_view(request, pk):
     """
     # Get the book object or return 404 if not found
     book = get_object_or_404(Book, pk=pk)
-    is_owner = book.owner == request.user
-
-    # Check if user has purchased the book
-    has_purchased = Order.objects.filter(
-        user=request.user,
-        book=book,
-        order_type='purchase', # Only check for purchase orders
-        status='paid'
-    ).exists()
+    is_owner = book.owner_id == request.user.id
 
     # User must be owner OR have purchased the book to read in-app
-    if not (is_owner or has_purchased):
+    # (purchases come from the cached entitlements, not a per-open Order query)
+    if not (is_owner or get_entitlements(request.user).has_purchased(book.pk)):
         messages.error(request, "You must purchase this book to read it.")
         return redirect('books:book_detail', pk=book.pk)
 
-    # Assuming book.file.url provides the URL to the PDF file.
-    # Note: For true DRM, serving the file directly via URL might not be sufficient.
-    # More advanced solutions involve streaming or token-based access.
-    book_file_url = book.file.url
+    if not book.is_ready:
+        messages.info(request, "This book is still being processed. Please try again shortly.")
+        return redirect('books:book_detail', pk=book.pk)
+
+    # Serve the PDF through the authenticated streaming endpoint rather than the public media URL.
+    # It supports Range requests, so pdf.js can render page 1 before the whole file arrives.
+    book_file_url = reverse('books:stream_book', args=[book.pk])
+    metrics.READER_OPENS.inc()
+    # Resume where the user left off, on any device (?page= from the fullscreen reader wins)
+    saved_page = reading.get_progress(request.user.id, [book.pk]).get(book.pk)
 
     context = {
         'book': book,
-        'book_file_url': book_file_url # This URL needs to be protected against direct access
+        'book_file_url': book_file_url, # This URL needs to be protected against direct access
+        'book_pages_url': _reader_pages_url(request, book), # Set when pages are rendered server-side
+        'initial_page': _parse_page(request.GET.get('page'), book) or saved_page or 1,
+        'saved_page': saved_page,
+        'bookmarks': Bookmark.objects.filter(user=request.user, book=book).order_by('page'),
+        **_reading_urls(book),
     }
     # Render the main in-app reader template
     return render(request, 'books/reader.html', context)
@@ -515,9 +845,8 @@ def fullscreen_reader_view(request):
     as query parameters.
     Requires the user to be logged in and authorized (owner or purchaser).
     """
-    # Get book_pk and initial_page from query parameters
+    # Get book_pk from query parameters (the initial page is checked once the book is loaded)
     book_pk = request.GET.get('book_pk')
-    initial_page = request.GET.get('page', 1) # Get initial page, default to 1
 
     # Basic validation: Ensure book_pk is provided
     if not book_pk:
@@ -529,16 +858,27 @@ def fullscreen_reader_view(request):
         book = get_object_or_404(Book, pk=book_pk)
 
         # Check if user is authorized to read this book (owner or purchaser)
-        is_owner = book.owner == request.user
-        has_purchased = Order.objects.filter(user=request.user, book=book, order_type='purchase', status='paid').exists()
+        is_owner = book.owner_id == request.user.id
+        has_purchased = get_entitlements(request.user).has_purchased(book.pk)
 
         # If user is not authorized, show an error and redirect
         if not (is_owner or has_purchased):
              messages.error(request, "You are not authorized to access this book.")
              return redirect('books:book_detail', pk=book.pk)
 
-        # Get the secure URL for the book file
-        book_file_url = book.file.url
+        if not book.is_ready:
+             messages.info(request, "This book is still being processed. Please try again shortly.")
+             return redirect('books:book_detail', pk=book.pk)
+
+        # Get the secure (authenticated, range-capable) URL for the book file
+        book_file_url = reverse('books:stream_book', args=[book.pk])
+
+        # ?page= when opened from the reader, else the saved reading position
+        initial_page = (
+            _parse_page(request.GET.get('page'), book)
+            or reading.get_progress(request.user.id, [book.pk]).get(book.pk)
+            or 1
+        )
 
     except Http404:
         # Handle case where the book is not found
@@ -554,7 +894,108 @@ def fullscreen_reader_view(request):
         'book': book, # Pass the book object for title/author in the template
         'book_pk': book_pk, # Pass book_pk to the template for JS to use
         'book_file_url': book_file_url, # Pass the secure URL
+        'book_pages_url': _reader_pages_url(request, book), # Set when pages are rendered server-side
         'initial_page': initial_page, # Pass the initial page
+        **_reading_urls(book),
     }
     # Render the new fullscreen reader template
     return render(request, 'books/fullscreen_reader.html', context)
+
+
+# --- Reading progress and bookmarks API (books/reading.py) ---
+def _parse_page(value, book):
+    """
+    Returns `value` as a page number of the book, or None if it is not one.
+    """
+    try:
+        page = int(value)
+    except (TypeError, ValueError):
+        return None
+    if page < 1 or (book.page_count and page > book.page_count):
+        return None
+    return page
+
+
+def _reading_urls(book):
+    """
+    Template context the readers need to save progress and bookmarks.
+    """
+    return {
+        'reading_progress_url': reverse('books:reading_progress', args=[book.pk]),
+        'bookmarks_url': reverse('books:bookmarks', args=[book.pk]),
+        'progress_report_interval': getattr(settings, 'READING_PROGRESS_REPORT_INTERVAL', 5),
+    }
+
+
+def _readable_detail_book(request, pk):
+    """
+    Like _get_readable_book, but from the cache: book and entitlements are
+    cached, so the frequent progress reports cost no book or order queries.
+    """
+    book = _detail_book(pk)
+    if not get_entitlements(request.user).can_read(book.pk) or not book.is_ready:
+        raise Http404("Book not found.")
+    return book
+
+
+def _bookmark_json(bookmark):
+    return {
+        'id': bookmark.pk,
+        'page': bookmark.page,
+        'label': bookmark.label,
+        'created_at': bookmark.created_at.isoformat(),
+    }
+
+
+@query_budget(8) # Cold caches plus a flush; a warm report runs only the session and user queries
+@login_required # Requires user to be logged in
+@require_http_methods(['GET', 'POST'])
+def reading_progress_view(request, pk):
+    """
+    GET returns the page the user last reached in the book (null if none).
+    POST with `page` records the page the reader is on. Reports go to a
+    cache-side buffer that is written to the database in bulk, so readers
+    can report every few seconds.
+    """
+    book = _readable_detail_book(request, pk)
+    if request.method == 'POST':
+        page = _parse_page(request.POST.get('page'), book)
+        if page is None:
+            return JsonResponse({'status': 'error', 'message': 'Invalid page'}, status=400)
+        reading.record_progress(request.user.id, book.pk, page)
+        # Accepted: stored in the buffer, written to the database by the next flush
+        return JsonResponse({'status': 'ok', 'page': page}, status=202)
+    return JsonResponse({'page': reading.get_progress(request.user.id, [book.pk]).get(book.pk)})
+
+
+@login_required # Requires user to be logged in
+@require_http_methods(['GET', 'POST'])
+def bookmarks_view(request, pk):
+    """
+    GET lists the user's bookmarks in the book by page. POST with `page` (and
+    an optional `label`) bookmarks that page, or relabels its bookmark.
+    """
+    book = _readable_detail_book(request, pk)
+    if request.method == 'POST':
+        page = _parse_page(request.POST.get('page'), book)
+        if page is None:
+            return JsonResponse({'status': 'error', 'message': 'Invalid page'}, status=400)
+        bookmark, created = Bookmark.objects.update_or_create(
+            user=request.user, book_id=book.pk, page=page,
+            defaults={'label': request.POST.get('label', '').strip()[:100]},
+        )
+        return JsonResponse({'status': 'ok', 'bookmark': _bookmark_json(bookmark)}, status=201 if created else 200)
+    bookmarks = Bookmark.objects.filter(user=request.user, book_id=book.pk).order_by('page')
+    return JsonResponse({'results': [_bookmark_json(bookmark) for bookmark in bookmarks]})
+
+
+@login_required # Requires user to be logged in
+@require_POST
+def delete_bookmark_view(request, pk, bookmark_id):
+    """
+    Deletes one of the user's bookmarks.
+    """
+    deleted, _ = Bookmark.objects.filter(pk=bookmark_id, user=request.user, book_id=pk).delete()
+    if not deleted:
+        raise Http404("Bookmark not found.")
+    return JsonResponse({'status': 'ok'})
@@ -3,6 +3,10 @@ ASGI config for bookstore project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Checkout order creation (books.views.create_order_view) is an async view:
+served from here, a slow payment gateway waits on the event loop instead of
+occupying a worker, e.g. ``uvicorn bookstore.asgi:application --workers 4``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
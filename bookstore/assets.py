@@ -0,0 +1,281 @@
+# bookstore/assets.py
+"""
+Build-time static assets.
+
+`manage.py build_assets` writes everything the pages load into
+settings.ASSETS_BUILD_DIR (a STATICFILES_DIRS entry, not committed):
+
+- css/app.css: Tailwind compiled by the standalone Tailwind CLI from
+  assets/app.css and assets/tailwind.config.js, purged to the classes that
+  appear in our templates and scripts, and minified;
+- vendor/<name>/: pinned pdf.js, Alpine and web fonts, unpacked from their
+  npm packages (VENDOR_PACKAGES);
+- vendor/fonts/fonts.css: @font-face rules for the self-hosted fonts;
+- vendor/fontawesome/: Font Awesome reduced to the icons the templates use,
+  with its fonts subset to those glyphs (needs fontTools).
+
+collectstatic then stores them under content-hashed names with gzip and
+Brotli siblings (WhiteNoise's CompressedManifestStaticFilesStorage), and
+WhiteNoiseMiddleware serves hashed files with immutable cache headers.
+
+The {% asset_head %} and {% asset_url %} tags (books/templatetags/custom_tags.py)
+link the built files, and fall back to the public CDNs for an asset that has
+not been built, so a fresh checkout works without running the build.
+"""
+import io
+import re
+import shutil
+import tarfile
+import urllib.request
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+TAILWIND_VERSION = '3.4.17'
+
+
+@dataclass(frozen=True)
+class VendorPackage:
+    npm_name: str
+    version: str
+    # Member of the package tarball (a file, or a directory ending in '/') -> path under vendor/<name>/
+    files: dict
+    # Where the same files live on a public CDN, for unbuilt checkouts
+    cdn: str = ''
+
+    @property
+    def tarball_url(self):
+        registry = getattr(settings, 'ASSETS_NPM_REGISTRY', 'https://registry.npmjs.org').rstrip('/')
+        basename = self.npm_name.rsplit('/', 1)[-1]
+        return f"{registry}/{self.npm_name}/-/{basename}-{self.version}.tgz"
+
+
+VENDOR_PACKAGES = {
+    'pdfjs': VendorPackage(
+        'pdfjs-dist', '2.9.359',
+        {
+            'build/pdf.min.js': 'pdf.min.js',
+            'build/pdf.worker.min.js': 'pdf.worker.min.js',
+            'cmaps/': 'cmaps/',
+            'standard_fonts/': 'standard_fonts/',
+        },
+        cdn='https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/',
+    ),
+    'alpine': VendorPackage(
+        'alpinejs', '3.14.1',
+        {'dist/cdn.min.js': 'cdn.min.js'},
+        cdn='https://cdn.jsdelivr.net/npm/alpinejs@3.14.1/dist/',
+    ),
+    'fontawesome': VendorPackage(
+        '@fortawesome/fontawesome-free', '6.4.0',
+        {'css/all.css': '.source/all.css', 'webfonts/': '.source/webfonts/'},
+    ),
+    'lato': VendorPackage(
+        '@fontsource/lato', '5.0.0',
+        {f'files/lato-latin-{weight}-normal.woff2': f'lato-latin-{weight}-normal.woff2' for weight in (300, 400, 700)},
+    ),
+    'playfair-display': VendorPackage(
+        '@fontsource/playfair-display', '5.0.0',
+        {
+            f'files/playfair-display-latin-{weight}-{style}.woff2': f'playfair-display-latin-{weight}-{style}.woff2'
+            for weight, style in ((400, 'normal'), (700, 'normal'), (400, 'italic'))
+        },
+    ),
+}
+
+
+@dataclass(frozen=True)
+class FontFace:
+    family: str
+    package: str
+    file: str
+    weight: int
+    style: str = 'normal'
+
+
+FONT_FACES = [
+    FontFace('Lato', 'lato', f'lato-latin-{weight}-normal.woff2', weight) for weight in (300, 400, 700)
+] + [
+    FontFace('Playfair Display', 'playfair-display', f'playfair-display-latin-{weight}-{style}.woff2', weight, style)
+    for weight, style in ((400, 'normal'), (700, 'normal'), (400, 'italic'))
+]
+
+# Built files linked by {% asset_head %}
+APP_CSS = 'css/app.css'
+FONTS_CSS = 'vendor/fonts/fonts.css'
+ICONS_CSS = 'vendor/fontawesome/icons.css'
+
+# Font Awesome classes that are not icons
+ICON_STYLE_CLASSES = {'fa', 'fas', 'far', 'fab', 'fa-solid', 'fa-regular', 'fa-brands'}
+
+_ICON_CLASS_RE = re.compile(r'\bfa-[a-z0-9-]+\b')
+_CSS_CLASS_RE = re.compile(r'\.(fa-[a-z0-9-]+)')
+_CONTENT_RE = re.compile(r'(?:content|--fa)\s*:\s*"\\([0-9a-fA-F]+)"')
+_FONT_URL_RE = re.compile(r'url\(["\']?\.\./webfonts/([^"\')]+?)\.(?:woff2|ttf)["\']?\)')
+
+
+def build_dir():
+    return Path(settings.ASSETS_BUILD_DIR)
+
+
+def source_dir():
+    return Path(settings.ASSETS_SOURCE_DIR)
+
+
+@lru_cache(maxsize=None)
+def is_built(path):
+    """
+    Whether a built asset exists (checked once per process; restart after building).
+    """
+    return finders.find(path) is not None
+
+
+def _project_app_dirs():
+    base_dir = Path(settings.BASE_DIR).resolve()
+    for app_config in apps.get_app_configs():
+        path = Path(app_config.path).resolve()
+        if base_dir in path.parents:
+            yield path
+
+
+def content_dirs():
+    """
+    Directories whose templates and scripts may contain CSS classes: the
+    TEMPLATES DIRS plus our own apps' templates/ and static/ directories.
+    """
+    dirs = []
+    for engine in settings.TEMPLATES:
+        dirs += [Path(path) for path in engine.get('DIRS', [])]
+    for app_dir in _project_app_dirs():
+        dirs += [app_dir / 'templates', app_dir / 'static']
+    return [path for path in dirs if path.is_dir()]
+
+
+def content_files():
+    for directory in content_dirs():
+        for pattern in ('*.html', '*.js'):
+            yield from directory.rglob(pattern)
+
+
+def used_icons():
+    """
+    Returns the Font Awesome classes (fa-*) found in templates and scripts.
+    """
+    icons = set()
+    for path in content_files():
+        icons.update(_ICON_CLASS_RE.findall(path.read_text(encoding='utf-8', errors='ignore')))
+    return icons
+
+
+def _css_blocks(css):
+    """
+    Splits a stylesheet into top-level (prelude, body) pairs; @-rules keep their nested blocks in body.
+    """
+    blocks = []
+    depth = 0
+    start = 0
+    prelude = ''
+    for index, char in enumerate(css):
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:index].strip()
+                start = index + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append((prelude, css[start:index].strip()))
+                start = index + 1
+    return blocks
+
+
+def subset_icon_css(css, icons):
+    """
+    Reduces Font Awesome's stylesheet to the rules the given classes need.
+    Returns (css, codepoints) where codepoints are the glyphs those rules use.
+    A rule is kept when every fa-* class it mentions is in use; the
+    @font-face rules are kept with their URLs pointing at the subset fonts.
+    """
+    kept = []
+    codepoints = set()
+    used = set(icons) | ICON_STYLE_CLASSES
+    for prelude, body in _css_blocks(css):
+        if prelude.startswith('@font-face'):
+            # One subset woff2 per face: drop the ttf fallbacks, then point at the subset
+            body = re.sub(r'src\s*:[^;}]*', lambda match: 'src:' + ','.join(
+                part for part in match.group(0).split(':', 1)[1].split(',') if '.woff2' in part
+            ), body)
+            body = _FONT_URL_RE.sub(lambda match: f'url("{match.group(1)}.woff2")', body)
+        elif prelude.startswith('@'):
+            pass
+        else:
+            selectors = [selector.strip() for selector in prelude.split(',')]
+            selectors = [s for s in selectors if set(_CSS_CLASS_RE.findall(s)) <= used]
+            if not selectors:
+                continue
+            prelude = ','.join(selectors)
+            codepoints.update(int(value, 16) for value in _CONTENT_RE.findall(body))
+        kept.append(f"{prelude}{{{body}}}")
+    return '\n'.join(kept) + '\n', codepoints
+
+
+def subset_font(source, target, codepoints):
+    """
+    Writes a WOFF2 copy of `source` holding only the given glyphs.
+    """
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    font = subset.load_font(str(source), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    subset.save_font(font, str(target), options)
+
+
+def fonts_css():
+    rules = []
+    for face in FONT_FACES:
+        rules.append(
+            f"@font-face{{font-family:'{face.family}';font-style:{face.style};font-weight:{face.weight};"
+            f"font-display:swap;src:url('../{face.package}/{face.file}') format('woff2')}}"
+        )
+    return '\n'.join(rules) + '\n'
+
+
+def fetch_package(name, package, refresh=False):
+    """
+    Unpacks a vendor package's files into vendor/<name>/. Returns False if it was already there.
+    """
+    target = build_dir() / 'vendor' / name
+    if target.exists() and not refresh:
+        return False
+    with urllib.request.urlopen(package.tarball_url, timeout=60) as response:
+        data = response.read()
+    if target.exists():
+        shutil.rmtree(target)
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+        for member in archive.getmembers():
+            # npm tarballs put everything under package/
+            path = member.name.split('/', 1)[-1]
+            if not member.isfile():
+                continue
+            for source, destination in package.files.items():
+                if source.endswith('/') and path.startswith(source):
+                    relative = destination + path[len(source):]
+                elif path == source:
+                    relative = destination
+                else:
+                    continue
+                output = (target / relative).resolve()
+                if target.resolve() not in output.parents:
+                    raise ValueError(f"Unsafe path in {package.npm_name}: {member.name}")
+                output.parent.mkdir(parents=True, exist_ok=True)
+                output.write_bytes(archive.extractfile(member).read())
+    return True
@@ -0,0 +1,134 @@
+# bookstore/db_routers.py
+"""
+Primary/replica routing.
+
+Only views marked with @replica_reads read from the 'replica' alias, and only
+for the books app's models (sessions and auth always use the primary, so a
+fresh login is never lost to replication lag). Everything else, including all
+writes, goes to 'default'.
+
+Read-your-writes:
+- once a request writes, its remaining reads use the primary;
+- any unsafe request (POST, e.g. a payment callback or a review) or a request
+  that wrote sets a short-lived cookie that keeps that client's following
+  requests on the primary for settings.REPLICA_PIN_SECONDS.
+
+Without a 'replica' alias in DATABASES every query goes to 'default'.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+# Apps whose models may be read from the replica
+REPLICA_APPS = {'books'}
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class _RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.use_replica = False
+        self.wrote = False
+
+
+_routing = ContextVar('db_routing', default=None)
+
+
+def replica_is_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def replica_reads(view_func):
+    """
+    Marks a read-only view whose queries may be served by the replica.
+    The mark must be on the resolved view: apply it right below @query_budget
+    and above @login_required.
+    """
+    view_func.use_replica = True
+    return view_func
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is not None
+            and state.use_replica
+            and not state.pinned
+            and not state.wrote
+            and model._meta.app_label in REPLICA_APPS
+            and replica_is_configured()
+            # Reads inside a transaction must see that transaction's writes
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        # Explicit, so objects loaded from the replica are not saved or followed there
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives schema changes through replication
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Sets up the per-request routing state used by PrimaryReplicaRouter and
+    pins clients that just wrote to the primary. Keep it last in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._pin(request, response, state)
+
+    async def __acall__(self, request):
+        state = _RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._pin(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _routing.get()
+        if state is not None and getattr(view_func, 'use_replica', False):
+            state.use_replica = True
+        return None
+
+    def _pin(self, request, response, state):
+        if replica_is_configured() and (state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,230 @@
+# bookstore/instrumentation.py
+"""
+Per-request SQL and template instrumentation.
+
+RequestStatsMiddleware records, for every request:
+- the number of SQL queries and their total time, on every database alias;
+- duplicated queries: the same SQL (ignoring parameter values) run more
+  than once, the usual sign of an N+1 loop;
+- template render time (through InstrumentedDjangoTemplates, the template
+  backend in settings.TEMPLATES; it includes queries run from templates);
+- the response size.
+Request latencies also feed the bookstore_request_duration_seconds
+histogram in bookstore/metrics.py.
+
+The numbers go out as a Server-Timing header (settings.SERVER_TIMING, shown
+in the browser's network panel) and as one JSON log line per request on the
+'bookstore.requests' logger, at WARNING when the view's @query_budget is
+exceeded or a query repeats settings.QUERY_DUPLICATE_WARNING times.
+They are also attached to the response as `response.request_stats`, which
+bookstore/testing.py uses to fail tests that exceed a view's budget.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+logger = logging.getLogger('bookstore.requests')
+
+_current = ContextVar('request_stats', default=None)
+
+# "IN (%s, %s, %s)" and "IN (%s)" are the same query shape
+_PLACEHOLDER_LIST_RE = re.compile(r'(%s\s*,\s*)+%s')
+
+
+def query_budget(max_queries):
+    """
+    Declares the most SQL queries one request to this view may issue.
+    Apply it outermost, above @replica_reads and @login_required.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def fingerprint(sql):
+    # Parameters are passed separately, so the SQL text is already value-free
+    return hashlib.md5(_PLACEHOLDER_LIST_RE.sub('%s', sql).encode()).hexdigest()[:12]
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_name = None
+        self.budget = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.response_size = None
+        self.fingerprints = Counter()
+        # First SQL seen for each fingerprint, for logs and test failures
+        self.statements = {}
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        self.statements.setdefault(key, sql)
+
+    def duplicates(self):
+        return {key: count for key, count in self.fingerprints.most_common() if count > 1}
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+    def as_dict(self):
+        return {
+            'view': self.view_name,
+            'queries': self.queries,
+            'query_budget': self.budget,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+            'response_bytes': self.response_size,
+            'duplicates': [
+                {'fingerprint': key, 'count': count, 'sql': self.statements[key][:300]}
+                for key, count in self.duplicates().items()
+            ],
+        }
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def _install(connection):
+    # First in the list: connection.execute_wrapper() contexts pop the last one
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def _connection_created(sender, connection, **kwargs):
+    _install(connection)
+
+
+def _install_all():
+    # This thread's connections (cheap: they are not opened here)
+    for alias in connections:
+        _install(connections[alias])
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render for RequestStatsMiddleware.
+    """
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class RequestStatsMiddleware:
+    """
+    Collects RequestStats for each request. Keep it first in MIDDLEWARE so
+    the session and auth queries are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # Connections opened from now on, in any thread, report their queries
+        connection_created.connect(_connection_created, dispatch_uid='bookstore.instrumentation')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        _install_all()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        # sync_to_async copies the context, so queries in worker threads are counted too
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Under ASGI this runs in the thread that runs sync views, whose connections may predate the signal
+        _install_all()
+        stats = _current.get()
+        if stats is not None:
+            stats.view_name = f"{view_func.__module__}.{getattr(view_func, '__name__', type(view_func).__name__)}"
+            stats.budget = getattr(view_func, 'query_budget', None)
+        return None
+
+    def _finish(self, request, response, stats):
+        if not response.streaming:
+            stats.response_size = len(response.content)
+        response.request_stats = stats
+        metrics.record_request(request, stats.total_time)
+
+        if getattr(settings, 'SERVER_TIMING', True):
+            duplicated = sum(count - 1 for count in stats.duplicates().values())
+            timings = [
+                f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries, {duplicated} duplicated"',
+                f'tpl;dur={stats.template_time * 1000:.1f};desc="Templates"',
+                f'app;dur={stats.total_time * 1000:.1f};desc="Total"',
+            ]
+            if stats.response_size is not None:
+                timings.append(f'size;desc="{stats.response_size} bytes"')
+            response.headers['Server-Timing'] = ', '.join(timings)
+
+        record = {'method': request.method, 'path': request.path, 'status': response.status_code, **stats.as_dict()}
+        threshold = getattr(settings, 'QUERY_DUPLICATE_WARNING', 5)
+        level = logging.INFO
+        if stats.over_budget or any(count >= threshold for count in stats.fingerprints.values()):
+            level = logging.WARNING
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(record))
+        return response
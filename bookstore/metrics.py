@@ -0,0 +1,136 @@
+# bookstore/metrics.py
+"""
+Prometheus metrics for the bookstore.
+
+The metrics live in prometheus_client's default registry and are served by
+metrics_view (/metrics) in the text exposition format:
+
+- bookstore_request_duration_seconds: request latency per URL name and
+  method (observed by RequestStatsMiddleware, bookstore/instrumentation.py);
+- bookstore_order_transitions_total: orders entering a status, per source
+  (checkout, callback, webhook); paid / pending is the checkout conversion;
+- bookstore_duplicate_purchases_total: second payments for an owned book;
+- bookstore_upload_bytes_total and bookstore_upload_hash_seconds: book
+  uploads checked by BookUploadForm and the time spent hashing them;
+- bookstore_download_bytes_total: book files sent by the download view;
+- bookstore_reader_opens_total: in-app reader page views;
+- bookstore_cache_requests_total: cache lookups per cache and result, so
+  the hit ratio is hit / (hit + miss).
+
+Updating a metric is an in-memory increment. Under gunicorn (several
+processes) set the PROMETHEUS_MULTIPROC_DIR environment variable to an
+empty directory shared by the workers, wiped before each start: every
+process then writes its values to memory-mapped files there and
+/metrics adds them up. Also call child_exit() from gunicorn's child_exit
+hook in gunicorn.conf.py:
+
+    from bookstore.metrics import child_exit
+
+Set settings.METRICS_TOKEN and configure Prometheus to send it as a bearer
+token; without one the endpoint is only served with DEBUG on.
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+
+REQUEST_LATENCY = Histogram(
+    'bookstore_request_duration_seconds',
+    'Time spent handling a request, per URL name.',
+    ['url_name', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ORDER_TRANSITIONS = Counter(
+    'bookstore_order_transitions_total',
+    'Orders entering a status.',
+    ['source', 'status'],
+)
+DUPLICATE_PURCHASES = Counter(
+    'bookstore_duplicate_purchases_total',
+    'Payments for a book the buyer had already paid for (to be refunded).',
+    ['source'],
+)
+UPLOAD_BYTES = Counter(
+    'bookstore_upload_bytes_total',
+    'Bytes of book files received by the upload form.',
+)
+UPLOAD_HASH_SECONDS = Histogram(
+    'bookstore_upload_hash_seconds',
+    'Time spent computing the SHA-256 of an uploaded book file.',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DOWNLOAD_BYTES = Counter(
+    'bookstore_download_bytes_total',
+    'Bytes of book files served by the download view.',
+)
+READER_OPENS = Counter(
+    'bookstore_reader_opens_total',
+    'Books opened in the in-app reader.',
+)
+CACHE_REQUESTS = Counter(
+    'bookstore_cache_requests_total',
+    'Cache lookups per cache and result (hit or miss).',
+    ['cache', 'result'],
+)
+
+# Requests that resolved to no URL pattern share one label value
+UNRESOLVED = '<unresolved>'
+# Any other method is reported as 'other', so clients cannot add label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def record_request(request, duration):
+    method = request.method if request.method in METHODS else 'other'
+    match = getattr(request, 'resolver_match', None)
+    # view_name is 'namespace:name', or the view's dotted path for unnamed patterns
+    url_name = match.view_name if match is not None else UNRESOLVED
+    REQUEST_LATENCY.labels(url_name=url_name, method=method).observe(duration)
+
+
+def record_order_status(source, status):
+    ORDER_TRANSITIONS.labels(source=source, status=status).inc()
+
+
+def record_cache(name, hit):
+    CACHE_REQUESTS.labels(cache=name, result='hit' if hit else 'miss').inc()
+
+
+def child_exit(server, worker):
+    """
+    gunicorn child_exit hook: drops a dead worker's live values in multiprocess mode.
+    """
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def _registry():
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        # A fresh registry per scrape: the collector reads every worker's files
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return settings.DEBUG
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def metrics_view(request):
+    """
+    Serves every metric in the Prometheus text exposition format.
+    """
+    if not _authorized(request):
+        # Do not reveal the endpoint to scrapers without the token
+        raise Http404()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -35,20 +35,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookstore.instrumentation.RequestStatsMiddleware', # First, so every query of the request is counted
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware', # Static files from STATIC_ROOT, precompressed and cached
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookstore.db_routers.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'bookstore.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'bookstore.instrumentation.InstrumentedDjangoTemplates', # DjangoTemplates plus render timing
         'DIRS': [
             os.path.join(BASE_DIR, 'templates')
         ],
@@ -69,12 +72,121 @@ WSGI_APPLICATION = 'bookstore.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE selects the profile: 'sqlite' (default, development) or 'postgres'.
+# With a read replica configured, bookstore/db_routers.py sends the reads of
+# read-only views there and keeps writes (and reads right after them) on the primary.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+# Applied to each SQLite connection when SQLITE_TUNING=1 (see below)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL', # readers no longer block the writer
+    'synchronous': 'NORMAL', # safe with WAL; fsync at checkpoints only
+    'busy_timeout': 5000, # ms to wait for a lock before "database is locked"
+    'cache_size': -65536, # page cache in KiB when negative (64 MB)
+    'mmap_size': 268435456, # 256 MB of memory-mapped reads
+    'temp_store': 'MEMORY', # temp tables and sort spills in memory
+}
+
+if DB_ENGINE == 'postgres':
+    # Local try-out: docker run -e POSTGRES_PASSWORD=bookstore -p 5432:5432 postgres:16
+    _postgres = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'bookstore'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+    if os.environ.get('POSTGRES_POOL', '1') == '1':
+        # psycopg3 connection pool per process; Django requires CONN_MAX_AGE = 0 with it
+        _postgres['CONN_MAX_AGE'] = 0
+        _postgres['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', '10')),
+                'timeout': 10, # seconds to wait for a free connection
+            },
+        }
+    else:
+        # Persistent connections, checked before reuse
+        _postgres['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+        _postgres['CONN_HEALTH_CHECKS'] = True
+
+    DATABASES = {'default': _postgres}
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **_postgres,
+            'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+            'PORT': os.environ.get('POSTGRES_REPLICA_PORT', _postgres['PORT']),
+            # Tests run against the primary only
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    if os.environ.get('SQLITE_REPLICA') == '1':
+        # Second alias on the same file, standing in for a replica to exercise the routing locally
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
+
+    # Opt-in SQLite performance mode (SQLITE_TUNING=1). Without it concurrent
+    # writers hit "database is locked": rollback journal, no busy wait beyond
+    # the 5 s default, and deferred transactions that fail when upgrading to a
+    # write lock. Compare with `manage.py benchmark_sqlite`; keep the files
+    # tidy with `manage.py sqlite_maintenance`.
+    if os.environ.get('SQLITE_TUNING') == '1':
+        for _sqlite in DATABASES.values():
+            _sqlite['OPTIONS'] = {
+                # Run on every new connection
+                'init_command': ';'.join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+                # Take the write lock at BEGIN, so writers queue on busy_timeout instead of failing
+                'transaction_mode': 'IMMEDIATE',
+            }
+
+DATABASE_ROUTERS = ['bookstore.db_routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it wrote something
+# (covers replication lag, e.g. the pages shown right after a payment)
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process; use a shared backend (Redis, Memcached) when
+# running several workers so invalidations reach every process.
+
+# CACHE_BACKEND=file|redis switches backend; CACHE_LOCATION is the directory or Redis URL
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
     }
 }
+if CACHE_BACKEND == 'file':
+    CACHES['default']['LOCATION'] = os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'django_cache'))
+elif CACHE_BACKEND == 'redis':
+    CACHES['default']['LOCATION'] = os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/1')
+
+# Seconds a user's owned/purchased book IDs stay cached (see books/entitlements.py)
+ENTITLEMENTS_CACHE_TIMEOUT = 15 * 60
+
+# Seconds cached catalog pages, book details and their template fragments are
+# kept (see books/catalog_cache.py); saves and deletes invalidate them sooner
+CATALOG_CACHE_TIMEOUT = 10 * 60
 
 
 # Password validation
@@ -112,8 +224,49 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
-# STATICFILES_DIRS = [BASE_DIR / 'static'] # For project-wide static files
-# STATIC_ROOT = BASE_DIR / 'staticfiles_prod' # For production collectstatic
+# Sources of `manage.py build_assets` and its output (Tailwind CSS, vendored pdf.js,
+# Alpine, fonts and icons; see bookstore/assets.py). Run it before collectstatic.
+ASSETS_SOURCE_DIR = BASE_DIR / 'assets'
+ASSETS_BUILD_DIR = ASSETS_SOURCE_DIR / 'build'
+STATICFILES_DIRS = [ASSETS_BUILD_DIR]
+STATIC_ROOT = BASE_DIR / 'staticfiles' # For production collectstatic
+# Path to the Tailwind CLI; by default build_assets downloads the pinned standalone binary
+TAILWIND_CLI = os.environ.get('TAILWIND_CLI') or None
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # Production: collectstatic stores content-hashed names plus .gz/.br siblings, served by
+    # WhiteNoiseMiddleware with immutable cache headers. Hashed names need collectstatic to
+    # have run, so development (and tests) use plain names; STATIC_MANIFEST=1/0 overrides.
+    'staticfiles': {
+        'BACKEND': (
+            'whitenoise.storage.CompressedManifestStaticFilesStorage'
+            if os.environ.get('STATIC_MANIFEST', '0' if DEBUG else '1') == '1'
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+    # Book PDFs, stored under content-addressed names: book_pdfs/ab/cd/<sha256>.pdf
+    # (books/storage.py). BOOK_STORAGE=s3 keeps them in an S3-compatible bucket.
+    'books': {
+        'BACKEND': 'books.storage.ContentAddressedFileSystemStorage',
+    },
+}
+if os.environ.get('BOOK_STORAGE', 'filesystem') == 's3':
+    STORAGES['books'] = {
+        'BACKEND': 'books.storage.ContentAddressedS3Storage',
+        'OPTIONS': {
+            'bucket': os.environ.get('BOOK_STORAGE_BUCKET', 'bookstore-books'),
+            'prefix': os.environ.get('BOOK_STORAGE_PREFIX', ''),
+            # Set for MinIO or another S3-compatible server; unset means AWS
+            'endpoint_url': os.environ.get('BOOK_STORAGE_ENDPOINT_URL') or None,
+            'region_name': os.environ.get('BOOK_STORAGE_REGION') or None,
+            # Unset: boto3's usual credential chain (environment, instance role, ...)
+            'access_key': os.environ.get('BOOK_STORAGE_ACCESS_KEY') or None,
+            'secret_key': os.environ.get('BOOK_STORAGE_SECRET_KEY') or None,
+        },
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -123,6 +276,65 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# How books/streaming.py hands PDF bytes to clients:
+#   None               - Django streams the file itself (development)
+#   'x-sendfile'       - Apache mod_xsendfile / lighttpd send book.file.path (Django streams
+#                        the file itself when the book storage has no local paths)
+#   'x-accel-redirect' - nginx serves BOOK_FILE_ACCEL_PREFIX + file name from an internal location
+#                        (with BOOK_STORAGE=s3, an internal location proxying to the bucket)
+BOOK_FILE_OFFLOAD = os.environ.get('BOOK_FILE_OFFLOAD') or None
+BOOK_FILE_ACCEL_PREFIX = '/protected-media/'
+
+# Upload pipeline (books/uploads.py, books/processing.py)
+# Uploads are streamed here and hashed on the way in. Keep it on the same
+# filesystem as MEDIA_ROOT so the final move is a rename, and outside MEDIA_ROOT
+# so staged files are never publicly served.
+BOOK_UPLOAD_STAGING_DIR = BASE_DIR / 'upload_staging'
+# Run processing jobs in-process after the upload commits instead of via
+# `manage.py process_upload_jobs` (handy for development)
+BOOK_PROCESSING_EAGER = os.environ.get('BOOK_PROCESSING_EAGER', '') == '1'
+BOOK_PROCESSING_MAX_ATTEMPTS = 3
+# Seconds before the first retry of a failed attempt; doubled for each further attempt
+BOOK_PROCESSING_RETRY_DELAY = 30
+# A 'running' job older than this (seconds) lost its worker and is claimed again.
+# Keep it well above the longest pipeline run
+BOOK_PROCESSING_STALE_AFTER = 30 * 60
+
+# Server-rendered reader mode: pages are rasterised once (books/page_cache.py)
+# and served as images, so the reader never downloads the whole PDF.
+# ?render=server / ?render=client on the reader URL overrides the default.
+READER_SERVER_RENDER = os.environ.get('READER_SERVER_RENDER', '') == '1'
+# With BOOK_STORAGE=s3 it also holds one local copy of each rendered book's PDF
+READER_PAGE_CACHE_DIR = BASE_DIR / 'page_cache'
+READER_PAGE_DPI_LEVELS = (72, 110, 150)
+READER_PREFETCH_PAGES = 2
+# Pages rendered by the upload pipeline, ahead of the first open
+READER_PRERENDER_PAGES = 3
+
+# Reading progress (books/reading.py): readers report their page every
+# REPORT_INTERVAL seconds into a cache-side buffer, which is upserted into the
+# database at most every FLUSH_INTERVAL seconds, BATCH rows per statement.
+# Set READING_PROGRESS_INLINE_FLUSH=0 when `manage.py flush_reading_progress` runs as a worker.
+READING_PROGRESS_REPORT_INTERVAL = 5
+READING_PROGRESS_FLUSH_INTERVAL = 10
+READING_PROGRESS_FLUSH_BATCH = 1000
+READING_PROGRESS_INLINE_FLUSH = os.environ.get('READING_PROGRESS_INLINE_FLUSH', '1') == '1'
+READING_PROGRESS_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+# Number of books per catalog page (keyset paginated, see books/pagination.py)
+BOOK_LIST_PAGE_SIZE = 24
+
+# Number of results per catalog search page (see books/search.py)
+BOOK_SEARCH_PAGE_SIZE = 20
+
+# Reviews per page on the book detail page and its "load more" feed (see books/pagination.py)
+REVIEW_PAGE_SIZE = 10
+
+# Seller dashboard: orders per page, and days shown in the earnings chart (see books/analytics.py)
+DASHBOARD_ORDERS_PAGE_SIZE = 25
+DASHBOARD_CHART_DAYS = 30
+
 
 LOGIN_URL = 'accounts:login' # Assuming 'accounts' is your app namespace and 'login' is the URL name
 LOGIN_REDIRECT_URL = '/'    # Redirect to homepage after login
@@ -131,4 +343,49 @@ LOGOUT_REDIRECT_URL = '/'   # Redirect to homepage after logout
 
 # Razorpay Settings
 RAZORPAY_KEY_ID = 'rzp_test_5M3sYFU5D6IxAE' # Get from Razorpay dashboard
-RAZORPAY_KEY_SECRET = 'd4Jgqz9STSJj1rvBluLo4gh7' # Get from Razorpay dashboard
\ No newline at end of file
+RAZORPAY_KEY_SECRET = 'd4Jgqz9STSJj1rvBluLo4gh7' # Get from Razorpay dashboard
+# Orders API used by books/payments.py; point at `manage.py run_fake_gateway` for offline load tests
+RAZORPAY_API_BASE = os.environ.get('RAZORPAY_API_BASE', 'https://api.razorpay.com/v1')
+
+# Payment gateway client (books/payments.py)
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = 3.05 # seconds
+PAYMENT_GATEWAY_READ_TIMEOUT = 10 # seconds
+PAYMENT_GATEWAY_MAX_RETRIES = 2 # retries after the first attempt
+PAYMENT_GATEWAY_BACKOFF = 0.5 # first retry delay in seconds, doubled each retry
+PAYMENT_GATEWAY_POOL_SIZE = 20 # pooled keep-alive connections per process
+PAYMENT_GATEWAY_FAILURE_THRESHOLD = 5 # consecutive failures before the circuit opens
+PAYMENT_GATEWAY_RESET_TIMEOUT = 30 # seconds before a trial call is let through
+# Secret configured for the webhook in the Razorpay dashboard (books:payment_webhook);
+# webhooks are rejected while it is empty
+RAZORPAY_WEBHOOK_SECRET = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+
+
+
+# Request instrumentation (bookstore/instrumentation.py)
+# Server-Timing header with SQL/template time and query counts on every response
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+# Log a request at WARNING when one query shape runs this many times (N+1)
+QUERY_DUPLICATE_WARNING = 5
+
+# Prometheus metrics (bookstore/metrics.py), served at /metrics to requests with
+# "Authorization: Bearer <METRICS_TOKEN>"; without a token only when DEBUG is on.
+# Under gunicorn also set PROMETHEUS_MULTIPROC_DIR to a directory shared by the workers.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # JSON lines for budget overruns and N+1s; REQUEST_LOG_LEVEL=INFO logs every request
+        'bookstore.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
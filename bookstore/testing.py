@@ -0,0 +1,29 @@
+# bookstore/testing.py
+"""
+Test helpers built on bookstore/instrumentation.py.
+"""
+
+
+class QueryBudgetMixin:
+    """
+    Mix into a django.test.TestCase. assertWithinQueryBudget(response) fails
+    when the request behind `response` ran more SQL queries than its view
+    declares with @query_budget, and lists the queries that repeated.
+    """
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        stats = getattr(response, 'request_stats', None)
+        if stats is None:
+            self.fail("The response has no request_stats; is RequestStatsMiddleware in MIDDLEWARE?")
+        budget = stats.budget if budget is None else budget
+        if budget is None:
+            self.fail(f"{stats.view_name} declares no @query_budget.")
+        if stats.queries > budget:
+            repeated = '\n'.join(
+                f"  {count}x {stats.statements[key][:200]}" for key, count in stats.duplicates().items()
+            ) or "  (none)"
+            self.fail(
+                f"{stats.view_name} ran {stats.queries} queries, over its budget of {budget}.\n"
+                f"Repeated queries:\n{repeated}"
+            )
+        return stats
@@ -23,6 +23,7 @@ from django.conf.urls.static import static
 
 # Import the new home_redirect_view from your books app's views
 from books.views import home_redirect_view # Assuming it's in books/views.py
+from bookstore.metrics import metrics_view # Prometheus scrape endpoint
 
 
 urlpatterns = [
@@ -32,6 +33,7 @@ urlpatterns = [
     # Keep the include for books.urls, but it will now handle paths other than the root
     path('books/', include('books.urls')), # Changed to 'books/' to avoid conflict with root
     path('accounts/', include('accounts.urls')), # Add this
+    path('metrics', metrics_view, name='metrics'), # Prometheus text format; see bookstore/metrics.py
 ]
 
 # Serve media files during development